@@ -0,0 +1,345 @@
+"""Load and latency benchmarks for Services A, B and C.
+
+All three Flask apps run in this process on ephemeral ports, against a
+synthetic recipe corpus and a throwaway user DB, with Service C on the
+mock LLM backend. No network access or API keys are needed. Each endpoint
+is driven at the given concurrency and reported as JSON (p50/p95/p99
+latency and throughput), so runs can be compared across commits:
+
+    python benchmarks/run_benchmarks.py --recipes 5000 --concurrency 8 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import requests
+from werkzeug.serving import make_server
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT_DIR)
+for service_dir in ('service_a_auth', 'service_b_data', 'service_c_llm'):
+    sys.path.append(os.path.join(ROOT_DIR, service_dir))
+
+from synthetic_corpus import ALLERGEN_PROFILES, MESSAGES, QUERIES, write_csv
+
+ENDPOINTS = ("filter_recipes", "login", "profile", "generate")
+PASSWORD = "benchmark-password"
+
+
+# --- 1. STATISTICS ---
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarise(latencies, errors, elapsed, concurrency, first_tokens=()):
+    """JSON-ready summary; latencies are in seconds, reported in ms."""
+    def ms(values, p):
+        value = percentile(values, p)
+        return round(value * 1000, 2) if value is not None else None
+
+    latencies, first_tokens = sorted(latencies), sorted(first_tokens)
+    summary = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+        "p50_ms": ms(latencies, 50),
+        "p95_ms": ms(latencies, 95),
+        "p99_ms": ms(latencies, 99),
+        "max_ms": ms(latencies, 100),
+    }
+    if first_tokens:
+        summary.update({"first_token_p50_ms": ms(first_tokens, 50), "first_token_p95_ms": ms(first_tokens, 95),
+                        "first_token_p99_ms": ms(first_tokens, 99)})
+    return summary
+
+
+# --- 2. LOAD DRIVER ---
+def run_load(send, total, concurrency, warmup=0):
+    """Call send(session, i) total times from `concurrency` threads.
+
+    send raises (or returns False) on failure, and may return the time to
+    first token in seconds. The first `warmup` calls are not measured.
+    """
+    with requests.Session() as session:
+        for i in range(warmup):
+            send(session, -1 - i)
+
+    lock = threading.Lock()
+    latencies, first_tokens = [], []
+    counter = iter(range(total))
+    errors = 0
+
+    def worker():
+        nonlocal errors
+        with requests.Session() as session:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    result = send(session, i)
+                    ok = result is not False
+                except Exception:
+                    result, ok = None, False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if not ok:
+                        errors += 1
+                        continue
+                    latencies.append(elapsed)
+                    if isinstance(result, float):
+                        first_tokens.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarise(latencies, errors, time.perf_counter() - started, concurrency, first_tokens)
+
+
+# --- 3. SERVICES ---
+def serve(app, stack):
+    """Run a Flask app on an ephemeral port until stack closes; returns its base URL."""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stack.callback(server.shutdown)
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_services(args, work_dir, stack):
+    """Build the corpus and user DB, point the services at them and start them.
+
+    Module globals are patched through stack, so closing it puts the
+    services back as they were.
+    """
+    def patch(module, **values):
+        for name, value in values.items():
+            stack.enter_context(mock.patch.object(module, name, value))
+
+    # Read by Service C at import time to size its Service B connection pool
+    os.environ.setdefault("GUNICORN_THREADS", str(args.concurrency))
+
+    import setup_db
+    import setup_secure_db
+    from llm_backends import load_models
+    from llm_scheduler import LLMScheduler
+    from password_hasher import PasswordHasher
+    from profile_cache import GenerationTable, ProfileCache
+    from ttl_cache import TTLCache
+    from service_a_auth import app as service_a
+    from service_b_data import app as service_b
+    from service_c_llm import app as service_c
+
+    timings = {}
+
+    # Service B: synthetic recipes through the real build
+    started = time.perf_counter()
+    recipe_db = os.path.join(work_dir, 'RecipeCorpus.db')
+    csv_file = write_csv(os.path.join(work_dir, 'recipes.csv'), args.recipes, args.seed)
+    setup_db.create_database(db_file=recipe_db, source=csv_file, vectors=args.vectors)
+    patch(service_b, DB_FILE=recipe_db)
+    timings["build_corpus"] = round(time.perf_counter() - started, 3)
+
+    # Service A: users share one password hash, so setup stays fast at any cost factor
+    started = time.perf_counter()
+    user_db = os.path.join(work_dir, 'SecureUserProfile.db')
+    patch(setup_secure_db, DB_FILE=user_db)
+    setup_secure_db.create_secure_db()
+    generations = GenerationTable(user_db + '.generations')
+    stack.callback(generations.close)
+    patch(service_a, DB_FILE=user_db, MAIL_SENDER_AUTOSTART=False,
+          hasher=PasswordHasher(rounds=args.bcrypt_rounds, workers=service_a.hasher.workers,
+                                max_pending=service_a.hasher.max_pending, timeout=service_a.hasher.timeout),
+          profile_cache=ProfileCache(generations))
+    pw_hash = service_a.hasher.hash(PASSWORD)
+    rng = random.Random(args.seed)
+    con = sqlite3.connect(user_db)
+    with con:
+        for i in range(args.users):
+            username = f"user{i}"
+            con.execute("INSERT INTO users (username, email, password_hash, salt) VALUES (?, ?, ?, ?)",
+                        (username, f"{username}@bench.local", pw_hash, pw_hash[:29]))
+            con.execute("INSERT INTO preferences VALUES (?, ?, ?, ?, ?)",
+                        (username, ",".join(rng.choice(ALLERGEN_PROFILES)), rng.choice([600, 900, 2000]), "Any", 60))
+    con.close()
+    timings["create_users"] = round(time.perf_counter() - started, 3)
+
+    # Service C: mock models, no rate limit unless asked for, fresh caches
+    b_url = serve(service_b.app, stack)
+    fast_model, smart_model = load_models("mock", tokens_per_second=args.tokens_per_second,
+                                          first_token_latency=args.first_token_latency)
+    patch(service_c, SERVICE_B_URL=f"{b_url}/filter_recipes", SERVICE_B_RECIPE_URL=f"{b_url}/recipes",
+          fast_model=fast_model, smart_model=smart_model, models_ready=True,
+          llm_scheduler=LLMScheduler(rate_per_minute=args.llm_rate, burst=max(args.concurrency, 1)),
+          SEARCH_MODE=args.search_mode, ANSWER_CACHE_ENABLED=args.answer_cache,
+          keyword_cache=TTLCache("keywords"), answer_cache=TTLCache("answers"))
+
+    return {"a": serve(service_a.app, stack), "b": b_url, "c": serve(service_c.app, stack)}, timings
+
+
+# --- 4. SCENARIOS ---
+def scenarios(urls, args):
+    """endpoint -> send(session, i), each picking its inputs from i deterministically."""
+    def user(i):
+        return f"user{i % args.users}"
+
+    def pick(options, i):
+        return options[random.Random(args.seed * 1000003 + i).randrange(len(options))]
+
+    def filter_recipes(session, i):
+        payload = {"query": pick(QUERIES, i), "allergens": pick(ALLERGEN_PROFILES, i),
+                   "max_calories": pick([600, 900, 2000], i), "mode": args.search_mode,
+                   "fields": ["id", "name", "calories", "protein_g", "ingredients"], "max_chars": 160}
+        return session.post(f"{urls['b']}/filter_recipes", json=payload, timeout=30).ok
+
+    def login(session, i):
+        return session.post(f"{urls['a']}/login", json={"username": user(i), "password": PASSWORD}, timeout=30).ok
+
+    def profile(session, i):
+        return session.get(f"{urls['a']}/profile/{user(i)}", timeout=30).ok
+
+    def generate(session, i):
+        payload = {"message": pick(MESSAGES, i), "history": [],
+                   "profile": {"allergens": pick(ALLERGEN_PROFILES, i), "calorie_limit": pick([600, 900, 2000], i)}}
+        started = time.perf_counter()
+        first_token = None
+        with session.post(f"{urls['c']}/generate", json=payload, stream=True, timeout=120) as response:
+            if not response.ok:
+                return False
+            for line in response.iter_lines():
+                text = json.loads(line).get("text", "") if line else ""
+                if "Error" in text[:20]:
+                    return False
+                if text and first_token is None:
+                    first_token = time.perf_counter() - started
+        return first_token if first_token is not None else False
+
+    return {"filter_recipes": filter_recipes, "login": login, "profile": profile, "generate": generate}
+
+
+# --- 5. REPORT ---
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def collect_metrics(urls):
+    metrics = {}
+    for name, url in (("service_a", urls['a']), ("service_b", urls['b']), ("service_c", urls['c'])):
+        try:
+            metrics[name] = requests.get(f"{url}/metrics", timeout=10).json()
+        except Exception as e:
+            metrics[name] = {"error": str(e)}
+    return metrics
+
+
+def compare(baseline, current):
+    """Lines showing how each endpoint moved against a previous report."""
+    lines = []
+    for endpoint, result in current["results"].items():
+        before = baseline.get("results", {}).get(endpoint)
+        if not before:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            old, new = before.get(key), result.get(key)
+            if old and new is not None:
+                parts.append(f"{key} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        lines.append(f"{endpoint}: " + ", ".join(parts))
+    return lines
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as work_dir, contextlib.ExitStack() as stack:
+        # The services print a line per request; keep them out of the report
+        with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+            urls, timings = start_services(args, work_dir, stack)
+            sends = scenarios(urls, args)
+            results = {}
+            for endpoint in args.endpoints:
+                print(f"Benchmarking {endpoint}...", file=sys.stderr)
+                results[endpoint] = run_load(sends[endpoint], args.requests, args.concurrency, args.warmup)
+            metrics = collect_metrics(urls)
+
+    meta = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "setup_seconds": timings,
+    }
+    meta.update({k: v for k, v in vars(args).items() if k not in ("output", "compare")})
+    return {"meta": meta, "results": results, "metrics": metrics}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--recipes", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=list(ENDPOINTS),
+                        help="comma-separated subset of " + ",".join(ENDPOINTS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.environ.get("BCRYPT_ROUNDS", 12)))
+    parser.add_argument("--search-mode", default="ranked", choices=("lexical", "ranked", "semantic", "hybrid"))
+    parser.add_argument("--vectors", action="store_true", help="build the vector index (semantic/hybrid)")
+    parser.add_argument("--answer-cache", action="store_true", help="enable Service C's answer cache")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="mock model stream rate (0 = no delay)")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="mock model seconds before the first token")
+    parser.add_argument("--llm-rate", type=float, default=0, help="Service C LLM calls per minute (0 = unlimited)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    report = run(args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), report):
+                print(line, file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    main()
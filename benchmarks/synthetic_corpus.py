@@ -0,0 +1,44 @@
+"""Synthetic recipes and requests, so benchmarks run offline."""
+import random
+
+import pandas as pd
+
+PROTEINS = ["chicken", "beef", "pork", "salmon", "tuna", "shrimp", "tofu", "tempeh", "lentils",
+            "chickpeas", "eggs", "turkey", "cod", "beans", "lamb"]
+VEGETABLES = ["spinach", "broccoli", "carrot", "zucchini", "tomato", "onion", "garlic", "mushroom",
+              "pepper", "cauliflower", "kale", "potato", "sweet potato", "peas", "cabbage", "avocado"]
+STAPLES = ["rice", "pasta", "quinoa", "noodles", "bread", "couscous", "tortilla", "flour", "oats"]
+EXTRAS = ["olive oil", "butter", "cheese", "cream", "soy sauce", "peanut butter", "almond", "honey",
+          "coconut milk", "yogurt", "sesame oil", "lemon", "ginger", "cumin", "basil", "salt"]
+STYLES = ["Roasted", "Grilled", "Spicy", "Creamy", "Quick", "Baked", "Stir Fried", "Braised",
+          "Lemon", "Garlic", "Smoky", "Herbed", "Crispy", "Slow Cooked"]
+DISHES = ["Bowl", "Stew", "Salad", "Curry", "Skillet", "Soup", "Tacos", "Casserole", "Wrap", "Bake"]
+UNITS = ["1 cup", "2 cups", "1 tbsp", "2 tbsp", "1 tsp", "200g", "300g", "1", "2", "a pinch of"]
+
+# Messages for /generate and queries for /filter_recipes
+MESSAGES = ["high protein dinner", "something with chicken and rice", "quick vegan lunch",
+            "low carb salmon", "comfort food with potato", "spicy tofu noodles", "healthy breakfast",
+            "italian pasta", "a light soup", "beef stew for winter"]
+QUERIES = ['"chicken"', '"salmon" OR "rice"', '"tofu"', '"pasta" OR "tomato"', '"beans"',
+           '"spinach" OR "eggs"', '"curry"', '"potato"', "", '"noodles" OR "ginger"']
+ALLERGEN_PROFILES = [[], ["peanuts"], ["milk", "eggs"], ["gluten"], ["shellfish", "fish"], ["soy"]]
+
+
+def make_recipes(n, seed=0):
+    """n (title, ingredients, instructions) rows shaped like 13k-recipes.csv."""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        protein, veg = rng.choice(PROTEINS), rng.choice(VEGETABLES)
+        title = f"{rng.choice(STYLES)} {protein.title()} {rng.choice(DISHES)} with {veg.title()}"
+        items = [protein, veg, rng.choice(STAPLES)] + rng.sample(VEGETABLES, 2) + rng.sample(EXTRAS, 3)
+        ingredients = str([f"{rng.choice(UNITS)} {item}" for item in items])
+        instructions = " ".join(f"Add the {item} and cook for {rng.randint(2, 20)} minutes." for item in items)
+        rows.append((title, ingredients, instructions))
+    return rows
+
+
+def write_csv(path, n, seed=0):
+    pd.DataFrame(make_recipes(n, seed), columns=['Title', 'Ingredients', 'Instructions']).to_csv(path, index=False)
+    return path
+
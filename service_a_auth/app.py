@@ -1,12 +1,15 @@
+import atexit
 import sqlite3
 import os
-import bcrypt
 import random
 import string
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_mail import Mail, Message
 from dotenv import load_dotenv
+from sqlite_pool import get_pool
+from password_hasher import PasswordHasher, HasherBusy
+from profile_cache import GenerationTable, ProfileCache
+from mail_outbox import MailSender, enqueue, backlog, smtp_connector
 
 # Load environment variables from the root .env file
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
@@ -17,19 +20,96 @@ CORS(app)
 DB_FILE = os.path.join(os.path.dirname(__file__), 'SecureUserProfile.db')
 
 # Email Configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 465
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 465))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '0') == '1'
+app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL', '1') == '1'
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 
-mail = Mail(app)
+# Mail goes through the outbox table: requests only insert a row, and a
+# background thread per worker sends it, reusing one SMTP connection per burst.
+mail_sender = MailSender(
+    DB_FILE,
+    smtp_connector(app.config['MAIL_SERVER'], app.config['MAIL_PORT'],
+                   use_ssl=app.config['MAIL_USE_SSL'], use_tls=app.config['MAIL_USE_TLS'],
+                   username=app.config['MAIL_USERNAME'], password=app.config['MAIL_PASSWORD']),
+    sender=app.config['MAIL_USERNAME'] or 'no-reply@safeplate.local',
+    batch_size=int(os.environ.get('MAIL_BATCH_SIZE', 20)),
+    max_attempts=int(os.environ.get('MAIL_MAX_ATTEMPTS', 6)),
+)
+# Start sending as soon as a worker serves anything, so mail queued before a
+# restart goes out without waiting for the next /forgot-password
+MAIL_SENDER_AUTOSTART = os.environ.get('MAIL_SENDER_AUTOSTART', '1') == '1'
+
+@app.before_request
+def start_mail_sender():
+    if MAIL_SENDER_AUTOSTART:
+        mail_sender.start()
+
+# bcrypt runs on its own process pool (per gunicorn worker). BCRYPT_ROUNDS can
+# be raised at any time: older hashes are upgraded on the user's next login.
+hasher = PasswordHasher(
+    rounds=int(os.environ.get('BCRYPT_ROUNDS', 12)),
+    workers=int(os.environ.get('HASH_WORKERS', 2)),
+    max_pending=int(os.environ.get('HASH_MAX_PENDING', 32)),
+    timeout=float(os.environ.get('HASH_TIMEOUT', 10)),
+)
 
 def get_db():
-    con = sqlite3.connect(DB_FILE)
-    con.row_factory = sqlite3.Row
-    return con
+    # Per-thread connection reused across requests (WAL, warm page cache)
+    return get_pool(DB_FILE, row_factory=sqlite3.Row).connection()
+
+@app.teardown_request
+def reset_db(exc):
+    # Never hand a half-finished transaction to the next request on this thread
+    get_pool(DB_FILE, row_factory=sqlite3.Row).reset()
+
+# Preferences are read on every chat turn but rarely change: serve them from
+# memory. The generation table lets every worker see another worker's writes;
+# its file is only opened once a profile is looked up.
+PROFILE_GENERATIONS_FILE = os.environ.get('PROFILE_GENERATIONS_FILE', DB_FILE + '.generations')
+profile_cache = ProfileCache(
+    GenerationTable(PROFILE_GENERATIONS_FILE),
+    max_size=int(os.environ.get('PROFILE_CACHE_SIZE', 10000)),
+)
+
+@atexit.register
+def close_profile_cache():
+    profile_cache.generations.close()
+
+# Upper bound on usernames per /profiles call
+MAX_BULK_PROFILES = 500
+
+def load_profiles(usernames):
+    """Preference rows for usernames, from the cache where current, else one SELECT.
+
+    Returns {username: (profile, etag)} for the users that exist.
+    """
+    found, missing = {}, {}
+    for username in usernames:
+        # Read the generation before the row, so a concurrent write can only
+        # make us reload too often, never cache a stale row as current
+        generation = profile_cache.generations.get(username)
+        entry = profile_cache.get(username, generation)
+        if entry:
+            found[username] = entry
+        else:
+            missing[username] = generation
+
+    if missing:
+        placeholders = ",".join("?" * len(missing))
+        rows = get_db().execute(f"SELECT * FROM preferences WHERE username IN ({placeholders})", list(missing))
+        for row in rows:
+            found[row['username']] = profile_cache.put(row['username'], missing[row['username']], dict(row))
+    return found
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    # Shed credential work fast rather than queueing it behind everything else
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -41,8 +121,8 @@ def register():
     if not all([username, email, password]):
         return jsonify({"error": "Missing fields"}), 400
         
-    salt = bcrypt.gensalt()
-    pw_hash = bcrypt.hashpw(password.encode(), salt)
+    pw_hash = hasher.hash(password)
+    salt = pw_hash[:29]  # bcrypt keeps the salt in the hash; stored for reference
     
     try:
         con = get_db()
@@ -50,7 +130,6 @@ def register():
                    (username, email, pw_hash, salt))
         con.execute("INSERT INTO preferences VALUES (?, ?, ?, ?, ?)", (username, "", 2000, "Any", 60))
         con.commit()
-        con.close()
         return jsonify({"message": "Account created successfully"}), 201
     except sqlite3.IntegrityError:
         return jsonify({"error": "Username already exists"}), 409
@@ -63,9 +142,13 @@ def login():
     
     con = get_db()
     user = con.execute("SELECT * FROM users WHERE username=?", (username,)).fetchone()
-    con.close()
     
-    if user and bcrypt.checkpw(password.encode(), user['password_hash']):
+    if user and hasher.verify(password, user['password_hash']):
+        new_hash = hasher.rehash_if_needed(password, user['password_hash'])
+        if new_hash:
+            con.execute("UPDATE users SET password_hash=?, salt=? WHERE username=?",
+                        (new_hash, new_hash[:29], username))
+            con.commit()
         return jsonify({"message": "Login successful", "username": username}), 200
     
     return jsonify({"error": "Invalid credentials"}), 401
@@ -79,29 +162,19 @@ def forgot_password():
     user = con.execute("SELECT username FROM users WHERE email=?", (email,)).fetchone()
     
     if not user:
-        con.close()
         return jsonify({"error": "Email not found"}), 404
     
     code = ''.join(random.choices(string.digits, k=6))
     
+    # Token and email commit together: the mail can't go out for a code
+    # that wasn't saved, or be lost after the code was
     con.execute("UPDATE users SET reset_token=? WHERE email=?", (code, email))
+    enqueue(con, email, "Password Reset Request",
+            f"Your password reset code is: {code}\n\nThis code expires in 15 minutes.")
     con.commit()
-    con.close()
-    
-    try:
-        msg = Message(
-            subject="Password Reset Request", 
-            sender=app.config['MAIL_USERNAME'], 
-            recipients=[email]
-        )
-        msg.body = f"Your password reset code is: {code}\n\nThis code expires in 15 minutes."
-        
-        mail.send(msg)
-        return jsonify({"message": "Reset code sent to email."})
-        
-    except Exception as e:
-        print(f"Mail Error: {e}")
-        return jsonify({"error": "Failed to send email. Check server logs."}), 500
+    mail_sender.wake()
+
+    return jsonify({"message": "Reset code sent to email."}), 202
 
 @app.route('/reset-password', methods=['POST'])
 def reset_password():
@@ -111,38 +184,64 @@ def reset_password():
     new_password = data.get('new_password')
     
     con = get_db()
-    user = con.execute("SELECT reset_token, salt FROM users WHERE email=?", (email,)).fetchone()
+    user = con.execute("SELECT reset_token FROM users WHERE email=?", (email,)).fetchone()
     
     if not user or str(user['reset_token']) != str(code):
-        con.close()
         return jsonify({"error": "Invalid reset code"}), 401
         
-    new_hash = bcrypt.hashpw(new_password.encode(), user['salt'])
-    con.execute("UPDATE users SET password_hash=?, reset_token=NULL WHERE email=?", (new_hash, email))
+    new_hash = hasher.hash(new_password)
+    con.execute("UPDATE users SET password_hash=?, salt=?, reset_token=NULL WHERE email=?",
+                (new_hash, new_hash[:29], email))
     con.commit()
-    con.close()
     
     return jsonify({"message": "Password reset successful"})
 
 @app.route('/profile/<username>', methods=['GET', 'POST'])
 def profile(username):
-    con = get_db()
     if request.method == 'GET':
-        row = con.execute("SELECT * FROM preferences WHERE username=?", (username,)).fetchone()
-        con.close()
-        if row: return jsonify(dict(row))
-        return jsonify({"error": "User not found"}), 404
+        entry = load_profiles([username]).get(username)
+        if not entry:
+            return jsonify({"error": "User not found"}), 404
+        # ETag lets clients revalidate with If-None-Match and get a bodiless 304
+        response = jsonify(entry[0])
+        response.set_etag(entry[1])
+        return response.make_conditional(request)
         
     if request.method == 'POST':
         data = request.get_json()
+        con = get_db()
         con.execute("""
             UPDATE preferences 
             SET allergens=?, calorie_limit=?, cuisine_pref=?, cooking_time=? 
             WHERE username=?
         """, (data['allergens'], data['calorie_limit'], data['cuisine_pref'], data['cooking_time'], username))
         con.commit()
-        con.close()
+        # Write-through: invalidate everywhere, then cache the row as stored
+        profile_cache.generations.bump(username)
+        load_profiles([username])
         return jsonify({"message": "Profile updated successfully"})
 
+@app.route('/profiles', methods=['POST'])
+def profiles():
+    """Bulk lookup for batch jobs: {"usernames": [...]} -> {"profiles": {...}, "missing": [...]}."""
+    usernames = (request.get_json() or {}).get('usernames', [])
+    if not isinstance(usernames, list) or not all(isinstance(u, str) for u in usernames):
+        return jsonify({"error": "'usernames' must be a list of strings"}), 400
+    if len(usernames) > MAX_BULK_PROFILES:
+        return jsonify({"error": f"Too many usernames (max {MAX_BULK_PROFILES})"}), 413
+
+    usernames = list(dict.fromkeys(usernames))
+    found = load_profiles(usernames)
+    return jsonify({
+        "profiles": {u: found[u][0] for u in usernames if u in found},
+        "missing": [u for u in usernames if u not in found],
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    outbox = dict(mail_sender.stats(), **backlog(get_db(), mail_sender.max_attempts))
+    return jsonify({"password_hasher": hasher.stats(), "profile_cache": profile_cache.stats(),
+                    "mail_outbox": outbox})
+
 if __name__ == '__main__':
     app.run(port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,231 @@
+import os
+import smtplib
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+from sqlite_pool import get_pool
+
+# How long a claimed batch stays reserved for the sender that claimed it. If
+# that process dies mid-batch, the rows become due again once this passes.
+CLAIM_LEASE = 120
+
+
+def enqueue(con, recipient, subject, body):
+    """Add a message to the outbox. The caller commits, so the message is
+    stored in the same transaction as whatever it announces."""
+    now = time.time()
+    con.execute("INSERT INTO outbox (recipient, subject, body, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?)",
+                (recipient, subject, body, now, now))
+
+
+def backlog(con, max_attempts):
+    """Messages still waiting to go out, and those given up on."""
+    pending, dead = con.execute("""
+        SELECT COALESCE(SUM(attempts < ?), 0), COALESCE(SUM(attempts >= ?), 0)
+        FROM outbox WHERE sent_at IS NULL
+    """, (max_attempts, max_attempts)).fetchone()
+    return {"pending": pending, "dead": dead}
+
+
+def is_connection_error(e):
+    """True for failures of the SMTP session rather than of one message."""
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                      smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError)):
+        return True
+    # smtplib's own errors subclass OSError too; the rest are socket-level
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def smtp_connector(host, port, use_ssl=False, use_tls=False, username=None, password=None, timeout=10):
+    """Return a function that opens an authenticated SMTP connection."""
+    def connect():
+        if use_ssl:
+            smtp = smtplib.SMTP_SSL(host, port, timeout=timeout)
+        else:
+            smtp = smtplib.SMTP(host, port, timeout=timeout)
+            if use_tls:
+                smtp.starttls()
+        if username:
+            smtp.login(username, password)
+        return smtp
+    return connect
+
+
+class MailSender:
+    """Background thread that drains the outbox table.
+
+    Due messages are claimed in batches and sent over one SMTP connection,
+    which stays open while there is more to send. A message that fails is
+    retried with exponential backoff until max_attempts; if the server can't
+    be reached at all, the batch is handed back untouched and tried again on
+    the next poll, so an outage delays mail without using up attempts.
+    Delivery is at-least-once: a crash between sending and recording the
+    send means that message goes out again.
+    """
+
+    def __init__(self, db_file, connect, sender, batch_size=20, max_attempts=6,
+                 poll_interval=5.0, backoff_base=30.0, backoff_max=3600.0):
+        self.db_file = db_file
+        self.connect = connect
+        self.sender = sender
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+        self.connections = 0
+        self.connect_errors = 0
+        self.batches = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    # --- 1. THREAD ---
+    def start(self):
+        # Started lazily, and again after a fork, so each gunicorn worker runs one
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def wake(self):
+        """Start the sender if needed and have it look at the outbox now."""
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stop the thread once its current batch is done."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        self._wake.set()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"Mail outbox error: {e}")
+
+    # --- 2. OUTBOX ROWS ---
+    def _db(self):
+        # Plain tuples: a pool of its own, apart from the app's sqlite3.Row one
+        return get_pool(self.db_file).connection()
+
+    def _claim(self):
+        con = self._db()
+        claim, now = uuid.uuid4().hex, time.time()
+        con.execute("""
+            UPDATE outbox SET claim=?, next_attempt_at=?
+            WHERE id IN (SELECT id FROM outbox
+                         WHERE sent_at IS NULL AND attempts < ? AND next_attempt_at <= ?
+                         ORDER BY next_attempt_at LIMIT ?)
+        """, (claim, now + CLAIM_LEASE, self.max_attempts, now, self.batch_size))
+        con.commit()
+        return con.execute("SELECT id, recipient, subject, body FROM outbox WHERE claim=? ORDER BY id",
+                           (claim,)).fetchall()
+
+    def _mark_sent(self, message_id):
+        con = self._db()
+        con.execute("UPDATE outbox SET sent_at=?, claim=NULL WHERE id=?", (time.time(), message_id))
+        con.commit()
+        with self._lock:
+            self.sent += 1
+
+    def _mark_failed(self, message_id, error):
+        con = self._db()
+        attempts = con.execute("SELECT attempts FROM outbox WHERE id=?", (message_id,)).fetchone()[0] + 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        con.execute("UPDATE outbox SET attempts=?, next_attempt_at=?, last_error=?, claim=NULL WHERE id=?",
+                    (attempts, time.time() + delay, str(error)[:500], message_id))
+        con.commit()
+        with self._lock:
+            self.failed += 1
+            if attempts >= self.max_attempts:
+                self.dead += 1
+                print(f"Mail outbox: giving up on message {message_id}: {error}")
+
+    def _release(self, rows):
+        """Hand claimed rows back without counting an attempt."""
+        con = self._db()
+        con.executemany("UPDATE outbox SET next_attempt_at=?, claim=NULL WHERE id=?",
+                        [(time.time(), row[0]) for row in rows])
+        con.commit()
+
+    def _message(self, recipient, subject, body):
+        msg = EmailMessage()
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        msg['Subject'] = subject
+        msg.set_content(body)
+        return msg
+
+    # --- 3. SENDING ---
+    def _open(self):
+        smtp = self.connect()
+        with self._lock:
+            self.connections += 1
+        return smtp
+
+    def drain(self):
+        """Send everything that is due. Returns the number of messages sent."""
+        smtp = None
+        sent = 0
+        try:
+            while True:
+                rows = self._claim()
+                if not rows:
+                    return sent
+                with self._lock:
+                    self.batches += 1
+                for i, (message_id, recipient, subject, body) in enumerate(rows):
+                    try:
+                        if smtp is None:
+                            smtp = self._open()
+                        smtp.send_message(self._message(recipient, subject, body))
+                    except Exception as e:
+                        if not is_connection_error(e):
+                            self._mark_failed(message_id, e)
+                            continue
+                        # The server, not the message: try the rest later
+                        print(f"Mail outbox: SMTP connection failed: {e}")
+                        with self._lock:
+                            self.connect_errors += 1
+                        self._release(rows[i:])
+                        return sent
+                    self._mark_sent(message_id)
+                    sent += 1
+        finally:
+            if smtp is not None:
+                try:
+                    smtp.quit()
+                except Exception:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "max_attempts": self.max_attempts,
+                "sent": self.sent,
+                "failed_attempts": self.failed,
+                "dead": self.dead,
+                "batches": self.batches,
+                "connections": self.connections,
+                "connect_errors": self.connect_errors,
+            }
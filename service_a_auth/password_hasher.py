@@ -0,0 +1,146 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Too much credential work queued; the caller should answer 503."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash ($2b$12$... -> 12), or None if unreadable."""
+    try:
+        return int(hashed.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt on a small process pool, off the request threads.
+
+    Hashing is deliberately slow, so a login storm would otherwise tie up
+    every gunicorn thread and stall cheap endpoints like /profile. Here it
+    saturates at most `workers` cores, and once max_pending jobs are queued
+    new ones are refused straight away (HasherBusy) instead of piling up.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=32, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self.pool_restarts = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created lazily, and again after a fork, so each gunicorn worker owns its pool
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        # Caller holds the lock. A dead worker (OOM kill, segfault) breaks the
+        # whole pool, so drop it and let _pool() start a fresh one
+        if executor is not None and executor is self._executor:
+            self._executor = None
+            self.pool_restarts += 1
+            executor.shutdown(wait=False)
+
+    def _submit(self, fn, *args):
+        """(executor, future) for fn(*args), retrying once on a fresh pool."""
+        executor = self._pool()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+        executor = self._pool()
+        return executor, executor.submit(fn, *args)
+
+    def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy("Password hashing queue is full")
+            self.pending += 1
+            try:
+                executor, future = self._submit(fn, *args)
+            except Exception as e:
+                self.pending -= 1
+                if isinstance(e, BrokenProcessPool):
+                    self._discard(self._executor)
+                    raise HasherBusy("Password hashing pool is unavailable") from e
+                raise
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusy("Password hashing timed out")
+        except BrokenProcessPool as e:
+            with self._lock:
+                self._discard(executor)
+            raise HasherBusy("Password hashing worker died") from e
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def hash(self, password):
+        return self._run(_hash, password.encode(), self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run(_check, password.encode(), hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def rehash_if_needed(self, password, hashed):
+        """New hash at the current cost if hashed uses another one, else None.
+
+        Only call this after verify() succeeded. A busy pool just skips the
+        upgrade until the next login.
+        """
+        if not self.needs_rehash(hashed):
+            return None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusy:
+            return None
+        with self._lock:
+            self.rehashed += 1
+        return new_hash
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "rehashed": self.rehashed,
+                "pool_restarts": self.pool_restarts,
+            }
@@ -0,0 +1,114 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SLOT = struct.Struct('<Q')
+
+
+class GenerationTable:
+    """Change counters shared by every gunicorn worker through a small mmap'd file.
+
+    A write bumps the counter of the username's bucket; readers compare it
+    with the counter their cached copy was loaded under. Reading a counter
+    is a plain memory access, so cache hits never touch the disk, yet a
+    profile saved through one worker is never served stale by another.
+    The file is opened on first use and released by close().
+    """
+
+    def __init__(self, path, buckets=4096):
+        self.path = path
+        self.buckets = buckets
+        self._file = None
+        self._map = None
+        self._open_lock = threading.Lock()
+
+    def _open(self):
+        with self._open_lock:
+            if self._map is None:
+                self._file = open(self.path, 'a+b')
+                with self._locked():
+                    if os.fstat(self._file.fileno()).st_size < self.buckets * SLOT.size:
+                        self._file.truncate(self.buckets * SLOT.size)
+                self._map = mmap.mmap(self._file.fileno(), self.buckets * SLOT.size)
+        return self._map
+
+    def close(self):
+        with self._open_lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+                self._map = self._file = None
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _offset(self, key):
+        return (zlib.crc32(key.encode()) % self.buckets) * SLOT.size
+
+    def get(self, key):
+        return SLOT.unpack_from(self._map or self._open(), self._offset(key))[0]
+
+    def bump(self, key):
+        offset = self._offset(key)
+        table = self._map or self._open()
+        with self._locked():
+            SLOT.pack_into(table, offset, SLOT.unpack_from(table, offset)[0] + 1)
+
+
+def profile_etag(profile):
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ProfileCache:
+    """Bounded LRU of preference rows, each tagged with its generation and ETag."""
+
+    def __init__(self, generations, max_size=10000):
+        self.generations = generations
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # username -> (generation, profile, etag)
+        self._lock = threading.Lock()
+
+    def get(self, username, generation):
+        """(profile, etag) if cached under the current generation, else None."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != generation:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, username, generation, profile):
+        etag = profile_etag(profile)
+        with self._lock:
+            self._entries[username] = (generation, profile, etag)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return profile, etag
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
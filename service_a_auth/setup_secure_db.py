@@ -4,9 +4,8 @@ import os
 DB_FILE = os.path.join(os.path.dirname(__file__), 'SecureUserProfile.db')
 
 def create_secure_db():
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
-    
+    """Create any missing tables. Safe to run on every start: existing users
+    and queued mail are kept."""
     con = sqlite3.connect(DB_FILE)
     cur = con.cursor()
 
@@ -33,9 +32,26 @@ def create_secure_db():
     )
     """)
 
+    # 3. Outbox Table (mail waiting for the background sender)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        next_attempt_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claim TEXT,
+        sent_at REAL,
+        last_error TEXT
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at) WHERE sent_at IS NULL")
+
     con.commit()
     con.close()
-    print(f"User DB (with Email support) created at: {DB_FILE}")
+    print(f"User DB (with Email support) ready at: {DB_FILE}")
 
 if __name__ == "__main__":
     create_secure_db()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+# Matches the FTS5 'unicode61' tokenizer closely enough for safety purposes:
+# lowercase, strip diacritics, split on anything that isn't a letter or digit.
+TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase tokens the same way recipes_fts does."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return TOKEN_RE.findall(text)
+
+
+def word_tokens(text):
+    """tokenize(text) without bare numbers, which no allergen is spelled with."""
+    return [t for t in tokenize(text) if not t.isdigit()]
+
+
+def family_bits(allergen_synonyms):
+    """Assign one bit per allergen family, in allergens.json order."""
+    return {family: 1 << i for i, family in enumerate(allergen_synonyms)}
+
+
+def build_matchers(allergen_synonyms):
+    """Pre-tokenise every synonym once so masks can be computed per recipe cheaply.
+
+    The family name itself is treated as a synonym too.
+    """
+    matchers = []
+    for family, bit in family_bits(allergen_synonyms).items():
+        phrases = {' '.join(tokenize(d)) for d in [family, *allergen_synonyms[family]]}
+        matchers.append((bit, [f" {p} " for p in phrases if p]))
+    return matchers
+
+
+def compute_mask(text, matchers):
+    """Return the bitmask of allergen families whose synonyms appear in text.
+
+    A synonym counts as present when its tokens appear consecutively, which
+    is exactly what an FTS5 phrase query ("peanut butter") would match.
+    """
+    padded = f" {' '.join(tokenize(text))} "
+    mask = 0
+    for bit, phrases in matchers:
+        if any(p in padded for p in phrases):
+            mask |= bit
+    return mask
+
+
+def resolve_exclusions(user_allergens, allergen_synonyms, built_families=None):
+    """Split a user's allergens into a family bitmask plus leftover terms.
+
+    Families are matched the same way Service B always has (substring match
+    against the JSON keys). Anything the index can't cover, e.g. an allergen
+    that isn't in allergens.json, is returned as a term for the FTS fallback.
+
+    built_families is the {"bits", "synonyms"} map stored in the DB's meta
+    by setup_db.py. Masks are only trusted for families and synonyms the DB
+    was built with; whatever allergens.json has added since becomes a term.
+    Without it, bits are assigned from allergen_synonyms itself.
+    """
+    if built_families is None:
+        built_families = {"bits": family_bits(allergen_synonyms), "synonyms": allergen_synonyms}
+    bits, built_synonyms = built_families["bits"], built_families["synonyms"]
+    mask = 0
+    covered = set()
+    terms = set()
+
+    for allergen in user_allergens:
+        allergen_clean = allergen.lower().strip()
+        if not allergen_clean:
+            continue
+        terms.add(allergen_clean)
+
+        for key, derivatives in allergen_synonyms.items():
+            if key in allergen_clean or allergen_clean in key:
+                if key not in bits:
+                    terms.update([key, *derivatives])
+                    continue
+                mask |= bits[key]
+                indexed = set(built_synonyms.get(key, ()))
+                covered.update(indexed)
+                covered.add(key)
+                terms.update(d for d in derivatives if d not in indexed)
+
+    return mask, sorted(terms - covered)
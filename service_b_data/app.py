@@ -1,7 +1,15 @@
 import sqlite3
 import os
 import json
+import math
+import random
+import sys
+from itertools import islice
 from flask import Flask, request, jsonify
+from allergen_index import resolve_exclusions, tokenize, word_tokens
+from sqlite_pool import get_pool
+from candidate_cache import CandidateCache
+from vector_index import get_index
 
 app = Flask(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,6 +31,371 @@ def load_allergen_synonyms():
 # Load configuration once when the app starts
 ALLERGEN_SYNONYMS = load_allergen_synonyms()
 
+# How many recipes a single search hands back to Service C
+SAMPLE_SIZE = 10
+
+def reservoir_sample(items, k, rng):
+    """Uniformly pick k items from a stream of unknown length in one pass.
+
+    Uses Algorithm L, which jumps over runs of rows instead of rolling the
+    dice on every one, so nothing is materialised or sorted beyond k items.
+    """
+    it = iter(items)
+    sample = list(islice(it, k))
+    if len(sample) == k:
+        uniform = lambda: rng.random() or sys.float_info.min
+        w = math.exp(math.log(uniform()) / k)
+        while w < 1.0:
+            skip = int(math.log(uniform()) / math.log(1.0 - w))
+            nxt = next(islice(it, skip, skip + 1), None)
+            if nxt is None:
+                break
+            sample[rng.randrange(k)] = nxt
+            w *= math.exp(math.log(uniform()) / k)
+    rng.shuffle(sample)
+    return sample
+
+# mode=ranked: BM25 column weights (recipes_fts columns: name, ingredients_text),
+# so a title hit counts for more than a passing mention in the ingredients
+BM25_NAME_WEIGHT = float(os.environ.get("BM25_NAME_WEIGHT", 4.0))
+BM25_INGREDIENTS_WEIGHT = float(os.environ.get("BM25_INGREDIENTS_WEIGHT", 1.0))
+# Best matches considered before temperature / diversity pick SAMPLE_SIZE of them
+RANKED_TOP_N = int(os.environ.get("RANKED_TOP_N", 50))
+
+# Upper bound on specs per /filter_recipes/batch call
+MAX_BATCH_SIZE = 5000
+
+# Candidate ids per (DB build, query, exclusions, calorie bucket). Sampling
+# still happens per request on top, so cached searches keep their variety.
+CALORIE_BUCKET = int(os.environ.get("CALORIE_BUCKET", 100))
+candidate_cache = CandidateCache(
+    max_ids=int(os.environ.get("CANDIDATE_CACHE_MAX_IDS", 2_000_000)),
+    max_entries=int(os.environ.get("CANDIDATE_CACHE_MAX_ENTRIES", 10_000)),
+)
+
+# Fields a search or /recipes/<id> can return, and the column behind each
+RECIPE_FIELDS = {
+    "id": "id", "name": "name", "calories": "calories",
+    "ingredients": "ingredients_text", "instructions": "instructions",
+    "protein_g": "protein_g", "fat_g": "fat_g", "carbs_g": "carbs_g",
+}
+# Long free-text fields that 'max_chars' shortens
+TEXT_FIELDS = ("ingredients", "instructions")
+
+def parse_projection(fields, max_chars):
+    """Validate the 'fields' / 'max_chars' options; raises ValueError."""
+    if fields is None:
+        fields = list(RECIPE_FIELDS)
+    if not isinstance(fields, list) or not fields:
+        raise ValueError("'fields' must be a non-empty list")
+    unknown = [f for f in fields if f not in RECIPE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {unknown}")
+    if max_chars is not None:
+        max_chars = int(max_chars)
+        if max_chars < 1:
+            raise ValueError("'max_chars' must be positive")
+    return list(dict.fromkeys(fields)), max_chars
+
+def truncate(text, max_chars):
+    if max_chars is None or text is None or len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "…"
+
+def fetch_recipes(cur, ids, fields, max_chars=None):
+    """Recipe dicts for ids, in the same order, holding only the requested fields."""
+    if fields == ["id"]:
+        return [{"id": i} for i in ids]  # id-only mode: no row lookup at all
+    if not ids:
+        return []
+
+    columns = ", ".join(RECIPE_FIELDS[f] for f in fields)
+    placeholders = ",".join("?" * len(ids))
+    cur.execute(f"SELECT id, {columns} FROM recipes WHERE id IN ({placeholders})", list(ids))
+    rows_by_id = {r[0]: r[1:] for r in cur.fetchall()}
+
+    recipes = []
+    for i in ids:
+        if i not in rows_by_id:
+            continue
+        recipe = dict(zip(fields, rows_by_id[i]))
+        for f in TEXT_FIELDS:
+            if f in recipe:
+                recipe[f] = truncate(recipe[f], max_chars)
+        recipes.append(recipe)
+    return recipes
+
+def get_build_version(cur):
+    row = cur.execute("SELECT value FROM meta WHERE key = 'build_version'").fetchone()
+    return row[0] if row else None
+
+# Per (DB, build): the allergen family bits the DB's masks were computed with
+_allergen_families = {}
+
+def get_allergen_families(cur, build_version):
+    """The {"bits", "synonyms"} map stored by setup_db.py.
+
+    A DB without one (built before it was recorded) gets no bits at all, so
+    every family is excluded by its terms instead of by a mask we can't trust.
+    """
+    key = (DB_FILE, build_version)
+    families = _allergen_families.get(key)
+    if families is None:
+        row = cur.execute("SELECT value FROM meta WHERE key = 'allergen_families'").fetchone()
+        families = json.loads(row[0]) if row else {"bits": {}, "synonyms": {}}
+        _allergen_families[key] = families
+    return families
+
+def excluded_recipe_ids(cur, terms):
+    """Ids of recipes containing any of terms, from the recipe_tokens index.
+
+    A term matches a recipe that has all of its word tokens, in any order
+    (numbers ignored), which is slightly broader than an FTS phrase match
+    and so errs on the safe side.
+    """
+    excluded = set()
+    for term in terms:
+        tokens = sorted(set(word_tokens(term)))
+        if not tokens:
+            continue
+        placeholders = ",".join("?" * len(tokens))
+        token_ids = [r[0] for r in cur.execute(
+            f"SELECT id FROM tokens WHERE name IN ({placeholders})", tokens)]
+        if len(token_ids) < len(tokens):
+            continue  # some token appears in no recipe at all
+        placeholders = ",".join("?" * len(token_ids))
+        excluded.update(r[0] for r in cur.execute(f"""
+        SELECT recipe_id FROM recipe_tokens
+        WHERE token_id IN ({placeholders})
+        GROUP BY recipe_id HAVING COUNT(*) = ?
+        """, token_ids + [len(token_ids)]))
+    return excluded
+
+def load_candidates(cur, search_query, cal_ceiling, exclude_mask, exclude_terms=(), min_protein=None):
+    """Return (ids, calories) of every safe recipe matching the query under cal_ceiling."""
+    # --- 1. BUILD SEARCH PART ---
+    params = []
+    if search_query:
+        query = """
+        SELECT r.id, r.calories
+        FROM recipes r
+        JOIN recipes_fts f ON r.id = f.rowid
+        WHERE recipes_fts MATCH ?
+        """
+        params.append(search_query)
+    else:
+        query = """
+        SELECT r.id, r.calories
+        FROM recipes r
+        WHERE 1
+        """
+
+    # --- 2. COMBINE ---
+    query += " AND r.calories <= ? AND (r.allergen_mask & ?) = 0"
+    params += [cal_ceiling, exclude_mask]
+
+    if min_protein is not None:
+        query += " AND r.protein_g >= ?"
+        params.append(min_protein)
+
+    # --- 3. UNKNOWN ALLERGENS ---
+    excluded = excluded_recipe_ids(cur, exclude_terms) if exclude_terms else ()
+
+    ids, calories = [], []
+    for recipe_id, cal in cur.execute(query, params):
+        if recipe_id in excluded:
+            continue
+        ids.append(recipe_id)
+        calories.append(cal)
+    return ids, calories
+
+def get_candidates(cur, search_query, max_cal, exclude_mask, exclude_terms, build_version=None, min_protein=None):
+    """Ids of every safe recipe matching the query under max_cal, via candidate_cache."""
+    max_cal = int(max_cal)
+    # Round the limit up to its bucket so nearby limits share one cache entry;
+    # the exact limit is re-applied below.
+    cal_ceiling = -(-max_cal // CALORIE_BUCKET) * CALORIE_BUCKET
+    cache_key = (DB_FILE, build_version, " ".join(search_query.split()), exclude_mask, tuple(exclude_terms), cal_ceiling, min_protein)
+
+    candidates = candidate_cache.get(cache_key) if build_version else None
+    if candidates is None:
+        candidates = load_candidates(cur, search_query, cal_ceiling, exclude_mask, exclude_terms, min_protein)
+        if build_version:
+            candidate_cache.put(cache_key, *candidates)
+
+    ids, calories = candidates
+    return (i for i, cal in zip(ids, calories) if cal <= max_cal)
+
+def search_recipes(cur, search_query, max_cal, exclude_mask, exclude_terms, rng, build_version=None,
+                   min_protein=None, fields=None, max_chars=None):
+    """Run one safety-filtered search and return up to SAMPLE_SIZE recipe dicts."""
+    candidates = get_candidates(cur, search_query, max_cal, exclude_mask, exclude_terms, build_version, min_protein)
+
+    # --- 4. SAMPLE ---
+    # Sample candidate ids instead of ORDER BY RANDOM(), which would
+    # materialise and sort every candidate row.
+    picked = reservoir_sample(candidates, SAMPLE_SIZE, rng)
+
+    # --- 5. PROJECT ---
+    return fetch_recipes(cur, picked, fields or list(RECIPE_FIELDS), max_chars)
+
+def semantic_search(cur, index, search_query, max_cal, exclude_mask, exclude_terms, build_version=None,
+                    min_protein=None, fields=None, max_chars=None, hybrid=False, scores=None):
+    """Top SAMPLE_SIZE safe recipes by vector similarity to search_query.
+
+    The same allergen, calorie and protein filters pick the candidates; only
+    the ranking differs. In hybrid mode, FTS matches for the query rank first.
+    scores may be precomputed for a whole batch (see filter_recipes_batch).
+    """
+    if scores is None:
+        query_vector = index.query_vectors(cur, [search_query])
+        if not query_vector.any() and not hybrid:
+            return []  # no word of the query is in the vocabulary
+        # Hybrid still has its FTS matches; an empty vector just scores all zero
+        scores = index.scores(query_vector)[:, 0]
+
+    candidates = list(get_candidates(cur, "", max_cal, exclude_mask, exclude_terms, build_version, min_protein))
+    lexical = ()
+    if hybrid:
+        try:
+            lexical = set(get_candidates(cur, search_query, max_cal, exclude_mask, exclude_terms, build_version, min_protein))
+        except sqlite3.Error as e:
+            print(f"SQL Error (hybrid search, using vectors only): {e}")
+
+    picked = index.top_k(scores, candidates, SAMPLE_SIZE, boost_ids=lexical)
+    return fetch_recipes(cur, picked, fields or list(RECIPE_FIELDS), max_chars)
+
+def parse_ranking(spec):
+    """Validate mode=ranked options: (top_n, temperature, diversity); raises ValueError."""
+    top_n = int(spec.get('top_n', RANKED_TOP_N))
+    temperature = float(spec.get('temperature', 0.0))
+    diversity = float(spec.get('diversity', 0.0))
+    if top_n < 1 or temperature < 0 or not 0 <= diversity <= 1:
+        raise ValueError("'top_n' must be positive, 'temperature' >= 0 and 'diversity' in [0, 1]")
+    return max(top_n, SAMPLE_SIZE), temperature, diversity
+
+def rerank(candidates, k, rng, temperature=0.0, diversity=0.0):
+    """Pick k of [(id, relevance, name tokens)], best first.
+
+    temperature adds Gumbel noise to relevance (0 keeps the strict order;
+    higher values sample more evenly among the top matches). diversity
+    trades relevance for names unlike those already picked (maximal
+    marginal relevance), so ten variants of one dish don't crowd out the rest.
+    """
+    noisy = []
+    for recipe_id, relevance, tokens in candidates:
+        if temperature:
+            relevance -= temperature * math.log(-math.log(rng.random() or sys.float_info.min))
+        noisy.append((recipe_id, relevance, tokens))
+
+    picked = []
+    while noisy and len(picked) < k:
+        def mmr(c):
+            overlap = max((len(c[2] & p[2]) / (len(c[2] | p[2]) or 1) for p in picked), default=0.0)
+            return (1 - diversity) * c[1] - diversity * overlap
+        best = max(noisy, key=mmr) if diversity else max(noisy, key=lambda c: c[1])
+        noisy.remove(best)
+        picked.append(best)
+    return [c[0] for c in picked]
+
+def ranked_search(cur, search_query, max_cal, exclude_mask, exclude_terms, rng, min_protein=None,
+                  fields=None, max_chars=None, top_n=RANKED_TOP_N, temperature=0.0, diversity=0.0):
+    """Top SAMPLE_SIZE safe recipes for search_query by weighted BM25."""
+    query = """
+    SELECT r.id, r.name, bm25(recipes_fts, ?, ?) AS score
+    FROM recipes_fts
+    JOIN recipes r ON r.id = recipes_fts.rowid
+    WHERE recipes_fts MATCH ? AND r.calories <= ? AND (r.allergen_mask & ?) = 0
+    """
+    params = [BM25_NAME_WEIGHT, BM25_INGREDIENTS_WEIGHT, search_query, int(max_cal), exclude_mask]
+    if min_protein is not None:
+        query += " AND r.protein_g >= ?"
+        params.append(min_protein)
+    query += " ORDER BY score"
+
+    excluded = excluded_recipe_ids(cur, exclude_terms) if exclude_terms else ()
+    # bm25() is lower-is-better; stop reading once top_n safe rows are in
+    candidates = []
+    for recipe_id, name, score in cur.execute(query, params):
+        if recipe_id in excluded:
+            continue
+        candidates.append((recipe_id, -score, set(tokenize(name))))
+        if len(candidates) == top_n:
+            break
+
+    # Scale relevance to [0, 1] so temperature and diversity mean the same for every query
+    top = max((c[1] for c in candidates), default=0.0) or 1.0
+    candidates = [(i, rel / top, tokens) for i, rel, tokens in candidates]
+
+    picked = rerank(candidates, SAMPLE_SIZE, rng, temperature, diversity)
+    return fetch_recipes(cur, picked, fields or list(RECIPE_FIELDS), max_chars)
+
+SEARCH_MODES = ("lexical", "ranked", "semantic", "hybrid")
+
+def run_search_spec(cur, spec, semantic_scores=None):
+    """Evaluate one search spec (the /filter_recipes body).
+
+    'fallback_queries' is an optional ordered list of queries to try, with the
+    same allergens and calorie limit, until one of them returns recipes.
+    'fields' limits which recipe fields come back (["id"] for ids only) and
+    'max_chars' shortens ingredients/instructions; full text is available
+    from /recipes/<id>.
+    'mode' picks the ranking: "lexical" (FTS match, random sample, default),
+    "ranked" (weighted BM25, with optional 'top_n', 'temperature' and
+    'diversity'), "semantic" (vector similarity) or "hybrid" (FTS matches
+    first, then nearest neighbours). Without a vector index the last two
+    run lexically.
+    """
+    max_cal = spec.get('max_calories', 2000)
+    # Optional: minimum grams of protein per serving (indexed range filter)
+    min_protein = spec.get('min_protein')
+    min_protein = float(min_protein) if min_protein is not None else None
+    user_allergens = spec.get('allergens', [])
+    queries = [spec.get('query', '')] + list(spec.get('fallback_queries', []))
+    # Optional: a fixed seed makes the random sample reproducible (tests, replays)
+    rng = random.Random(spec.get('seed'))
+    fields, max_chars = parse_projection(spec.get('fields'), spec.get('max_chars'))
+    mode = spec.get('mode', 'lexical')
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"'mode' must be one of {list(SEARCH_MODES)}")
+    top_n, temperature, diversity = parse_ranking(spec)
+
+    # Known allergen families are precomputed per recipe by setup_db.py,
+    # so excluding them is a single bitwise test on recipes.allergen_mask.
+    # Allergens missing from allergens.json are looked up in the
+    # recipe_tokens index instead.
+    build_version = get_build_version(cur)
+    exclude_mask, extra_terms = resolve_exclusions(user_allergens, ALLERGEN_SYNONYMS,
+                                                   get_allergen_families(cur, build_version))
+    index = get_index(DB_FILE, build_version) if mode in ('semantic', 'hybrid') else None
+    if mode in ('semantic', 'hybrid') and index is None:
+        mode = 'lexical'
+
+    for i, search_query in enumerate(queries):
+        search_query = search_query.strip()
+        try:
+            if index is not None and search_query:
+                results = semantic_search(cur, index, search_query, max_cal, exclude_mask, extra_terms, build_version,
+                                          min_protein, fields, max_chars, hybrid=(mode == 'hybrid'),
+                                          scores=semantic_scores if i == 0 else None)
+            elif mode == 'ranked' and search_query:
+                results = ranked_search(cur, search_query, max_cal, exclude_mask, extra_terms, rng, min_protein,
+                                        fields, max_chars, top_n, temperature, diversity)
+            else:
+                # Profile-only searches have nothing to rank by: sample as usual
+                results = search_recipes(cur, search_query, max_cal, exclude_mask, extra_terms, rng, build_version,
+                                         min_protein, fields, max_chars)
+        except sqlite3.Error as e:
+            # e.g. bad FTS syntax from an LLM-made query: move on to the next fallback
+            if i == len(queries) - 1:
+                raise
+            print(f"SQL Error (trying fallback): {e}")
+            results = []
+        if results:
+            break
+
+    return {"safe_recipes": results, "query_used": search_query, "mode_used": mode}
+
 @app.route('/filter_recipes', methods=['POST'])
 def filter_recipes():
     data = request.get_json()
@@ -32,75 +405,93 @@ def filter_recipes():
 
     print(f"[Service B] Search: '{search_query}' | < {max_cal} cal | Exclude: {user_allergens}")
 
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
+    try:
+        # RecipeCorpus.db never changes after setup_db.py, so every worker
+        # thread keeps one immutable read-only connection for its lifetime
+        con = get_pool(DB_FILE, read_only=True).connection()
+        result = run_search_spec(con.cursor(), data)
+
+        print(f"[Service B] Found {len(result['safe_recipes'])} matches.")
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"SQL Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def score_semantic_specs(cur, searches):
+    """Vector scores for every semantic/hybrid spec's first query, in one matrix product.
+
+    Returns {spec position: scores}, leaving out specs whose query has no known words.
+    """
+    index = get_index(DB_FILE, get_build_version(cur))
+    if index is None:
+        return {}
+    positions, texts = [], []
+    for i, spec in enumerate(searches):
+        if isinstance(spec, dict) and spec.get('mode') in ("semantic", "hybrid") and str(spec.get('query', '')).strip():
+            positions.append(i)
+            texts.append(str(spec['query']))
+    if not texts:
+        return {}
+    query_vectors = index.query_vectors(cur, texts)
+    scores = index.scores(query_vectors)
+    return {pos: scores[:, col] for col, pos in enumerate(positions) if query_vectors[col].any()}
+
+@app.route('/filter_recipes/batch', methods=['POST'])
+def filter_recipes_batch():
+    """Run many search specs over one connection; results come back in the same order."""
+    data = request.get_json()
+    searches = data.get('searches', [])
+
+    if not isinstance(searches, list):
+        return jsonify({"error": "'searches' must be a list"}), 400
+    if len(searches) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE})"}), 413
 
     try:
-        # --- 1. BUILD EXCLUSION LIST ---
-        expanded_exclusions = set()
-        
-        for allergen in user_allergens:
-            allergen_clean = allergen.lower().strip()
-            expanded_exclusions.add(allergen_clean)
-            
-            # Check JSON keys and values for synonyms
-            for key, derivatives in ALLERGEN_SYNONYMS.items():
-                if key in allergen_clean or allergen_clean in key:
-                    for d in derivatives:
-                        expanded_exclusions.add(d)
-
-        # Build FTS5 NOT string
-        exclude_part = ""
-        if expanded_exclusions:
-            # Format: NOT "milk" NOT "butter" NOT "cheese"
-            exclude_part = " ".join([f'NOT "{item}"' for item in expanded_exclusions])
-
-        # --- 2. BUILD SEARCH PART ---
-        include_part = f'{search_query}' if search_query else ""
-
-        # --- 3. COMBINE ---
-        if include_part and exclude_part:
-            fts_string = f'{include_part} {exclude_part}'
-        elif include_part:
-            fts_string = include_part
-        elif exclude_part:
-            fts_string = exclude_part
-        else:
-            fts_string = ""
-
-        # --- 4. EXECUTE QUERY ---
-        if fts_string:
-            query = """
-            SELECT r.name, r.calories, r.ingredients_text, r.instructions
-            FROM recipes r
-            JOIN recipes_fts f ON r.id = f.rowid
-            WHERE recipes_fts MATCH ? 
-            AND r.calories <= ?
-            ORDER BY RANDOM() 
-            LIMIT 10
-            """
-            cur.execute(query, (fts_string, int(max_cal)))
-        else:
-            query = """
-            SELECT name, calories, ingredients_text, instructions 
-            FROM recipes 
-            WHERE calories <= ? 
-            ORDER BY RANDOM() 
-            LIMIT 10
-            """
-            cur.execute(query, (int(max_cal),))
-            
-        rows = cur.fetchall()
-        results = [{"name": r[0], "calories": r[1], "ingredients": r[2], "instructions": r[3]} for r in rows]
-        
-        print(f"[Service B] Found {len(results)} matches.")
-        return jsonify({"safe_recipes": results})
+        cur = get_pool(DB_FILE, read_only=True).connection().cursor()
+        semantic_scores = score_semantic_specs(cur, searches)
+    except Exception as e:
+        print(f"SQL Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    results = []
+    for i, spec in enumerate(searches):
+        # One bad spec (e.g. malformed FTS syntax) shouldn't sink the whole batch
+        try:
+            results.append(run_search_spec(cur, spec, semantic_scores.get(i)))
+        except Exception as e:
+            results.append({"error": str(e)})
+
+    print(f"[Service B] Batch: {len(searches)} searches.")
+    return jsonify({"results": results})
+
+@app.route('/recipes/<int:recipe_id>', methods=['GET'])
+def get_recipe(recipe_id):
+    """Full text of one recipe, e.g. the one Service C picked from a compact search."""
+    fields = request.args.get('fields')
+    try:
+        fields, max_chars = parse_projection(fields.split(',') if fields else None, request.args.get('max_chars'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
+        cur = get_pool(DB_FILE, read_only=True).connection().cursor()
+        # Always read a real column so a missing id is noticed
+        recipes = fetch_recipes(cur, [recipe_id], fields if fields != ["id"] else ["id", "name"], max_chars)
     except Exception as e:
         print(f"SQL Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        con.close()
+
+    if not recipes:
+        return jsonify({"error": "Recipe not found"}), 404
+    return jsonify({f: recipes[0][f] for f in fields})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({"candidate_cache": candidate_cache.stats()})
 
 if __name__ == '__main__':
     app.run(port=5001, debug=True)
\ No newline at end of file
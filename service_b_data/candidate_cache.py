@@ -0,0 +1,66 @@
+import threading
+from array import array
+from collections import OrderedDict
+
+
+def cost(entry):
+    return max(len(entry[0]), 1)
+
+
+class CandidateCache:
+    """LRU cache of search candidates: (recipe ids, calories) per search key.
+
+    Memory is bounded by the total number of ids held across all entries
+    rather than by entry count, since one broad query can match the whole
+    corpus. Ids and calories are packed into arrays (8 bytes per candidate).
+    An entry with no matches still costs one id, and max_entries caps the
+    key count, so a stream of distinct queries that find nothing can't grow
+    the cache without bound.
+    """
+
+    def __init__(self, max_ids=2_000_000, max_entries=10_000):
+        self.max_ids = max_ids
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (ids, calories)
+        self._total_ids = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, ids, calories):
+        """Store candidates for key; anything bigger than the whole budget is skipped."""
+        if len(ids) > self.max_ids:
+            return
+        entry = (array('i', ids), array('i', calories))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_ids -= cost(old)
+            self._entries[key] = entry
+            self._total_ids += cost(entry)
+            while self._total_ids > self.max_ids or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_ids -= cost(evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ids": self._total_ids,
+                "max_ids": self.max_ids,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,194 @@
+import ast
+import csv
+import re
+
+from allergen_index import tokenize
+
+# The dataset doesn't list servings, so whole-recipe totals are split evenly
+DEFAULT_SERVINGS = 4
+
+# Share of ingredient lines that must be measured before a total is trusted.
+# A total over fewer lines undercounts, and could let a rich recipe through
+# a max_calories filter.
+MIN_MATCHED_FRACTION = 0.75
+
+# Lines made only of these words (salt, pepper, water...) add no calories
+# worth counting, so they don't count against the matched share either
+NEGLIGIBLE_WORDS = {
+    'salt', 'kosher', 'sea', 'pepper', 'black', 'white', 'cracked', 'ground', 'freshly', 'water', 'ice',
+    'cold', 'warm', 'hot', 'to', 'taste', 'and', 'for', 'as', 'needed', 'a', 'of', 'pinch', 'dash', 'plus',
+    'more', 'or', 'serving',
+}
+
+# Grams per unit for weights; volumes are relative to one cup and scaled by
+# the ingredient's own cup_g density from nutrients.csv
+MASS_UNITS = {
+    'g': 1, 'gram': 1, 'grams': 1, 'kg': 1000, 'kilogram': 1000, 'kilograms': 1000,
+    'oz': 28.35, 'ounce': 28.35, 'ounces': 28.35,
+    'lb': 453.6, 'lbs': 453.6, 'pound': 453.6, 'pounds': 453.6,
+}
+VOLUME_UNITS = {
+    'cup': 1, 'cups': 1, 'c': 1,
+    'tbsp': 1 / 16, 'tablespoon': 1 / 16, 'tablespoons': 1 / 16, 'tbs': 1 / 16,
+    'tsp': 1 / 48, 'teaspoon': 1 / 48, 'teaspoons': 1 / 48,
+    'ml': 1 / 240, 'milliliter': 1 / 240, 'milliliters': 1 / 240,
+    'l': 1000 / 240, 'liter': 1000 / 240, 'liters': 1000 / 240,
+    'pint': 2, 'pints': 2, 'quart': 4, 'quarts': 4,
+}
+# Count-like units with a fixed weight regardless of ingredient
+PIECE_UNITS = {
+    'can': 400, 'cans': 400, 'stick': 113, 'sticks': 113,
+    'slice': 30, 'slices': 30, 'pinch': 0.3, 'pinches': 0.3, 'dash': 0.5,
+}
+
+UNICODE_FRACTIONS = {'¼': 1 / 4, '½': 1 / 2, '¾': 3 / 4, '⅓': 1 / 3, '⅔': 2 / 3,
+                     '⅛': 1 / 8, '⅜': 3 / 8, '⅝': 5 / 8, '⅞': 7 / 8, '⅕': 1 / 5}
+
+# "1", "1.5", "1 1/2", "1/2", "1½", "½"
+QUANTITY_RE = re.compile(r"^\s*(?:(\d+)\s+(\d+)/(\d+)|(\d+)/(\d+)|(\d+(?:\.\d+)?))?\s*([" + ''.join(UNICODE_FRACTIONS) + r"])?")
+
+
+def _stem(token):
+    """Crude singular form so 'tomatoes'/'tomato' and 'berries'/'berry' line up."""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('oes'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+class NutrientTable:
+    """nutrients.csv indexed by alias, for longest-phrase lookups in ingredient text."""
+
+    def __init__(self, path):
+        self.aliases = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                entry = {
+                    'name': row['name'],
+                    'kcal': float(row['kcal']),
+                    'protein': float(row['protein']),
+                    'fat': float(row['fat']),
+                    'carbs': float(row['carbs']),
+                    'cup_g': float(row['cup_g']) if row['cup_g'] else None,
+                    'each_g': float(row['each_g']) if row['each_g'] else None,
+                }
+                for alias in row['aliases'].split(';'):
+                    tokens = tuple(_stem(t) for t in tokenize(alias))
+                    if tokens:
+                        self.aliases[tokens] = entry
+        self.max_alias_len = max(map(len, self.aliases), default=0)
+
+    def lookup(self, text):
+        """Return the entry whose alias appears in text, preferring longer aliases
+        ("peanut butter" over "butter"), or None."""
+        tokens = tuple(_stem(t) for t in tokenize(text))
+        for n in range(min(self.max_alias_len, len(tokens)), 0, -1):
+            for i in range(len(tokens) - n + 1):
+                entry = self.aliases.get(tokens[i:i + n])
+                if entry:
+                    return entry
+        return None
+
+
+def parse_quantity(text):
+    """Return (quantity or None, rest of text)."""
+    m = QUANTITY_RE.match(text)
+    mixed_whole, mixed_num, mixed_den, num, den, number, fraction = m.groups()
+    if mixed_whole:
+        qty = int(mixed_whole) + int(mixed_num) / max(int(mixed_den), 1)
+    elif num:
+        qty = int(num) / max(int(den), 1)
+    elif number or fraction:
+        qty = float(number or 0)
+    else:
+        return None, text
+    if fraction:
+        qty += UNICODE_FRACTIONS[fraction]
+    rest = text[m.end():]
+    # Ranges like "2-3" or "2 to 3": keep the lower bound
+    rest = re.sub(r"^\s*(?:[-–]|to\s)\s*[\d" + ''.join(UNICODE_FRACTIONS) + r"./]+", "", rest)
+    return qty, rest
+
+
+def parse_unit(text):
+    """Return (unit or None, rest of text)."""
+    m = re.match(r"\s*([A-Za-z]+)\.?", text)
+    if m and m.group(1).lower() in {**MASS_UNITS, **VOLUME_UNITS, **PIECE_UNITS}:
+        return m.group(1).lower(), text[m.end():]
+    return None, text
+
+
+def ingredient_grams(line, table):
+    """Estimate (entry, grams) for one ingredient line, or (None, 0) if unknown."""
+    qty, rest = parse_quantity(line)
+    if qty is None:
+        return None, 0  # "Kosher salt", "Oil for frying": not measurable
+
+    # "2 (15-oz.) cans chickpeas": the parenthetical is the weight of each piece
+    piece_g = None
+    paren = re.match(r"\s*\(([^)]*)\)", rest)
+    if paren:
+        inner_qty, inner_rest = parse_quantity(paren.group(1))
+        inner_unit, _ = parse_unit(inner_rest.lstrip('-'))
+        if inner_qty and inner_unit in MASS_UNITS:
+            piece_g = inner_qty * MASS_UNITS[inner_unit]
+        rest = rest[paren.end():]
+
+    unit, rest = parse_unit(rest)
+    entry = table.lookup(rest)
+    if entry is None:
+        return None, 0
+
+    if piece_g is not None:
+        return entry, qty * piece_g
+    if unit in MASS_UNITS:
+        return entry, qty * MASS_UNITS[unit]
+    if unit in VOLUME_UNITS and entry['cup_g']:
+        return entry, qty * VOLUME_UNITS[unit] * entry['cup_g']
+    if unit in PIECE_UNITS:
+        return entry, qty * PIECE_UNITS[unit]
+    if unit is None and entry['each_g']:
+        return entry, qty * entry['each_g']
+    return None, 0
+
+
+def split_ingredients(ingredients_text):
+    """The dataset stores ingredients as a stringified Python list."""
+    try:
+        items = ast.literal_eval(ingredients_text)
+        if isinstance(items, (list, tuple)):
+            return [str(i) for i in items]
+    except (ValueError, SyntaxError):
+        pass
+    return [line for line in re.split(r"[\n;]", str(ingredients_text)) if line.strip()]
+
+
+def is_negligible(line):
+    """True for lines like "Kosher salt" or "1 cup water"."""
+    tokens = [t for t in tokenize(line)
+              if not t.isdigit() and t not in MASS_UNITS and t not in VOLUME_UNITS and t not in PIECE_UNITS]
+    return bool(tokens) and all(t in NEGLIGIBLE_WORDS for t in tokens)
+
+
+def estimate_nutrition(ingredients_text, table, servings=DEFAULT_SERVINGS, min_matched=MIN_MATCHED_FRACTION):
+    """Per-serving (kcal, protein, fat, carbs), or None unless at least
+    min_matched of the (non-negligible) ingredient lines could be measured."""
+    totals = [0.0, 0.0, 0.0, 0.0]
+    matched = counted = 0
+    for line in split_ingredients(ingredients_text):
+        entry, grams = ingredient_grams(line, table)
+        if entry is None:
+            counted += not is_negligible(line)
+            continue
+        matched += 1
+        counted += 1
+        for i, key in enumerate(('kcal', 'protein', 'fat', 'carbs')):
+            totals[i] += entry[key] * grams / 100
+
+    if not matched or matched < min_matched * counted:
+        return None
+    kcal, protein, fat, carbs = (t / servings for t in totals)
+    return int(round(kcal)), round(protein, 1), round(fat, 1), round(carbs, 1)
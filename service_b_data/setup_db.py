@@ -1,23 +1,215 @@
 import sqlite3
 import os
+import json
+import shutil
+import hashlib
+import re
+import sys
+import argparse
+import unicodedata
+import urllib.request
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+from allergen_index import TOKEN_RE, build_matchers, family_bits
+from nutrition import NutrientTable, estimate_nutrition
+from vector_index import VECTOR_DIM, build_vectors, remove_stale_vectors
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILE = os.path.join(BASE_DIR, 'RecipeCorpus.db')
+ALLERGENS_FILE = os.path.join(BASE_DIR, 'allergens.json')
+NUTRIENTS_FILE = os.path.join(BASE_DIR, 'nutrients.csv')
 
 # --- THE CORRECT URL ---
 # We use the raw link to the 13k-recipes.csv file on the 'main' branch
 DATASET_URL = "https://raw.githubusercontent.com/josephrmartinez/recipe-dataset/main/13k-recipes.csv"
 
-def create_database():
+# Local copy of the dataset. Downloaded once if missing; builds read from here
+LOCAL_CSV = os.path.join(BASE_DIR, 'recipes.csv')
+
+# Bump whenever the schema or ingestion rules change, so existing DBs get rebuilt
+SCHEMA_VERSION = 6
+
+# Rows per CSV chunk; each chunk is inserted before the next one is read
+CHUNK_SIZE = 5000
+
+# Also build the vector index for mode=semantic|hybrid searches (see vector_index.py)
+VECTOR_INDEX = os.environ.get("VECTOR_INDEX", "0") == "1"
+
+@lru_cache(maxsize=None)
+def combining_marks():
+    """Regex class of every combining character (what tokenize() strips after NFKD)."""
+    marks = ''.join(re.escape(chr(c)) for c in range(sys.maxunicode + 1) if unicodedata.combining(chr(c)))
+    return f"[{marks}]"
+
+def padded_tokens(texts):
+    """allergen_index.tokenize for a whole Series: ' tok tok ... ' per row."""
+    text = texts.str.lower().str.normalize('NFKD')
+    # Stripping accents is the slow step, so only do it where there are any
+    accented = text.str.contains(r'[^\x00-\x7f]')
+    if accented.any():
+        text[accented] = text[accented].str.replace(combining_marks(), '', regex=True)
+    return ' ' + text.str.findall(TOKEN_RE).str.join(' ') + ' '
+
+def allergen_masks(padded, allergen_matchers):
+    """allergen_index.compute_mask over a Series: one regex pass per family."""
+    mask = np.zeros(len(padded), dtype=np.int64)
+    for bit, phrases in allergen_matchers:
+        # Phrases are ' a b ' with single spaces, so ' (?:a b|c) ' finds the same hits
+        pattern = " (?:" + "|".join(re.escape(p.strip()) for p in phrases) + ") "
+        mask[padded.str.contains(pattern, regex=True).to_numpy()] |= bit
+    return mask
+
+def prepare_chunk(df, allergen_matchers, nutrients):
+    """Turn one CSV chunk into rows for the recipes table, column-wise."""
+    # Normalize columns to lowercase (Title -> title, Instructions -> instructions)
+    df.columns = [c.lower().strip() for c in df.columns]
+
+    # Map the specific columns from this dataset
+    # The dataset uses: 'Title', 'Ingredients', 'Instructions'
+    for column, default in (('title', 'Unknown'), ('ingredients', ''), ('instructions', '')):
+        if column not in df:
+            df[column] = default
+
+    # Skip invalid rows
+    df = df.dropna(subset=['title', 'ingredients'])
+    title = df['title'].astype(str)
+    ingredients = df['ingredients'].astype(str)
+    instructions = df['instructions'].fillna('').astype(str)
+
+    # Per-serving calories and macros from ingredient quantities (see nutrition.py).
+    # The one per-row step: each ingredient line is parsed on its own
+    nutrition = ingredients.map(lambda text: estimate_nutrition(text, nutrients))
+    macros = pd.DataFrame(
+        [n if n else (None, None, None, None) for n in nutrition],
+        columns=['calories', 'protein_g', 'fat_g', 'carbs_g'], index=df.index,
+    )
+
+    # Recipes we couldn't measure, or only partly (see MIN_MATCHED_FRACTION), keep
+    # the old placeholder estimate and NULL macros
+    # Logic: longer ingredient list = more calories
+    fallback_cal = (ingredients.str.len() * 1.5).astype(int).clip(upper=1200)
+    fallback_cal = fallback_cal.where(fallback_cal >= 100, 150)
+    calories = macros['calories'].fillna(fallback_cal).astype(int)
+
+    # Precompute which allergen families this recipe contains,
+    # over the same columns recipes_fts indexes
+    padded = padded_tokens(title + " " + ingredients)
+    allergen_mask = allergen_masks(padded, allergen_matchers)
+
+    # NaN -> None so SQLite stores NULL for unmeasured macros
+    protein, fat, carbs = (macros[c].astype(object).where(macros[c].notna(), None) for c in ('protein_g', 'fat_g', 'carbs_g'))
+
+    rows = list(zip(title, calories.tolist(), protein, fat, carbs, instructions, ingredients, allergen_mask.tolist()))
+    # Distinct word tokens per recipe (no bare numbers), for the recipe_tokens inverted index
+    token_sets = [{t for t in text.split() if not t.isdigit()} for text in padded.tolist()]
+    return rows, token_sets
+
+def file_sha256(path, h=None):
+    h = h or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h
+
+def compute_source_version(csv_file, vectors=VECTOR_INDEX):
+    """Content hash of everything a build depends on: schema, allergens.json, nutrients.csv and the CSV."""
+    h = hashlib.sha256(f"schema:{SCHEMA_VERSION}\n".encode())
+    if vectors:
+        h.update(f"vectors:{VECTOR_DIM}\n".encode())
+    file_sha256(ALLERGENS_FILE, h)
+    file_sha256(NUTRIENTS_FILE, h)
+    return file_sha256(csv_file, h).hexdigest()
+
+def fetch_source(source):
+    """Return a local path for source, downloading URLs to LOCAL_CSV once."""
+    if not source.startswith(('http://', 'https://')):
+        return source
+    if not os.path.exists(LOCAL_CSV):
+        print(f"Downloading data from: {source}...")
+        urllib.request.urlretrieve(source, LOCAL_CSV + '.part')
+        os.replace(LOCAL_CSV + '.part', LOCAL_CSV)
+    return LOCAL_CSV
+
+def read_meta(db_file):
+    """Return the meta table of an existing DB as a dict ({} if missing or unreadable)."""
+    if not os.path.exists(db_file):
+        return {}
+    try:
+        con = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+        try:
+            return dict(con.execute("SELECT key, value FROM meta"))
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return {}
+
+def load_csv(cur, csv_file, allergen_matchers):
+    """Stream csv_file into the recipes table in chunks; returns the number of rows added."""
+    nutrients = NutrientTable(NUTRIENTS_FILE)
+    vocabulary = dict(cur.execute("SELECT name, id FROM tokens"))
+    total = 0
+    for chunk in pd.read_csv(csv_file, chunksize=CHUNK_SIZE):
+        rows, token_sets = prepare_chunk(chunk, allergen_matchers, nutrients)
+        last_id = cur.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'recipes'").fetchone()[0]
+        cur.executemany("""
+        INSERT INTO recipes (name, calories, protein_g, fat_g, carbs_g, instructions, ingredients_text, allergen_mask)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        recipe_ids = [r[0] for r in cur.execute("SELECT id FROM recipes WHERE id > ? ORDER BY id", (last_id,))]
+
+        # Map tokens to integer ids, growing the vocabulary as we go
+        new_tokens = {t for tokens in token_sets for t in tokens if t not in vocabulary}
+        for token in sorted(new_tokens):
+            vocabulary[token] = len(vocabulary) + 1
+        cur.executemany("INSERT INTO tokens (id, name) VALUES (?, ?)",
+                        [(vocabulary[t], t) for t in sorted(new_tokens)])
+        cur.executemany("INSERT INTO recipe_tokens (recipe_id, token_id) VALUES (?, ?)",
+                        [(recipe_id, vocabulary[t]) for recipe_id, tokens in zip(recipe_ids, token_sets) for t in tokens])
+        total += len(rows)
+        print(f"Inserted {total} recipes...")
+    return total
+
+def optimize_database(con):
+    """Ship the artifact pre-optimised: merged FTS segments, fresh stats, no free pages."""
+    print("Optimizing database...")
+    con.execute("INSERT INTO recipes_fts(recipes_fts) VALUES ('optimize')")
+    con.execute("ANALYZE")
+    con.commit()
+    con.execute("VACUUM")
+
+def load_allergen_synonyms():
+    with open(ALLERGENS_FILE, 'r') as f:
+        return json.load(f)
+
+def allergen_families(synonyms):
+    """The family -> bit map a build uses, stored in meta for Service B."""
+    return json.dumps({"bits": family_bits(synonyms), "synonyms": synonyms})
+
+def create_database(db_file=DB_FILE, source=DATASET_URL, vectors=VECTOR_INDEX):
+    """Build a fresh RecipeCorpus.db from source.
+
+    The DB is built next to db_file and moved into place only once it is
+    complete, so Service B never sees a half-built file and a failed build
+    leaves the previous DB untouched.
+    """
+    csv_file = fetch_source(source)
+    source_version = compute_source_version(csv_file, vectors)
+    # Allergen families are baked into the DB as one bit each (see allergen_index.py)
+    allergen_synonyms = load_allergen_synonyms()
+    allergen_matchers = build_matchers(allergen_synonyms)
+
     # 1. Clean Slate
-    if os.path.exists(DB_FILE):
-        os.remove(DB_FILE)
-        print(f"Removed old database: {DB_FILE}")
+    tmp_file = db_file + '.building'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
 
-    con = sqlite3.connect(DB_FILE)
+    con = sqlite3.connect(tmp_file)
     cur = con.cursor()
+    # The file is rebuilt from scratch on failure anyway, so skip journaling during the load
+    cur.execute("PRAGMA journal_mode = OFF")
+    cur.execute("PRAGMA synchronous = OFF")
 
     # 2. Create Tables
     print("Creating tables...")
@@ -26,8 +218,12 @@ def create_database():
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         name TEXT NOT NULL,
         calories INTEGER,
+        protein_g REAL,
+        fat_g REAL,
+        carbs_g REAL,
         instructions TEXT,
-        ingredients_text TEXT
+        ingredients_text TEXT,
+        allergen_mask INTEGER NOT NULL DEFAULT 0
     )
     """)
 
@@ -36,64 +232,157 @@ def create_database():
     USING fts5(name, ingredients_text, content='recipes', content_rowid='id')
     """)
 
-    cur.executescript("""
-    CREATE TRIGGER IF NOT EXISTS recipes_ai AFTER INSERT ON recipes BEGIN
-      INSERT INTO recipes_fts(rowid, name, ingredients_text) VALUES (new.id, new.name, new.ingredients_text);
-    END;
+    # Word tokens of title + ingredients (tokenised like recipes_fts, minus bare
+    # numbers) and which recipes contain each one. Not parsed ingredient names:
+    # it lets Service B exclude allergens missing from allergens.json with
+    # integer set operations instead of an FTS query per request.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS tokens (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS recipe_tokens (
+        recipe_id INTEGER NOT NULL,
+        token_id INTEGER NOT NULL,
+        PRIMARY KEY (recipe_id, token_id)
+    ) WITHOUT ROWID
     """)
 
-    # 3. Load Data Directly from URL
-    print(f"Downloading data from: {DATASET_URL}...")
+    # Build metadata. source_version decides whether a rebuild is needed at boot;
+    # build_version also changes on appends and keys Service B's candidate cache.
+    cur.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    cur.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+        ('source_version', source_version),
+        ('build_version', source_version),
+        # Service B reads the bits from here, not from its own allergens.json,
+        # so a DB kept after allergens.json changed can't be misread
+        ('allergen_families', allergen_families(allergen_synonyms)),
+    ])
+
+    # 3. Stream the CSV in chunks so memory stays bounded for any corpus size
+    print(f"Reading data from: {csv_file}...")
     try:
-        # Pandas can read directly from a URL!
-        df = pd.read_csv(DATASET_URL)
-        
-        print(f"Download complete. Processing {len(df)} rows...")
-        
-        # Normalize columns to lowercase (Title -> title, Instructions -> instructions)
-        df.columns = [c.lower().strip() for c in df.columns]
-        
-        recipes_to_insert = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Map the specific columns from this dataset
-                # The dataset uses: 'Title', 'Ingredients', 'Instructions'
-                title = row.get('title', 'Unknown')
-                ingredients = row.get('ingredients', '')
-                instructions = row.get('instructions', '')
-                
-                # Skip invalid rows
-                if pd.isna(title) or pd.isna(ingredients):
-                    continue
-
-                # Generate dummy calories (dataset doesn't have them)
-                # Logic: longer ingredient list = more calories
-                estimated_cal = int(len(str(ingredients)) * 1.5)
-                if estimated_cal > 1200: estimated_cal = 1200
-                if estimated_cal < 100: estimated_cal = 150
-
-                recipes_to_insert.append((
-                    str(title), 
-                    estimated_cal, 
-                    str(instructions), 
-                    str(ingredients)
-                ))
-            except Exception as e:
-                pass # Skip bad rows
-
-        if recipes_to_insert:
-            print(f"Inserting {len(recipes_to_insert)} recipes into SQLite...")
-            cur.executemany("INSERT INTO recipes (name, calories, instructions, ingredients_text) VALUES (?, ?, ?, ?)", recipes_to_insert)
-            con.commit()
-            print(f"Success! Database populated with {len(recipes_to_insert)} recipes.")
-        else:
+        total = load_csv(cur, csv_file, allergen_matchers)
+        if not total:
             print("No recipes found. Check the column names.")
+            con.close()
+            os.remove(tmp_file)
+            return False
+
+        # 4. Build the full-text index in one pass instead of row by row
+        print("Building FTS index...")
+        cur.execute("INSERT INTO recipes_fts(recipes_fts) VALUES ('rebuild')")
+
+        # Range filters in Service B ("under 500 cal", "at least 30g protein") seek these
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_recipes_calories ON recipes(calories)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_recipes_protein ON recipes(protein_g)")
+        # Inverted index: token id -> recipe ids, used by the safety filter
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_recipe_tokens_token ON recipe_tokens(token_id, recipe_id)")
+
+        # 5. Optional vector index, named after this build so it swaps with the DB
+        if vectors:
+            print("Building vector index...")
+            build_vectors(con, db_file, source_version)
+        con.commit()
+        optimize_database(con)
+        con.close()
+
+        os.replace(tmp_file, db_file)
+        remove_stale_vectors(db_file, source_version if vectors else None)
+        print(f"Success! Database populated with {total} recipes (version {source_version[:12]}).")
+        return True
 
     except Exception as e:
         print(f"Error downloading/processing CSV: {e}")
-    
-    con.close()
+        con.close()
+        os.remove(tmp_file)
+        remove_stale_vectors(db_file, read_meta(db_file).get('build_version'))
+        return False
+
+def ensure_database(db_file=DB_FILE, source=DATASET_URL, force=False, vectors=VECTOR_INDEX):
+    """Reuse db_file if it was built from exactly this source; otherwise rebuild it."""
+    try:
+        csv_file = fetch_source(source)
+    except Exception as e:
+        # Offline with no local CSV: an existing DB is better than none. Service B
+        # reads its allergen bits from its meta, so a newer allergens.json can't shift them
+        if read_meta(db_file):
+            print(f"Could not fetch {source} ({e}); keeping existing database.")
+            return True
+        print(f"Error downloading CSV: {e}")
+        return False
+
+    if not force and read_meta(db_file).get('source_version') == compute_source_version(csv_file, vectors):
+        print(f"Database is up to date: {db_file}")
+        return True
+    return create_database(db_file, csv_file, vectors)
+
+def append_recipes(csv_file, db_file=DB_FILE):
+    """Add the recipes in csv_file to an existing DB without a full rebuild.
+
+    Works on a copy that replaces db_file atomically, because Service B opens
+    the DB as immutable. A later full rebuild (new source/schema) drops appends.
+    """
+    meta = read_meta(db_file)
+    if not meta:
+        print(f"No database to append to at {db_file}")
+        return False
+
+    tmp_file = db_file + '.building'
+    shutil.copyfile(db_file, tmp_file)
+    con = sqlite3.connect(tmp_file)
+    cur = con.cursor()
+
+    try:
+        first_new_id = cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM recipes").fetchone()[0]
+        # Appended rows use the same families and bits as the rest of the DB
+        if 'allergen_families' in meta:
+            allergen_synonyms = json.loads(meta['allergen_families'])['synonyms']
+        else:
+            allergen_synonyms = load_allergen_synonyms()
+        total = load_csv(cur, csv_file, build_matchers(allergen_synonyms))
+
+        # Index only the new rows
+        cur.execute("""
+        INSERT INTO recipes_fts(rowid, name, ingredients_text)
+        SELECT id, name, ingredients_text FROM recipes WHERE id >= ?
+        """, (first_new_id,))
+
+        build_version = file_sha256(csv_file, hashlib.sha256(meta['build_version'].encode())).hexdigest()
+        cur.execute("INSERT OR REPLACE INTO meta VALUES ('build_version', ?)", (build_version,))
+        # IDF weights shift with the corpus, so the vector index is rebuilt whole
+        if 'vector_dim' in meta:
+            build_vectors(con, db_file, build_version, int(meta['vector_dim']))
+        con.commit()
+        optimize_database(con)
+        con.close()
+
+        os.replace(tmp_file, db_file)
+        remove_stale_vectors(db_file, build_version if 'vector_dim' in meta else None)
+        print(f"Appended {total} recipes (version {build_version[:12]}).")
+        return True
+
+    except Exception as e:
+        print(f"Error appending CSV: {e}")
+        con.close()
+        os.remove(tmp_file)
+        remove_stale_vectors(db_file, meta['build_version'] if 'vector_dim' in meta else None)
+        return False
 
 if __name__ == "__main__":
-    create_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build or update RecipeCorpus.db")
+    parser.add_argument('--source', default=os.environ.get('RECIPES_CSV', DATASET_URL),
+                        help="CSV path or URL (default: $RECIPES_CSV, else the 13k dataset)")
+    parser.add_argument('--force', action='store_true', help="rebuild even if the DB is up to date")
+    parser.add_argument('--append', metavar='CSV', help="add recipes from CSV to the existing DB")
+    parser.add_argument('--vectors', action='store_true', default=VECTOR_INDEX,
+                        help="also build the semantic vector index (default: $VECTOR_INDEX=1)")
+    args = parser.parse_args()
+
+    if args.append:
+        ok = append_recipes(args.append)
+    else:
+        ok = ensure_database(source=args.source, force=args.force, vectors=args.vectors)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,90 @@
+"""Long-lived, per-thread SQLite connections with tuned pragmas.
+
+Shared by Services A, B and C. Each service is built from its own Docker
+context, so each ships a copy of this file -- keep the copies identical.
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+# Tuning applied to every pooled connection
+CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", 16000))
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+CACHED_STATEMENTS = 256  # prepared statements kept per connection, keyed by SQL text
+BUSY_TIMEOUT_MS = 5000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Hands every thread its own connection to one database file, reused across requests.
+
+    Writable pools use WAL so readers never block on a writer. Read-only pools
+    open the file as immutable, which lets SQLite skip locking and change
+    detection entirely -- only safe for files nobody writes to while we run.
+    """
+
+    def __init__(self, db_file, read_only=False, row_factory=None):
+        self.db_file = db_file
+        self.read_only = read_only
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def _open(self):
+        if self.read_only:
+            uri = f"{Path(self.db_file).resolve().as_uri()}?mode=ro&immutable=1"
+            con = sqlite3.connect(uri, uri=True, cached_statements=CACHED_STATEMENTS)
+            con.execute("PRAGMA query_only = ON")
+        else:
+            con = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000,
+                                  cached_statements=CACHED_STATEMENTS)
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = NORMAL")
+
+        con.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        con.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        con.execute("PRAGMA temp_store = MEMORY")
+        if self.row_factory:
+            con.row_factory = self.row_factory
+        return con
+
+    def _file_id(self):
+        # Immutable DBs are only ever replaced wholesale (os.replace), which
+        # gives the path a new inode; that is our cue to reopen.
+        if not self.read_only:
+            return None
+        st = os.stat(self.db_file)
+        return (st.st_ino, st.st_mtime_ns)
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use, after a fork,
+        or after a read-only DB file was swapped for a new build."""
+        local = self._local
+        file_id = self._file_id()
+        if getattr(local, 'pid', None) != os.getpid() or local.file_id != file_id:
+            local.con = self._open()
+            local.pid = os.getpid()
+            local.file_id = file_id
+        return local.con
+
+    def reset(self):
+        """Roll back anything the current request left uncommitted."""
+        con = getattr(self._local, 'con', None)
+        if con is not None and getattr(self._local, 'pid', None) == os.getpid() and con.in_transaction:
+            con.rollback()
+
+
+def get_pool(db_file, read_only=False, row_factory=None):
+    """Return the process-wide pool for db_file, creating it on first use.
+
+    Callers asking for different row factories get separate pools, so one
+    caller's choice never changes the rows another caller sees.
+    """
+    key = (os.path.abspath(db_file), read_only, row_factory)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_file, read_only=read_only, row_factory=row_factory)
+        return pool
@@ -0,0 +1,183 @@
+"""Hashed n-gram TF-IDF vectors for semantic recipe search.
+
+setup_db.py writes one L2-normalised row per recipe into a .npy file next
+to the DB, named after the DB's build_version so an atomic DB swap never
+pairs it with the wrong matrix. Service B opens it with mmap_mode='r', so
+every gunicorn worker shares the same page-cache copy. Term IDF weights
+live in the DB's vector_terms table.
+"""
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from allergen_index import tokenize
+
+# Columns per recipe vector; features are hashed into these with a random sign
+VECTOR_DIM = int(os.environ.get("VECTOR_DIM", 512))
+
+# Features seen in fewer recipes than this are dropped from the vocabulary
+MIN_DF = 2
+
+# FTS operators that show up in LLM-made queries but carry no meaning
+QUERY_STOPWORDS = {"or", "and", "not", "near"}
+
+# Recipes per batch while writing the matrix
+BUILD_BATCH = 2000
+
+
+def features(text, stopwords=()):
+    """Counter of word unigrams, word bigrams and per-word char trigrams.
+
+    Trigrams let "tomatoes" and "tomato" (or typos) still overlap.
+    """
+    tokens = [t for t in tokenize(text) if t not in stopwords]
+    feats = list(tokens)
+    feats += [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for t in tokens:
+        padded = f"<{t}>"
+        feats += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return Counter(feats)
+
+
+def vectorize(counts, idf, dim):
+    vec = np.zeros(dim, dtype=np.float32)
+    for feat, n in counts.items():
+        weight = idf.get(feat)
+        if weight is None:
+            continue
+        h = zlib.crc32(feat.encode())
+        vec[h % dim] += (1.0 if h & 0x80000000 else -1.0) * (1 + math.log(n)) * weight
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def vector_paths(db_file, build_version):
+    prefix = f"{db_file}.{build_version[:16]}"
+    return prefix + ".vectors.npy", prefix + ".vector_ids.npy"
+
+
+def build_vectors(con, db_file, build_version, dim=VECTOR_DIM):
+    """Write the vector files for the recipes in con and fill vector_terms.
+
+    Returns the number of recipe vectors written.
+    """
+    def documents():
+        return con.execute("SELECT id, name, ingredients_text FROM recipes ORDER BY id")
+
+    # Pass 1: document frequencies
+    df = Counter()
+    n_docs = 0
+    for _, name, ingredients in documents():
+        df.update(features(f"{name} {ingredients}").keys())
+        n_docs += 1
+    idf = {f: math.log((1 + n_docs) / (1 + n)) + 1 for f, n in df.items() if n >= MIN_DF}
+    del df
+
+    con.execute("DROP TABLE IF EXISTS vector_terms")
+    con.execute("CREATE TABLE vector_terms (term TEXT PRIMARY KEY, idf REAL NOT NULL) WITHOUT ROWID")
+    con.executemany("INSERT INTO vector_terms VALUES (?, ?)", idf.items())
+    con.execute("INSERT OR REPLACE INTO meta VALUES ('vector_dim', ?)", (str(dim),))
+
+    # Pass 2: one row per recipe, written straight to disk. A forced rebuild
+    # reuses the version (and file name), and running workers may have the old
+    # file mapped, so write aside and swap it in.
+    matrix_file, ids_file = vector_paths(db_file, build_version)
+    matrix = open_memmap(matrix_file + '.building', mode='w+', dtype=np.float32, shape=(n_docs, dim))
+    ids = np.empty(n_docs, dtype=np.int64)
+    for row, (recipe_id, name, ingredients) in enumerate(documents()):
+        ids[row] = recipe_id
+        matrix[row] = vectorize(features(f"{name} {ingredients}"), idf, dim)
+        if row % BUILD_BATCH == 0:
+            matrix.flush()
+    matrix.flush()
+    del matrix
+    with open(ids_file + '.building', 'wb') as f:
+        np.save(f, ids)
+    os.replace(matrix_file + '.building', matrix_file)
+    os.replace(ids_file + '.building', ids_file)
+    return n_docs
+
+
+def remove_stale_vectors(db_file, keep_version=None):
+    """Delete vector files left by older builds of db_file."""
+    directory, base = os.path.split(os.path.abspath(db_file))
+    keep = set(vector_paths(os.path.join(directory, base), keep_version)) if keep_version else set()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(base + ".") and name.endswith((".vectors.npy", ".vector_ids.npy")) and path not in keep:
+            os.remove(path)
+
+
+class VectorIndex:
+    """Read-only view of one build's vector files."""
+
+    def __init__(self, matrix_file, ids_file):
+        self.matrix = np.load(matrix_file, mmap_mode='r')
+        self.ids = np.load(ids_file)
+        self.dim = self.matrix.shape[1]
+
+    def query_vectors(self, cur, texts):
+        """One normalised row per text; all-zero if no word is in the vocabulary."""
+        counts = [features(t, QUERY_STOPWORDS) for t in texts]
+        terms = sorted(set().union(*counts)) if counts else []
+        idf = {}
+        for i in range(0, len(terms), 500):
+            batch = terms[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            idf.update(cur.execute(f"SELECT term, idf FROM vector_terms WHERE term IN ({placeholders})", batch))
+        return np.stack([vectorize(c, idf, self.dim) for c in counts]) if counts else np.zeros((0, self.dim))
+
+    def scores(self, query_vectors):
+        """Cosine similarity of every recipe to each query: shape (recipes, queries)."""
+        return np.asarray(self.matrix @ np.asarray(query_vectors, dtype=np.float32).T)
+
+    def top_k(self, scores, candidate_ids, k, boost_ids=()):
+        """Ids of the k best-scoring candidates with a positive score.
+
+        boost_ids (e.g. lexical matches in hybrid mode) rank above the rest.
+        """
+        if not len(candidate_ids):
+            return []
+        candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, candidate_ids)
+        rows = np.minimum(rows, len(self.ids) - 1)
+        known = self.ids[rows] == candidate_ids
+        candidate_ids, rows = candidate_ids[known], rows[known]
+
+        ranked = scores[rows].astype(np.float64)
+        if len(boost_ids):
+            ranked += np.isin(candidate_ids, np.fromiter(boost_ids, dtype=np.int64)) * 2.0
+        positive = ranked > 0
+        candidate_ids, ranked = candidate_ids[positive], ranked[positive]
+
+        if len(ranked) > k:
+            best = np.argpartition(-ranked, k - 1)[:k]
+            candidate_ids, ranked = candidate_ids[best], ranked[best]
+        order = np.argsort(-ranked, kind='stable')
+        return candidate_ids[order].tolist()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_file, build_version):
+    """The VectorIndex for this build of db_file, or None if it wasn't built."""
+    if not build_version:
+        return None
+    key = (os.path.abspath(db_file), build_version)
+    with _indexes_lock:
+        if key not in _indexes:
+            matrix_file, ids_file = vector_paths(db_file, build_version)
+            if not (os.path.exists(matrix_file) and os.path.exists(ids_file)):
+                return None
+            # Drop the previous build's mapping when the DB is swapped
+            for old in [k for k in _indexes if k[0] == key[0]]:
+                del _indexes[old]
+            _indexes[key] = VectorIndex(matrix_file, ids_file)
+        return _indexes[key]
@@ -1,11 +1,18 @@
 import os
 import requests
-import google.generativeai as genai
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
+import ast
 import json
 import time
+import re
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TTLCache
+from keyword_expander import KeywordExpander
+from prompt_budget import PromptBudget, estimate_tokens
+from llm_scheduler import LLMScheduler, QueueTimeout, STREAM, KEYWORDS
+from llm_backends import load_models
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
@@ -13,7 +20,44 @@ app = Flask(__name__)
 # Enable CORS for everything
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-SERVICE_B_URL = "http://127.0.0.1:5001/filter_recipes"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONCEPTS_FILE = os.path.join(BASE_DIR, 'concepts.json')
+
+SERVICE_B_BASE_URL = os.environ.get("SERVICE_B_BASE_URL", "http://127.0.0.1:5001").rstrip("/")
+SERVICE_B_URL = f"{SERVICE_B_BASE_URL}/filter_recipes"
+SERVICE_B_RECIPE_URL = f"{SERVICE_B_BASE_URL}/recipes"
+
+# Searches return compact candidate summaries; only the recipe we pick is
+# fetched in full, which keeps both the JSON and the prompt small
+SUMMARY_FIELDS = ["id", "name", "calories", "protein_g", "ingredients"]
+SUMMARY_MAX_CHARS = int(os.environ.get("SUMMARY_MAX_CHARS", 160))
+
+# Service B ranking. "ranked" orders keyword matches by BM25, with a little
+# temperature so repeat questions still vary and some diversity across dishes.
+# "semantic" or "hybrid" use Service B's vector index (built with
+# VECTOR_INDEX=1) and search on the raw message, skipping the Flash keyword call
+SEARCH_MODE = os.environ.get("SERVICE_B_SEARCH_MODE", "ranked")
+SEARCH_TEMPERATURE = float(os.environ.get("SEARCH_TEMPERATURE", 0.2))
+SEARCH_DIVERSITY = float(os.environ.get("SEARCH_DIVERSITY", 0.3))
+RAW_QUERY_MODES = ("semantic", "hybrid")
+
+# One keep-alive pool to Service B, sized so every gunicorn thread can hold a connection
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", 4))
+
+def create_service_b_session():
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=GUNICORN_THREADS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+service_b_session = create_service_b_session()
+
+# Which models answer: "gemini" (default), "mock" (offline, deterministic,
+# streamed at MOCK_TOKENS_PER_SECOND), "record" (Gemini, saving responses to
+# LLM_CASSETTE) or "replay" (answers from LLM_CASSETTE, no API key needed)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", os.path.join(BASE_DIR, 'llm_cassette.jsonl'))
 
 # Global variables to hold models
 fast_model = None
@@ -22,44 +66,321 @@ smart_model = None
 def configure_models():
     global fast_model, smart_model
     try:
-        api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
-            print("CRITICAL: GOOGLE_API_KEY not found in environment!")
-            return False
-            
-        genai.configure(api_key=api_key)
-        
-        # Initialize models
-        fast_model = genai.GenerativeModel('gemini-2.5-flash')
-        smart_model = genai.GenerativeModel('gemini-2.5-pro')
-        print("Gemini Models Initialized")
+        fast_model, smart_model = load_models(
+            LLM_BACKEND,
+            cassette_file=LLM_CASSETTE,
+            tokens_per_second=float(os.environ.get("MOCK_TOKENS_PER_SECOND", 50)),
+            first_token_latency=float(os.environ.get("MOCK_FIRST_TOKEN_LATENCY", 0.3)),
+            replay_speed=float(os.environ.get("LLM_REPLAY_SPEED", 1.0)),
+        )
+        print(f"LLM Models Initialized (backend: {LLM_BACKEND})")
         return True
     except Exception as e:
-        print(f"Model Init Error: {e}")
+        print(f"CRITICAL: Model Init Error: {e}")
         return False
 
 # Initialize on startup
 models_ready = configure_models()
 
-def get_smart_keywords(user_msg):
+# All Gemini calls share one rate limiter per process. Match the rate to the
+# API tier divided by the number of processes; keyword extraction only waits
+# KEYWORD_QUEUE_TIMEOUT for a slot before searching on the raw message.
+llm_scheduler = LLMScheduler(
+    rate_per_minute=float(os.environ.get("LLM_RATE_PER_MINUTE", 10)),
+    burst=int(os.environ.get("LLM_BURST", 10)),
+    max_retries=int(os.environ.get("LLM_MAX_RETRIES", 3)),
+)
+STREAM_QUEUE_TIMEOUT = float(os.environ.get("STREAM_QUEUE_TIMEOUT", 30))
+KEYWORD_QUEUE_TIMEOUT = float(os.environ.get("KEYWORD_QUEUE_TIMEOUT", 3))
+
+# Local concept dictionary: resolves common requests without calling Flash
+keyword_expander = KeywordExpander(CONCEPTS_FILE)
+
+# Token budget for each /generate turn: history, prompt template and recipes
+prompt_budget = PromptBudget(
+    total_tokens=int(os.environ.get("PROMPT_TOKEN_BUDGET", 3000)),
+    history_tokens=int(os.environ.get("HISTORY_TOKEN_BUDGET", 1000)),
+    recent_turns=int(os.environ.get("HISTORY_RECENT_TURNS", 4)),
+)
+
+# Keyword extraction results, keyed by normalised message. Set KEYWORD_CACHE_DB
+# to a file path to persist them and share them across gunicorn workers.
+keyword_cache = TTLCache(
+    "keywords",
+    max_size=int(os.environ.get("KEYWORD_CACHE_SIZE", 2048)),
+    ttl=int(os.environ.get("KEYWORD_CACHE_TTL", 24 * 3600)),
+    db_file=os.environ.get("KEYWORD_CACHE_DB") or None,
+)
+
+# Opt-in (ANSWER_CACHE=1): finished answers to history-free requests, keyed by
+# message, calorie limit and allergen set, replayed without Flash or Service B.
+# Set ANSWER_CACHE_DB to share them across gunicorn workers.
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "0") == "1"
+answer_cache = TTLCache(
+    "answers",
+    max_size=int(os.environ.get("ANSWER_CACHE_SIZE", 512)),
+    ttl=int(os.environ.get("ANSWER_CACHE_TTL", 3600)),
+    db_file=(os.environ.get("ANSWER_CACHE_DB") or None) if ANSWER_CACHE_ENABLED else None,
+)
+# Characters per NDJSON line when replaying a cached answer
+REPLAY_CHUNK_CHARS = 80
+
+def normalise_message(user_msg):
+    """Lowercase and strip punctuation/extra spaces so equivalent requests share a cache key."""
+    return " ".join(re.findall(r"[^\W_]+", user_msg.lower()))
+
+def get_cached_keywords(user_msg):
+    """Keywords we can produce without an LLM call (local dictionary, then cache), or None."""
+    local_keywords = keyword_expander.expand(user_msg)
+    if local_keywords:
+        return local_keywords
+
+    cache_key = normalise_message(user_msg)
+    return keyword_cache.get(cache_key) if cache_key else None
+
+def build_keyword_prompt(user_msg):
+    # IMPROVED PROMPT: Translates concepts like "High Protein" into searchable ingredients
+    return f"""
+    TASK: Convert the user's request into a list of specific search ingredients.
+    REQUEST: "{user_msg}"
+    OUTPUT: Space-separated keywords only. No commas.
+    
+    EXAMPLES:
+    - "High Protein" -> chicken beef pork fish tofu beans eggs
+    - "Vegetarian" -> vegetable tofu beans rice pasta
+    - "Italian" -> pasta tomato basil cheese
+    """
+
+def remember_keywords(user_msg, response_text):
+    """Clean up the model's keyword answer and cache it for next time."""
+    keywords = response_text.strip().replace(",", "")
+    cache_key = normalise_message(user_msg)
+    if cache_key:
+        keyword_cache.set(cache_key, keywords)
+    return keywords
+
+def extract_keywords_with_llm(user_msg):
     if not fast_model: return user_msg
+    prompt = build_keyword_prompt(user_msg)
+
+    def ask_llm():
+        response = llm_scheduler.call(lambda: fast_model.generate_content(prompt),
+                                      priority=KEYWORDS, timeout=KEYWORD_QUEUE_TIMEOUT)
+        return remember_keywords(user_msg, response.text)
+
     try:
-        # IMPROVED PROMPT: Translates concepts like "High Protein" into searchable ingredients
-        prompt = f"""
-        TASK: Convert the user's request into a list of specific search ingredients.
-        REQUEST: "{user_msg}"
-        OUTPUT: Space-separated keywords only. No commas.
-        
-        EXAMPLES:
-        - "High Protein" -> chicken beef pork fish tofu beans eggs
-        - "Vegetarian" -> vegetable tofu beans rice pasta
-        - "Italian" -> pasta tomato basil cheese
-        """
-        response = fast_model.generate_content(prompt)
-        return response.text.strip().replace(",", "")
-    except:
+        # Concurrent users asking the same thing share one Flash call
+        return llm_scheduler.coalesce(normalise_message(user_msg) or prompt, ask_llm)
+    except Exception:
         return user_msg
 
+def to_search_query(raw_keywords):
+    return " OR ".join([f'"{t}"' for t in raw_keywords.split()]) if raw_keywords else ""
+
+def build_search_payload(max_cal, allergens, query, fallback_queries=()):
+    b_payload = {"max_calories": max_cal, "allergens": allergens, "query": query,
+                 "fields": SUMMARY_FIELDS, "max_chars": SUMMARY_MAX_CHARS}
+    if SEARCH_MODE != "lexical":
+        b_payload["mode"] = SEARCH_MODE
+    if SEARCH_MODE == "ranked":
+        b_payload["temperature"] = SEARCH_TEMPERATURE
+        b_payload["diversity"] = SEARCH_DIVERSITY
+    if fallback_queries:
+        b_payload["fallback_queries"] = list(fallback_queries)
+    return b_payload
+
+def search_service_b(max_cal, allergens, query, fallback_queries=()):
+    """POST one search to Service B; any failure is logged and treated as no results."""
+    try:
+        b_payload = build_search_payload(max_cal, allergens, query, fallback_queries)
+        response = service_b_session.post(SERVICE_B_URL, json=b_payload, timeout=10)
+        return response.json().get('safe_recipes', [])
+    except Exception as e:
+        print(f"Service B Warning: {e}")
+        return []
+
+# Runs speculative Service B searches alongside keyword extraction
+search_executor = ThreadPoolExecutor(max_workers=GUNICORN_THREADS)
+
+def find_safe_recipes(user_msg, max_cal, allergens):
+    """Retrieve safe recipes for a message, falling back to a profile-only search.
+
+    If the keywords are available locally we make one call and let Service B
+    run the fallback. Otherwise the profile-only search starts right away, in
+    parallel with the Flash call, so a keyword miss costs no extra round trip.
+    In semantic/hybrid SEARCH_MODE the raw message is searched directly.
+    """
+    raw_keywords = get_cached_keywords(user_msg)
+    if raw_keywords is not None:
+        return search_service_b(max_cal, allergens, to_search_query(raw_keywords), fallback_queries=[""])
+    if SEARCH_MODE in RAW_QUERY_MODES:
+        return search_service_b(max_cal, allergens, user_msg, fallback_queries=[""])
+
+    speculative = search_executor.submit(search_service_b, max_cal, allergens, "")
+    raw_keywords = extract_keywords_with_llm(user_msg)
+    safe_recipes = search_service_b(max_cal, allergens, to_search_query(raw_keywords))
+
+    if safe_recipes:
+        speculative.cancel()
+        return safe_recipes
+    return speculative.result()
+
+def fetch_recipe(recipe_id):
+    """Full text of one recipe from Service B, or None."""
+    try:
+        response = service_b_session.get(f"{SERVICE_B_RECIPE_URL}/{int(recipe_id)}", timeout=10)
+        return response.json() if response.ok else None
+    except Exception as e:
+        print(f"Service B Warning: {e}")
+        return None
+
+def rank_recipes(user_msg, safe_recipes):
+    """Candidates by how many words they share with the message (ties keep sample order)."""
+    words = set(re.findall(r"[^\W_]+", user_msg.lower()))
+
+    def overlap(r):
+        text = f"{r.get('name', '')} {r.get('ingredients', '')}".lower()
+        return len(words & set(re.findall(r"[^\W_]+", text)))
+
+    return sorted(safe_recipes, key=overlap, reverse=True)
+
+def pick_recipe(user_msg, safe_recipes):
+    ranked = rank_recipes(user_msg, safe_recipes)
+    return ranked[0] if ranked else None
+
+def answer_cache_key(user_msg, history, max_cal, allergens):
+    """Cache key for a /generate request, or None if it mustn't be cached.
+
+    Follow-ups depend on the conversation, so only history-free requests
+    qualify. The full allergen set is part of the key: an answer is only
+    ever replayed to a profile with exactly the same exclusions. Allergens are
+    normalised only as far as Service B's resolve_exclusions does (lowercase,
+    stripped), since "tree nuts" and "tree-nuts" can resolve differently.
+    """
+    if not ANSWER_CACHE_ENABLED or history or not isinstance(allergens, list):
+        return None
+    if not all(isinstance(a, str) for a in allergens):
+        return None
+    message = normalise_message(user_msg)
+    if not message:
+        return None
+    try:
+        max_cal = int(max_cal)
+    except (TypeError, ValueError):
+        return None
+    exclusions = sorted({a.lower().strip() for a in allergens} - {""})
+    return json.dumps([message, max_cal, exclusions])
+
+def replay_chunks(text):
+    """Split a cached answer into stream-sized pieces."""
+    return [text[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(text), REPLAY_CHUNK_CHARS)]
+
+def ndjson(text):
+    """One line of the /generate wire format."""
+    return json.dumps({"text": text}) + "\n"
+
+def recipe_line(r):
+    line = f"- {r['name']} ({r['calories']} cal) | Ing: {r.get('ingredients', '')}"
+    if r.get('instructions'):
+        line += f" | Instr: {r['instructions']}"
+    return line + "\n"
+
+def build_prompt(user_msg, max_cal, allergens, safe_recipes, full_recipe=None, recipe_tokens=None):
+    """full_recipe, if given, is listed first with its complete text; the
+    other candidates stay as compact summaries. recipe_tokens caps the list."""
+    recipe_context = "SYSTEM NOTE: Database returned 0 safe recipes."
+    if safe_recipes:
+        lines = [recipe_line(full_recipe)] if full_recipe else []
+        lines += [recipe_line(r) for r in safe_recipes
+                  if not (full_recipe and r.get('id') == full_recipe.get('id'))]
+        if recipe_tokens is not None:
+            lines = prompt_budget.fit_lines(lines, recipe_tokens)
+        recipe_context = "AVAILABLE RECIPES:\n" + "".join(lines)
+
+    # IMPROVED PROMPT: Explicit substitution rules
+    system_instruction = f"""
+    ROLE: Expert Culinary Consultant (Safety Focused).
+    USER PROFILE: Max Calories: {max_cal} | Allergens: {allergens}
+    CONTEXT: {recipe_context}
+    
+    INSTRUCTIONS:
+    1. Select the BEST recipe matching "{user_msg}".
+    2. SUBSTITUTION: If ingredients conflict with allergies, substitute them.
+       - If Gluten-Free & Soy Sauce found -> Replace with "Tamari".
+       - If Dairy-Free & Butter found -> Replace with "Olive Oil".
+       - If Peanut-Free & Peanut Butter found -> Replace with "Sunflower Butter".
+    3. FORMATTING: Use Markdown headers (##) and bullets (*).
+    
+    REQUIRED FORMAT:
+    ## [Recipe Name] ([Calories] cal)
+    > *[Description]*
+    ### Ingredients
+    * [List with Substitutions Applied]
+    ### Instructions
+    1. [Steps]
+    ---
+    **Safety Check:** [State any substitutions made]
+    """
+    
+    full_prompt = f"{system_instruction}\nUSER MESSAGE: {user_msg}"
+    return full_prompt
+
+def assemble_prompt(user_msg, history, max_cal, allergens, safe_recipes, full_recipe=None):
+    """Return (prompt, history) trimmed to prompt_budget.
+
+    History is trimmed first; the recipes, best match first, get whatever
+    the history and the prompt template leave over.
+    """
+    history, history_tokens = prompt_budget.trim_history(history)
+    overhead = estimate_tokens(build_prompt(user_msg, max_cal, allergens, []))
+    recipe_tokens = max(prompt_budget.total_tokens - history_tokens - overhead, 0)
+
+    full_prompt = build_prompt(user_msg, max_cal, allergens, rank_recipes(user_msg, safe_recipes),
+                               full_recipe, recipe_tokens)
+    prompt_budget.record(estimate_tokens(full_prompt) + history_tokens)
+    return full_prompt, history
+
+def ingredient_list(ingredients_text):
+    """The dataset stores ingredients as a stringified Python list."""
+    try:
+        items = ast.literal_eval(ingredients_text)
+        if isinstance(items, (list, tuple)):
+            return [str(i) for i in items]
+    except (ValueError, SyntaxError):
+        pass
+    return [line.strip() for line in str(ingredients_text).split("\n") if line.strip()]
+
+def fallback_recipe_text(recipe):
+    """Markdown for a recipe straight from Service B, served when Gemini is unavailable.
+
+    Service B already filtered it against the user's allergens and calorie
+    limit, unlike any fixed fallback we could ship.
+    """
+    ingredients = "\n".join(f"* {item}" for item in ingredient_list(recipe.get('ingredients', '')))
+    return f"""## {recipe['name']} ({recipe['calories']} cal)
+> *Straight from our recipe database while the AI service is busy*
+
+### Ingredients
+{ingredients}
+
+### Instructions
+{recipe.get('instructions', '')}
+
+---
+**Safety Check:** Selected by the safety filter for your allergens and calorie limit; no substitutions were needed."""
+
+def llm_error_chunks(e, fallback_recipe=None):
+    """Text chunks to stream when the LLM call fails part-way."""
+    error_str = str(e)
+    print(f"LLM Error: {error_str[:200]}")
+    # Quota still exhausted after the scheduler's retries
+    if isinstance(e, QueueTimeout) or "429" in error_str or "quota" in error_str.lower():
+        if fallback_recipe and fallback_recipe.get('instructions'):
+            return ["\n**Note:** AI service is busy. Here is a safe recipe from our database instead.\n",
+                    fallback_recipe_text(fallback_recipe)]
+        return ["\n**Note:** AI service quota exceeded and no safe recipe matched your profile. Please try again in a minute."]
+    return [f"\n**AI Error:** {error_str[:150]}"]
+
 @app.route('/generate', methods=['POST'])
 def generate_response():
     data = request.get_json()
@@ -71,108 +392,46 @@ def generate_response():
 
     def generate():
         # 1. CRITICAL HEARTBEAT
-        yield json.dumps({"text": ""}) + "\n"
+        yield ndjson("")
+
+        max_cal = profile.get('calorie_limit', 2000)
+        allergens = profile.get('allergens', [])
+
+        cache_key = answer_cache_key(user_msg, history, max_cal, allergens)
+        cached = answer_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            for text in replay_chunks(cached):
+                yield ndjson(text)
+            return
 
         # 2. CHECK SETUP
         if not models_ready or not smart_model:
-            yield json.dumps({"text": "System Error: AI models not configured. Check API Key."}) + "\n"
+            yield ndjson("System Error: AI models not configured. Check API Key or LLM_BACKEND.")
             return
 
         # 3. LOGIC
-        raw_keywords = get_smart_keywords(user_msg)
-        search_query = " OR ".join([f'"{t}"' for t in raw_keywords.split()]) if raw_keywords else ""
-        
-        max_cal = profile.get('calorie_limit', 2000)
-        allergens = profile.get('allergens', [])
-
-        safe_recipes = []
-        try:
-            b_payload = {"max_calories": max_cal, "allergens": allergens, "query": search_query}
-            response = requests.post(SERVICE_B_URL, json=b_payload, timeout=10)
-            safe_recipes = response.json().get('safe_recipes', [])
-            
-            # Fallback
-            if not safe_recipes:
-                b_payload["query"] = "" 
-                response = requests.post(SERVICE_B_URL, json=b_payload, timeout=10)
-                safe_recipes = response.json().get('safe_recipes', [])
-        except Exception as e:
-            print(f"Service B Warning: {e}")
-
-        recipe_context = "SYSTEM NOTE: Database returned 0 safe recipes."
-        if safe_recipes:
-            recipe_context = "AVAILABLE RECIPES:\n"
-            for r in safe_recipes:
-                recipe_context += f"- {r['name']} ({r['calories']} cal) | Ing: {r['ingredients']} | Instr: {r['instructions']}\n"
+        safe_recipes = find_safe_recipes(user_msg, max_cal, allergens)
+        chosen = pick_recipe(user_msg, safe_recipes)
+        full_recipe = fetch_recipe(chosen['id']) if chosen and 'id' in chosen else None
+        full_prompt, history_used = assemble_prompt(user_msg, history, max_cal, allergens, safe_recipes, full_recipe)
 
         # 4. STREAMING GENERATION - Use flash model (better free tier quotas)
-        chat = fast_model.start_chat(history=history)
-        
-        # IMPROVED PROMPT: Explicit substitution rules
-        system_instruction = f"""
-        ROLE: Expert Culinary Consultant (Safety Focused).
-        USER PROFILE: Max Calories: {max_cal} | Allergens: {allergens}
-        CONTEXT: {recipe_context}
-        
-        INSTRUCTIONS:
-        1. Select the BEST recipe matching "{user_msg}".
-        2. SUBSTITUTION: If ingredients conflict with allergies, substitute them.
-           - If Gluten-Free & Soy Sauce found -> Replace with "Tamari".
-           - If Dairy-Free & Butter found -> Replace with "Olive Oil".
-           - If Peanut-Free & Peanut Butter found -> Replace with "Sunflower Butter".
-        3. FORMATTING: Use Markdown headers (##) and bullets (*).
-        
-        REQUIRED FORMAT:
-        ## [Recipe Name] ([Calories] cal)
-        > *[Description]*
-        ### Ingredients
-        * [List with Substitutions Applied]
-        ### Instructions
-        1. [Steps]
-        ---
-        **Safety Check:** [State any substitutions made]
-        """
-        
-        full_prompt = f"{system_instruction}\nUSER MESSAGE: {user_msg}"
+        # A fresh chat per attempt, so a retried send doesn't see a half-recorded turn
+        def send():
+            return fast_model.start_chat(history=history_used).send_message(full_prompt, stream=True)
 
         try:
-            response = chat.send_message(full_prompt, stream=True)
-            for chunk in response:
+            answer = []
+            for chunk in llm_scheduler.stream(send, priority=STREAM, timeout=STREAM_QUEUE_TIMEOUT):
                 if chunk.text:
-                    yield json.dumps({"text": chunk.text}) + "\n"
+                    answer.append(chunk.text)
+                    yield ndjson(chunk.text)
+            # Only complete answers: errors and disconnects never get here
+            if cache_key and answer:
+                answer_cache.set(cache_key, "".join(answer))
         except Exception as e:
-            error_str = str(e)
-            print(f"LLM Error: {error_str[:200]}")
-            # Check if it's a quota error
-            if "429" in error_str or "quota" in error_str.lower():
-                yield json.dumps({"text": "\n**Note:** AI service quota exceeded. Generating fallback recipe...\n"}) + "\n"
-                # Generate a simple fallback recipe
-                fallback_text = """## High-Protein Egg & Spinach Omelette (350 cal)
-> *A nutritious, high-protein breakfast packed with vitamins and minerals*
-
-### Ingredients
-* 3 large eggs
-* 1 cup fresh spinach
-* 50g cheese (cheddar or feta)
-* 1 tbsp olive oil
-* Salt and pepper to taste
-* Optional: tomatoes, mushrooms
-
-### Instructions
-1. Heat olive oil in a non-stick pan over medium heat
-2. Add spinach and sauté for 1-2 minutes until wilted
-3. Beat eggs with salt and pepper
-4. Pour eggs into the pan over the spinach
-5. Cook for 2-3 minutes until edges are set
-6. Add cheese, then fold omelette in half
-7. Cook for another 1-2 minutes until fully set
-8. Serve immediately with whole grain toast
-
----
-**Safety Check:** No substitutions needed if you don't have dairy allergies. For dairy-free: use nutritional yeast instead of cheese."""
-                yield json.dumps({"text": fallback_text}) + "\n"
-            else:
-                yield json.dumps({"text": f"\n**AI Error:** {error_str[:150]}"}) + "\n"
+            for text in llm_error_chunks(e, full_recipe):
+                yield ndjson(text)
 
     # 5. CREATE RESPONSE WITH EXPLICIT CORS HEADERS
     response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -181,5 +440,19 @@ def generate_response():
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
     return response
 
+def collect_metrics():
+    return {
+        "keyword_expander": keyword_expander.stats(),
+        "keyword_cache": keyword_cache.stats(),
+        "prompt_budget": prompt_budget.stats(),
+        "answer_cache": {"enabled": ANSWER_CACHE_ENABLED, **answer_cache.stats()},
+        "llm_scheduler": llm_scheduler.stats(),
+        "llm_backend": LLM_BACKEND,
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(collect_metrics())
+
 if __name__ == '__main__':
     app.run(port=5002, debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""Asyncio serving mode for Service C.
+
+Same /generate NDJSON stream as the Flask app, but every stream is a
+coroutine instead of an OS thread, so one worker can hold hundreds of
+concurrent users. Run it with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+"""
+import asyncio
+import json
+import os
+
+import httpx
+
+import app as core
+
+# Keep-alive connections to Service B shared by every in-flight stream
+SERVICE_B_MAX_CONNECTIONS = int(os.environ.get("SERVICE_B_MAX_CONNECTIONS", 100))
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+    (b"access-control-allow-headers", b"Content-Type"),
+]
+
+_service_b_client = None
+
+def service_b_client():
+    global _service_b_client
+    if _service_b_client is None:
+        limits = httpx.Limits(max_connections=SERVICE_B_MAX_CONNECTIONS,
+                              max_keepalive_connections=SERVICE_B_MAX_CONNECTIONS)
+        _service_b_client = httpx.AsyncClient(limits=limits, timeout=10)
+    return _service_b_client
+
+async def search_service_b(max_cal, allergens, query, fallback_queries=()):
+    """Async twin of app.search_service_b."""
+    try:
+        b_payload = core.build_search_payload(max_cal, allergens, query, fallback_queries)
+        response = await service_b_client().post(core.SERVICE_B_URL, json=b_payload)
+        return response.json().get('safe_recipes', [])
+    except Exception as e:
+        print(f"Service B Warning: {e}")
+        return []
+
+async def fetch_recipe(recipe_id):
+    """Async twin of app.fetch_recipe."""
+    try:
+        response = await service_b_client().get(f"{core.SERVICE_B_RECIPE_URL}/{int(recipe_id)}")
+        return response.json() if response.is_success else None
+    except Exception as e:
+        print(f"Service B Warning: {e}")
+        return None
+
+async def extract_keywords_with_llm(user_msg):
+    """Async twin of app.extract_keywords_with_llm."""
+    if not core.fast_model: return user_msg
+    prompt = core.build_keyword_prompt(user_msg)
+    scheduler = core.llm_scheduler
+
+    async def ask_llm():
+        response = await scheduler.call_async(lambda: core.fast_model.generate_content_async(prompt),
+                                              priority=core.KEYWORDS, timeout=core.KEYWORD_QUEUE_TIMEOUT)
+        return await asyncio.to_thread(core.remember_keywords, user_msg, response.text)
+
+    try:
+        return await scheduler.coalesce_async(core.normalise_message(user_msg) or prompt, ask_llm)
+    except Exception:
+        return user_msg
+
+async def find_safe_recipes(user_msg, max_cal, allergens):
+    """Async twin of app.find_safe_recipes: same speculative profile-only search."""
+    # The keyword cache may hit SQLite, so keep it off the event loop
+    raw_keywords = await asyncio.to_thread(core.get_cached_keywords, user_msg)
+    if raw_keywords is not None:
+        return await search_service_b(max_cal, allergens, core.to_search_query(raw_keywords), fallback_queries=[""])
+    if core.SEARCH_MODE in core.RAW_QUERY_MODES:
+        return await search_service_b(max_cal, allergens, user_msg, fallback_queries=[""])
+
+    speculative = asyncio.create_task(search_service_b(max_cal, allergens, ""))
+    raw_keywords = await extract_keywords_with_llm(user_msg)
+    safe_recipes = await search_service_b(max_cal, allergens, core.to_search_query(raw_keywords))
+
+    if safe_recipes:
+        speculative.cancel()
+        return safe_recipes
+    return await speculative
+
+async def generate_chunks(data):
+    """Yield the same text chunks as the Flask generate() stream."""
+    user_msg = data.get('message', '')
+    history = data.get('history', [])
+    profile = data.get('profile', {})
+
+    print(f"[Service C] Processing: '{user_msg}'")
+
+    # 1. CRITICAL HEARTBEAT
+    yield ""
+
+    max_cal = profile.get('calorie_limit', 2000)
+    allergens = profile.get('allergens', [])
+
+    cache_key = core.answer_cache_key(user_msg, history, max_cal, allergens)
+    cached = await asyncio.to_thread(core.answer_cache.get, cache_key) if cache_key else None
+    if cached is not None:
+        for text in core.replay_chunks(cached):
+            yield text
+        return
+
+    # 2. CHECK SETUP
+    if not core.models_ready or not core.smart_model:
+        yield "System Error: AI models not configured. Check API Key or LLM_BACKEND."
+        return
+
+    # 3. LOGIC
+    safe_recipes = await find_safe_recipes(user_msg, max_cal, allergens)
+    chosen = core.pick_recipe(user_msg, safe_recipes)
+    full_recipe = await fetch_recipe(chosen['id']) if chosen and 'id' in chosen else None
+    full_prompt, history = core.assemble_prompt(user_msg, history, max_cal, allergens, safe_recipes, full_recipe)
+
+    # 4. STREAMING GENERATION
+    def send():
+        return core.fast_model.start_chat(history=history).send_message_async(full_prompt, stream=True)
+
+    try:
+        answer = []
+        chunks = core.llm_scheduler.stream_async(send, priority=core.STREAM, timeout=core.STREAM_QUEUE_TIMEOUT)
+        async for chunk in chunks:
+            if chunk.text:
+                answer.append(chunk.text)
+                yield chunk.text
+        if cache_key and answer:
+            await asyncio.to_thread(core.answer_cache.set, cache_key, "".join(answer))
+    except Exception as e:
+        for text in core.llm_error_chunks(e, full_recipe):
+            yield text
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b"")
+        if not message.get('more_body'):
+            return body
+
+async def send_json(send, status, payload):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b"content-type", b"application/json")] + CORS_HEADERS,
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+async def stream_generate(data, receive, send):
+    # Stop generating (and paying for tokens) as soon as the client goes away
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    chunks = generate_chunks(data)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b"content-type", b"application/x-ndjson")] + CORS_HEADERS,
+        })
+        async for text in chunks:
+            if disconnected.is_set():
+                break
+            # send() waits for the transport to drain, so slow readers apply back-pressure
+            await send({'type': 'http.response.body', 'body': core.ndjson(text).encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b""})
+    except OSError:
+        pass  # client disconnected mid-write
+    finally:
+        await chunks.aclose()
+        watcher.cancel()
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _service_b_client is not None:
+                await _service_b_client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    method, path = scope['method'], scope['path']
+
+    if method == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 204, 'headers': CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': b""})
+    elif path == '/generate' and method == 'POST':
+        body = await read_body(receive)
+        if body is None:
+            return
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return await send_json(send, 400, {"error": "Invalid JSON"})
+        await stream_generate(data, receive, send)
+    elif path == '/metrics' and method == 'GET':
+        await send_json(send, 200, core.collect_metrics())
+    else:
+        await send_json(send, 404, {"error": "Not found"})
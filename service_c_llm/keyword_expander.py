@@ -0,0 +1,83 @@
+import json
+import os
+import re
+import threading
+
+
+class KeywordExpander:
+    """Turns common dietary and cuisine requests into search keywords without an LLM.
+
+    Built from concepts.json: multi-word 'concepts' expand to ingredient lists,
+    'ingredients' pass through as-is, and 'filler' words are ignored. A message
+    only counts as resolved when every remaining word is accounted for, so
+    anything unusual still goes to the Flash model.
+    """
+
+    def __init__(self, concepts_file):
+        self.concepts = {}
+        self.ingredients = set()
+        self.filler = set()
+        self.fast_path_hits = 0
+        self.fast_path_misses = 0
+        self._lock = threading.Lock()
+
+        if not os.path.exists(concepts_file):
+            print(f"Warning: {concepts_file} not found. Keyword fast path disabled.")
+        else:
+            try:
+                with open(concepts_file, 'r') as f:
+                    data = json.load(f)
+                self.concepts = {tuple(k.split()): v for k, v in data.get('concepts', {}).items()}
+                self.ingredients = set(data.get('ingredients', []))
+                self.filler = set(data.get('filler', []))
+            except Exception as e:
+                print(f"Error loading concepts file: {e}")
+
+        # Phrases are matched longest-first, so "high protein" wins over "protein"
+        self._max_phrase = max((len(k) for k in self.concepts), default=0)
+
+    def _singular(self, token):
+        if token.endswith('s') and token[:-1] in self.ingredients:
+            return token[:-1]
+        return token
+
+    def expand(self, user_msg):
+        """Return space-separated keywords, or None if the message isn't fully understood."""
+        tokens = re.findall(r"[^\W_]+", user_msg.lower())
+        keywords = []
+        resolved = bool(self.concepts or self.ingredients)
+        i = 0
+
+        while i < len(tokens) and resolved:
+            for size in range(min(self._max_phrase, len(tokens) - i), 0, -1):
+                phrase = tuple(tokens[i:i + size])
+                if phrase in self.concepts:
+                    keywords.extend(self.concepts[phrase])
+                    i += size
+                    break
+            else:
+                token = self._singular(tokens[i])
+                if token in self.ingredients:
+                    keywords.append(token)
+                elif token not in self.filler:
+                    resolved = False
+                i += 1
+
+        # A message of pure filler ("something for dinner") has nothing to search on
+        resolved = resolved and bool(keywords)
+        with self._lock:
+            if resolved:
+                self.fast_path_hits += 1
+            else:
+                self.fast_path_misses += 1
+
+        return " ".join(dict.fromkeys(keywords)) if resolved else None
+
+    def stats(self):
+        with self._lock:
+            total = self.fast_path_hits + self.fast_path_misses
+            return {
+                "fast_path_hits": self.fast_path_hits,
+                "fast_path_misses": self.fast_path_misses,
+                "fast_path_rate": round(self.fast_path_hits / total, 4) if total else 0.0,
+            }
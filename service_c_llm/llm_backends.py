@@ -0,0 +1,296 @@
+"""Interchangeable models behind Service C's fast_model/smart_model.
+
+Every backend offers the part of genai.GenerativeModel that Service C uses:
+generate_content(_async) for keyword extraction, and
+start_chat(history).send_message(_async)(prompt, stream=True) for answers,
+whose chunks carry .text.
+
+  gemini  the real API (needs GOOGLE_API_KEY)
+  mock    deterministic local answers, streamed at a set token rate
+  record  Gemini, with every completed response saved to a cassette file
+  replay  answers from a cassette, at the recorded pace (scaled by speed)
+"""
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+BACKENDS = ("gemini", "mock", "record", "replay")
+FAST_MODEL_NAME = "gemini-2.5-flash"
+SMART_MODEL_NAME = "gemini-2.5-pro"
+
+
+class BackendUnavailable(Exception):
+    """The configured backend can't be used (no API key, no cassette...)."""
+
+
+class CassetteMiss(LookupError):
+    """A replayed request that was never recorded."""
+
+
+class TextChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+def play(pieces):
+    """Yield (delay, text) pieces as chunks, sleeping before each."""
+    for delay, text in pieces:
+        if delay:
+            time.sleep(delay)
+        yield TextChunk(text)
+
+
+async def play_async(pieces):
+    for delay, text in pieces:
+        if delay:
+            await asyncio.sleep(delay)
+        yield TextChunk(text)
+
+
+# --- 1. SCRIPTED MODELS (mock, replay) ---
+class ScriptedModel(abc.ABC):
+    """A model whose responses are lists of (delay, text) pieces."""
+
+    def __init__(self, name):
+        self.name = name
+
+    @abc.abstractmethod
+    def pieces(self, kind, prompt, history=None):
+        """The (delay, text) pieces answering prompt; kind is "generate" or "chat"."""
+
+    def respond(self, kind, prompt, history=None):
+        """A non-streamed response: every piece at once, after their total delay."""
+        pieces = self.pieces(kind, prompt, history)
+        time.sleep(sum(delay for delay, _ in pieces))
+        return TextChunk("".join(text for _, text in pieces))
+
+    async def respond_async(self, kind, prompt, history=None):
+        pieces = self.pieces(kind, prompt, history)
+        await asyncio.sleep(sum(delay for delay, _ in pieces))
+        return TextChunk("".join(text for _, text in pieces))
+
+    def generate_content(self, prompt, **kwargs):
+        return self.respond("generate", prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return await self.respond_async("generate", prompt)
+
+    def start_chat(self, history=None):
+        return ScriptedChat(self, history or [])
+
+
+class ScriptedChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = history
+
+    def send_message(self, prompt, stream=False, **kwargs):
+        if stream:
+            return play(self.model.pieces("chat", prompt, self.history))
+        return self.model.respond("chat", prompt, self.history)
+
+    async def send_message_async(self, prompt, stream=False, **kwargs):
+        if stream:
+            return play_async(self.model.pieces("chat", prompt, self.history))
+        return await self.model.respond_async("chat", prompt, self.history)
+
+
+KEYWORD_STOPWORDS = {"a", "an", "and", "the", "with", "for", "some", "something", "me", "i", "want",
+                     "need", "please", "make", "give", "recipe", "recipes", "dinner", "lunch", "breakfast"}
+
+
+def mock_keywords(prompt):
+    """Content words of the quoted REQUEST in a keyword prompt."""
+    match = re.search(r'REQUEST: "(.*)"', prompt)
+    words = re.findall(r"[a-z]+", (match.group(1) if match else prompt).lower())
+    return " ".join(w for w in words if w not in KEYWORD_STOPWORDS) or "vegetable"
+
+
+def mock_answer(prompt):
+    """A recipe card for the first recipe the prompt offers, in the required format."""
+    match = re.search(r"^\s*- (.+?) \(([\d.]+) cal\) \| Ing: (.*?)(?: \| Instr: (.*))?$", prompt, re.M)
+    if not match:
+        return "I couldn't find a recipe that is safe for your profile. Try a different request."
+    name, calories, ingredients, instructions = match.groups()
+    items = [i.strip(" '\"[]…") for i in re.split(r",\s*", ingredients)]
+    ingredient_lines = "".join(f"* {i}\n" for i in items if i)
+    return (f"## {name} ({calories} cal)\n> *A safe pick from your recipe database.*\n"
+            f"### Ingredients\n{ingredient_lines}"
+            f"### Instructions\n1. {instructions or 'Combine the ingredients and cook until done.'}\n"
+            f"---\n**Safety Check:** No substitutions needed.\n")
+
+
+class MockModel(ScriptedModel):
+    """Deterministic offline answers: the same prompt always streams the same
+    words, after first_token_latency and then one word per 1/tokens_per_second
+    (0 for no delay)."""
+
+    def __init__(self, name, tokens_per_second=50.0, first_token_latency=0.3):
+        super().__init__(name)
+        self.token_latency = 1.0 / tokens_per_second if tokens_per_second else 0.0
+        self.first_token_latency = first_token_latency
+
+    def pieces(self, kind, prompt, history=None):
+        text = mock_keywords(prompt) if kind == "generate" else mock_answer(prompt)
+        words = re.findall(r"\s*\S+\s*", text) or [text]
+        return [(self.first_token_latency if i == 0 else self.token_latency, w) for i, w in enumerate(words)]
+
+
+# --- 2. RECORD / REPLAY ---
+def request_key(model_name, kind, prompt, history=None):
+    payload = json.dumps([model_name, kind, history or [], prompt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Cassette:
+    """Recorded responses, one JSON object per line, keyed by request hash."""
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, model_name, kind, prompt, pieces):
+        entry = {"key": key, "model": model_name, "kind": kind, "prompt_start": prompt.strip()[:120],
+                 "chunks": [[round(delay, 4), text] for delay, text in pieces]}
+        with self._lock:
+            self._entries[key] = entry
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class ReplayModel(ScriptedModel):
+    """Responses from a cassette; speed scales the recorded delays (0 = instant)."""
+
+    def __init__(self, name, cassette, speed=1.0):
+        super().__init__(name)
+        self.cassette = cassette
+        self.speed = speed
+
+    def pieces(self, kind, prompt, history=None):
+        entry = self.cassette.get(request_key(self.name, kind, prompt, history))
+        if entry is None:
+            raise CassetteMiss(f"No recorded {self.name} response for this {kind} request")
+        return [(delay * self.speed, text) for delay, text in entry["chunks"]]
+
+
+def chunk_text(chunk):
+    # Gemini raises on chunks without text parts (e.g. a finish marker)
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+class RecordingModel:
+    """Wraps a real model and saves each response that completes to a cassette."""
+
+    def __init__(self, inner, name, cassette):
+        self.inner = inner
+        self.name = name
+        self.cassette = cassette
+
+    def _save(self, kind, prompt, history, pieces):
+        self.cassette.put(request_key(self.name, kind, prompt, history), self.name, kind, prompt, pieces)
+
+    def generate_content(self, prompt, **kwargs):
+        started = time.monotonic()
+        response = self.inner.generate_content(prompt, **kwargs)
+        self._save("generate", prompt, None, [(time.monotonic() - started, chunk_text(response))])
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        started = time.monotonic()
+        response = await self.inner.generate_content_async(prompt, **kwargs)
+        self._save("generate", prompt, None, [(time.monotonic() - started, chunk_text(response))])
+        return response
+
+    def start_chat(self, history=None):
+        return RecordingChat(self, self.inner.start_chat(history=history), history or [])
+
+
+class RecordingChat:
+    def __init__(self, model, chat, history):
+        self.model = model
+        self.chat = chat
+        self.history = history
+
+    def _record(self, chunks, prompt, started):
+        last, pieces = started, []
+        for chunk in chunks:
+            now = time.monotonic()
+            pieces.append((now - last, chunk_text(chunk)))
+            last = now
+            yield chunk
+        # Only a stream that ran to the end is worth replaying
+        self.model._save("chat", prompt, self.history, pieces)
+
+    async def _record_async(self, chunks, prompt, started):
+        last, pieces = started, []
+        async for chunk in chunks:
+            now = time.monotonic()
+            pieces.append((now - last, chunk_text(chunk)))
+            last = now
+            yield chunk
+        self.model._save("chat", prompt, self.history, pieces)
+
+    def send_message(self, prompt, stream=False, **kwargs):
+        started = time.monotonic()
+        response = self.chat.send_message(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._record(response, prompt, started)
+        self.model._save("chat", prompt, self.history, [(time.monotonic() - started, chunk_text(response))])
+        return response
+
+    async def send_message_async(self, prompt, stream=False, **kwargs):
+        started = time.monotonic()
+        response = await self.chat.send_message_async(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._record_async(response, prompt, started)
+        self.model._save("chat", prompt, self.history, [(time.monotonic() - started, chunk_text(response))])
+        return response
+
+
+# --- 3. SELECTION ---
+def gemini_models():
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        raise BackendUnavailable("GOOGLE_API_KEY not found in environment!")
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(FAST_MODEL_NAME), genai.GenerativeModel(SMART_MODEL_NAME)
+
+
+def load_models(backend, cassette_file=None, tokens_per_second=50.0, first_token_latency=0.3, replay_speed=1.0):
+    """Return (fast_model, smart_model) for the named backend."""
+    names = (FAST_MODEL_NAME, SMART_MODEL_NAME)
+    if backend == "gemini":
+        return gemini_models()
+    if backend == "mock":
+        return tuple(MockModel(name, tokens_per_second, first_token_latency) for name in names)
+    if backend == "record":
+        cassette = Cassette(cassette_file)
+        return tuple(RecordingModel(model, name, cassette) for model, name in zip(gemini_models(), names))
+    if backend == "replay":
+        if not (cassette_file and os.path.exists(cassette_file)):
+            raise BackendUnavailable(f"No cassette to replay at {cassette_file}")
+        cassette = Cassette(cassette_file)
+        return tuple(ReplayModel(name, cassette, replay_speed) for name in names)
+    raise BackendUnavailable(f"Unknown LLM_BACKEND '{backend}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,246 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+# Priorities: the user-visible answer stream goes ahead of keyword extraction
+STREAM = 0
+KEYWORDS = 1
+
+# Error text Gemini uses for quota and transient failures
+RETRYABLE_MARKERS = ("429", "quota", "resource exhausted", "rate limit", "500", "503",
+                     "unavailable", "deadline exceeded", "internal error")
+
+
+class QueueTimeout(Exception):
+    """No rate-limit slot became free within the caller's timeout."""
+
+
+def is_retryable(e):
+    text = str(e).lower()
+    return any(marker in text for marker in RETRYABLE_MARKERS)
+
+
+class LLMScheduler:
+    """Every Gemini call in this process goes through here.
+
+    A token bucket (rate_per_minute, up to burst at once) keeps us inside the
+    API tier, so bursts queue instead of turning into 429s. Low-priority
+    callers only get a slot when no high-priority caller is waiting. Failed
+    calls that look transient are retried with full-jitter exponential
+    backoff, and identical keyword requests in flight share one call.
+    rate_per_minute=0 disables the limiter.
+    """
+
+    def __init__(self, rate_per_minute=10, burst=10, max_retries=3, backoff_base=1.0, backoff_max=16.0):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waiting = [0, 0]
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_async = {}
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.queue_timeouts = 0
+        self.coalesced = 0
+        self.wait_seconds = 0.0
+
+    # --- 1. RATE LIMIT ---
+    def _try_take(self, priority):
+        """Take a slot and return 0, or return how long to wait before trying again."""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if any(self._waiting[:priority]):
+                return 1 / self.rate  # someone more important is queued
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def _enqueue(self, priority, delta):
+        with self._lock:
+            self._waiting[priority] += delta
+
+    def _record_wait(self, started, acquired):
+        with self._lock:
+            self.wait_seconds += time.monotonic() - started
+            if not acquired:
+                self.queue_timeouts += 1
+
+    def acquire(self, priority=STREAM, timeout=None):
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        self._enqueue(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(priority)
+                if not wait:
+                    self._record_wait(started, True)
+                    return
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    self._record_wait(started, False)
+                    raise QueueTimeout(f"No LLM slot within {timeout}s")
+                time.sleep(wait)
+        finally:
+            self._enqueue(priority, -1)
+
+    async def acquire_async(self, priority=STREAM, timeout=None):
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        self._enqueue(priority, 1)
+        try:
+            while True:
+                wait = self._try_take(priority)
+                if not wait:
+                    self._record_wait(started, True)
+                    return
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    self._record_wait(started, False)
+                    raise QueueTimeout(f"No LLM slot within {timeout}s")
+                await asyncio.sleep(wait)
+        finally:
+            self._enqueue(priority, -1)
+
+    # --- 2. RETRIES ---
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, e, attempt):
+        if attempt < self.max_retries and is_retryable(e):
+            with self._lock:
+                self.retries += 1
+            return True
+        with self._lock:
+            self.failures += 1
+        return False
+
+    def call(self, fn, priority=STREAM, timeout=None):
+        """Run fn() under the rate limit, retrying transient errors."""
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, timeout)
+            with self._lock:
+                self.calls += 1
+            try:
+                return fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                time.sleep(self._backoff(attempt))
+
+    async def call_async(self, fn, priority=STREAM, timeout=None):
+        """Async twin of call(): fn() returns an awaitable."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(priority, timeout)
+            with self._lock:
+                self.calls += 1
+            try:
+                return await fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+
+    def stream(self, fn, priority=STREAM, timeout=None):
+        """Yield chunks of the stream fn() returns.
+
+        Errors up to the first chunk are retried like call(); after that the
+        user has seen output, so a failure is passed on instead.
+        """
+        def open_stream():
+            chunks = iter(fn())
+            return next(chunks, None), chunks
+
+        first, chunks = self.call(open_stream, priority, timeout)
+        if first is None:
+            return
+        yield first
+        yield from chunks
+
+    async def stream_async(self, fn, priority=STREAM, timeout=None):
+        """Async twin of stream(): fn() returns an awaitable async iterable."""
+        async def open_stream():
+            chunks = (await fn()).__aiter__()
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+
+        first, chunks = await self.call_async(open_stream, priority, timeout)
+        if first is None:
+            return
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    # --- 3. COALESCING ---
+    def coalesce(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def coalesce_async(self, key, fn):
+        """Async twin of coalesce(): fn() returns an awaitable."""
+        future = self._inflight_async.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._inflight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight_async[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_minute": round(self.rate * 60, 2),
+                "burst": self.burst,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "queue_timeouts": self.queue_timeouts,
+                "coalesced": self.coalesced,
+                "queued": {"stream": self._waiting[STREAM], "keywords": self._waiting[KEYWORDS]},
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
@@ -0,0 +1,122 @@
+import threading
+
+# Rough characters per token for English text. Close enough for budgeting,
+# and it saves a count_tokens round trip to Gemini on every turn.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def shorten(text, max_tokens):
+    """Cut text to roughly max_tokens, marking the cut with an ellipsis."""
+    max_chars = max(max_tokens, 1) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 1].rstrip() + "…"
+
+
+def turn_text(turn):
+    """Plain text of one {"role", "parts": [{"text"}]} history turn."""
+    parts = turn.get('parts', [])
+    if isinstance(parts, str):
+        return parts
+    return " ".join(p.get('text', '') if isinstance(p, dict) else str(p) for p in parts)
+
+
+class PromptBudget:
+    """Keeps each /generate turn within a fixed token budget.
+
+    History gets at most history_tokens: the most recent turns are kept
+    verbatim, older ones are cut down to their opening lines, and anything
+    past the budget is dropped. Whatever the history and prompt template
+    leave over goes to the recipe list.
+    """
+
+    def __init__(self, total_tokens=3000, history_tokens=1000, recent_turns=4, summary_tokens=60):
+        self.total_tokens = total_tokens
+        self.history_tokens = min(history_tokens, total_tokens)
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.over_budget = 0
+        self.turns_dropped = 0
+        self.turns_summarised = 0
+        self.recipes_dropped = 0
+        self.recipes_truncated = 0
+        self._lock = threading.Lock()
+
+    def trim_history(self, history):
+        """Return (history that fits, its estimated tokens)."""
+        turns = [t for t in history if isinstance(t, dict)] if isinstance(history, list) else []
+        kept = []
+        used = summarised = 0
+
+        # Walk back from the newest turn until the history budget runs out
+        for age, turn in enumerate(reversed(turns)):
+            text = turn_text(turn)
+            if age >= self.recent_turns:
+                short = shorten(text, self.summary_tokens)
+                summarised += short != text
+                text = short
+            cost = estimate_tokens(text)
+            if used + cost > self.history_tokens:
+                break
+            kept.append({"role": turn.get('role', 'user'), "parts": [{"text": text}]})
+            used += cost
+        kept.reverse()
+
+        # Gemini expects the history to open with a user turn
+        while kept and kept[0]['role'] != 'user':
+            used -= estimate_tokens(kept.pop(0)['parts'][0]['text'])
+
+        with self._lock:
+            self.turns_dropped += len(turns) - len(kept)
+            self.turns_summarised += summarised
+        return kept, used
+
+    def fit_lines(self, lines, max_tokens):
+        """Keep lines in order while they fit; the first one that doesn't is
+        truncated into the remaining space (always at least one line)."""
+        fitted = []
+        remaining = max_tokens
+        for line in lines:
+            cost = estimate_tokens(line)
+            if cost <= remaining:
+                fitted.append(line)
+                remaining -= cost
+                continue
+            if not fitted or remaining >= self.summary_tokens:
+                fitted.append(shorten(line.rstrip("\n"), remaining) + "\n")
+                with self._lock:
+                    self.recipes_truncated += 1
+            break
+        with self._lock:
+            self.recipes_dropped += len(lines) - len(fitted)
+        return fitted
+
+    def record(self, prompt_tokens):
+        """Count one assembled turn (prompt plus history)."""
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+            self.over_budget += prompt_tokens > self.total_tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "total_tokens": self.total_tokens,
+                "history_tokens": self.history_tokens,
+                "prompts": self.prompts,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0.0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "over_budget": self.over_budget,
+                "history_turns_dropped": self.turns_dropped,
+                "history_turns_summarised": self.turns_summarised,
+                "recipes_dropped": self.recipes_dropped,
+                "recipes_truncated": self.recipes_truncated,
+            }
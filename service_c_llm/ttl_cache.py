@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_pool import get_pool
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss counters.
+
+    With db_file set, entries are also written through to a small SQLite
+    table, so they survive restarts and are shared by every gunicorn worker
+    on the host. The in-memory LRU stays in front of it as the hot path.
+    Values must be JSON-serialisable.
+    """
+
+    def __init__(self, namespace, max_size=1024, ttl=86400, db_file=None):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_file = db_file
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        if db_file:
+            con = self._db()
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """)
+            con.commit()
+
+    def _db(self):
+        return get_pool(self.db_file).connection()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or expiry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self.db_file:
+            row = self._db().execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace=? AND key=? AND expires_at > ?",
+                (self.namespace, key, now)).fetchone()
+            if row:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, row[1], value)
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+
+        if self.db_file:
+            con = self._db()
+            con.execute("INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?)",
+                        (self.namespace, key, json.dumps(value), expires_at))
+            # Keep the shared table bounded too: drop expired rows, then the oldest
+            con.execute("DELETE FROM cache_entries WHERE namespace=? AND expires_at <= ?",
+                        (self.namespace, time.time()))
+            con.execute("""
+            DELETE FROM cache_entries WHERE namespace=? AND key NOT IN (
+                SELECT key FROM cache_entries WHERE namespace=? ORDER BY expires_at DESC LIMIT ?
+            )
+            """, (self.namespace, self.namespace, self.max_size))
+            con.commit()
+
+    def _remember(self, key, expires_at, value):
+        # Caller holds self._lock
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+# Make Service B's modules importable the same way gunicorn sees them
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'service_b_data'))
+
+import setup_db
+from service_b_data import app as service_b
+
+# A tiny corpus shaped like 13k-recipes.csv (Title, Ingredients, Instructions)
+SAMPLE_RECIPES = [
+    ("Peanut Butter Cookies", "['1 cup peanut butter', '1 egg', '1 cup sugar']", "Mix and bake."),
+    ("Grilled Chicken", "['2 chicken breasts', '1 tbsp olive oil', 'salt']", "Grill until done."),
+    ("Cheese Omelette", "['3 eggs', '50g cheese', '1 tbsp butter']", "Whisk and fry."),
+    ("Tofu Stir Fry", "['200g tofu', '2 tbsp soy sauce', 'broccoli']", "Stir fry everything."),
+    ("Garlic Shrimp", "['300g shrimp', '3 cloves garlic', 'olive oil']", "Saute shrimp with garlic."),
+    ("Sesame Noodles", "['rice noodles', '2 tbsp sesame oil', 'scallions']", "Toss noodles in oil."),
+    ("Almond Cake", "['2 cups almond flour', '3 eggs', 'honey']", "Bake for 30 minutes."),
+    ("Roast Vegetables", "['2 carrots', '1 zucchini', 'olive oil', 'thyme']", "Roast at 200C."),
+    ("Nutmeg Rice Pudding", "['1 cup rice', '2 cups coconut water', 'pinch of nutmeg']", "Simmer until thick."),
+    ("Salmon Bowl", "['1 salmon fillet', 'rice', 'cucumber']", "Assemble the bowl."),
+]
+
+
+def build_fixture_db(recipes=SAMPLE_RECIPES, vectors=False):
+    """Build a throwaway RecipeCorpus.db from SAMPLE_RECIPES and return its path."""
+    tmp_dir = tempfile.mkdtemp()
+    csv_file = os.path.join(tmp_dir, 'recipes.csv')
+    db_file = os.path.join(tmp_dir, 'RecipeCorpus.db')
+
+    pd.DataFrame(recipes, columns=['Title', 'Ingredients', 'Instructions']).to_csv(csv_file, index=False)
+    setup_db.create_database(db_file=db_file, source=csv_file, vectors=vectors)
+    return db_file
+
+
+class FixtureDBTestCase(unittest.TestCase):
+    """Points Service B at a throwaway DB built from RECIPES for the whole class.
+
+    SEARCH_DEFAULTS are merged under every search() payload.
+    """
+    RECIPES = SAMPLE_RECIPES
+    VECTORS = False
+    SEARCH_DEFAULTS = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.db_file = build_fixture_db(cls.RECIPES, vectors=cls.VECTORS)
+        patcher = mock.patch.object(service_b, 'DB_FILE', cls.db_file)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        self.app = service_b.app.test_client()
+        self.app.testing = True
+
+    def post(self, url, payload):
+        return self.app.post(url, data=json.dumps(payload), content_type='application/json')
+
+    def search_response(self, **payload):
+        return self.post('/filter_recipes', {**self.SEARCH_DEFAULTS, **payload})
+
+    def search(self, **payload):
+        """/filter_recipes JSON, asserting the request succeeded."""
+        response = self.search_response(**payload)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response.get_json()
+
+    def names(self, **payload):
+        return [r['name'] for r in self.search(**payload)['safe_recipes']]
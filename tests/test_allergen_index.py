@@ -0,0 +1,88 @@
+import unittest
+import shutil
+import sqlite3
+from unittest import mock
+
+from recipe_fixture import FixtureDBTestCase
+
+import allergen_index
+from service_b_data import app as service_b
+
+
+class TestAllergenIndex(FixtureDBTestCase):
+    SEARCH_DEFAULTS = {"max_calories": 2000, "query": ""}
+
+    def test_mask_matches_whole_tokens_only(self):
+        """'nut' must not flag nutmeg or coconut; "peanut butter" flags peanuts and milk."""
+        matchers = allergen_index.build_matchers(service_b.ALLERGEN_SYNONYMS)
+        bits = allergen_index.family_bits(service_b.ALLERGEN_SYNONYMS)
+
+        self.assertEqual(allergen_index.compute_mask("pinch of nutmeg, coconut water", matchers), 0)
+        self.assertEqual(allergen_index.compute_mask("['1 cup Peanut Butter']", matchers), bits['peanuts'] | bits['milk'])
+
+    def test_masks_are_stored_per_recipe(self):
+        bits = allergen_index.family_bits(service_b.ALLERGEN_SYNONYMS)
+        con = sqlite3.connect(self.db_file)
+        masks = dict(con.execute("SELECT name, allergen_mask FROM recipes"))
+        con.close()
+
+        self.assertEqual(masks['Cheese Omelette'], bits['milk'] | bits['eggs'])
+        self.assertEqual(masks['Roast Vegetables'], 0)
+
+    def test_resolve_exclusions_keeps_unknown_terms(self):
+        mask, terms = allergen_index.resolve_exclusions(["Milk", "sesame"], service_b.ALLERGEN_SYNONYMS)
+        self.assertEqual(mask, allergen_index.family_bits(service_b.ALLERGEN_SYNONYMS)['milk'])
+        self.assertEqual(terms, ["sesame"])
+
+    def test_families_added_after_the_build_become_terms(self):
+        built = {"bits": {"milk": 1}, "synonyms": {"milk": ["milk", "butter"]}}
+        current = {"eggs": ["egg"], "milk": ["milk", "butter", "ghee"]}
+        self.assertEqual(allergen_index.resolve_exclusions(["milk", "eggs"], current, built),
+                         (1, ["egg", "eggs", "ghee"]))
+
+    def test_bits_come_from_the_db_not_the_current_allergens_file(self):
+        # allergens.json reordered (and extended) after the DB was built
+        reordered = dict(reversed(list(service_b.ALLERGEN_SYNONYMS.items())))
+        reordered["sesame"] = ["sesame", "tahini"]
+        with mock.patch.object(service_b, 'ALLERGEN_SYNONYMS', reordered):
+            names = set(self.names(allergens=["milk", "sesame"]))
+        self.assertTrue(names)
+        self.assertNotIn("Cheese Omelette", names)
+        self.assertNotIn("Peanut Butter Cookies", names)
+        self.assertNotIn("Sesame Noodles", names)
+
+    def test_db_without_stored_bits_excludes_by_terms(self):
+        legacy_db = self.db_file + '.legacy'
+        shutil.copyfile(self.db_file, legacy_db)
+        con = sqlite3.connect(legacy_db)
+        con.execute("DELETE FROM meta WHERE key = 'allergen_families'")
+        con.execute("UPDATE recipes SET allergen_mask = 0")
+        con.commit()
+        con.close()
+
+        with mock.patch.object(service_b, 'DB_FILE', legacy_db):
+            names = set(self.names(allergens=["milk", "eggs"]))
+        self.assertTrue(names)
+        self.assertNotIn("Cheese Omelette", names)
+        self.assertNotIn("Almond Cake", names)
+        self.assertNotIn("Peanut Butter Cookies", names)
+
+    def test_profile_only_search_excludes_families(self):
+        names = set(self.names(allergens=["milk", "eggs"]))
+        self.assertTrue(names)
+        self.assertNotIn("Cheese Omelette", names)
+        self.assertNotIn("Almond Cake", names)
+        self.assertNotIn("Peanut Butter Cookies", names)
+
+    def test_unknown_allergen_uses_token_index(self):
+        names = set(self.names(allergens=["sesame"]))
+        self.assertNotIn("Sesame Noodles", names)
+        self.assertIn("Roast Vegetables", names)
+
+    def test_keyword_search_with_allergens(self):
+        names = set(self.names(allergens=["shellfish"], query='"garlic" OR "chicken"'))
+        self.assertEqual(names, {"Grilled Chicken"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm')))
+
+from service_c_llm import app as service_c
+from ttl_cache import TTLCache
+from llm_scheduler import LLMScheduler
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, prompt, stream=True):
+        self.calls += 1
+        return [FakeChunk("## Tofu Stir Fry (300 cal)\n"), FakeChunk("> *Quick and safe*\n" * 10)]
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FakeModel()
+        db_file = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        patches = [
+            mock.patch.object(service_c, 'ANSWER_CACHE_ENABLED', True),
+            mock.patch.object(service_c, 'answer_cache', TTLCache("answers", db_file=db_file)),
+            mock.patch.object(service_c, 'fast_model', self.model),
+            mock.patch.object(service_c, 'smart_model', self.model),
+            mock.patch.object(service_c, 'models_ready', True),
+            mock.patch.object(service_c, 'find_safe_recipes', return_value=[]),
+            mock.patch.object(service_c, 'llm_scheduler', LLMScheduler(rate_per_minute=0)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.app = service_c.app.test_client()
+
+    def generate(self, message="Tofu, please!", allergens=("milk",), history=()):
+        payload = {"message": message, "history": list(history),
+                   "profile": {"calorie_limit": 800, "allergens": list(allergens)}}
+        response = self.app.post('/generate', data=json.dumps(payload), content_type='application/json')
+        return [json.loads(line)["text"] for line in response.get_data(as_text=True).splitlines()]
+
+    def test_repeat_request_is_replayed_in_chunks(self):
+        first = self.generate()
+        second = self.generate(message="tofu please", allergens=["Milk"])
+
+        self.assertEqual(self.model.calls, 1)
+        self.assertEqual(second[0], "")
+        self.assertEqual("".join(second), "".join(first))
+        self.assertTrue(all(len(t) <= service_c.REPLAY_CHUNK_CHARS for t in second))
+        self.assertGreater(len(second), 2)
+
+    def test_allergen_set_is_part_of_the_key(self):
+        self.generate(allergens=["milk"])
+        self.generate(allergens=["milk", "peanuts"])
+        self.generate(allergens=[])
+        self.assertEqual(self.model.calls, 3)
+
+    def test_allergen_spellings_that_resolve_differently_never_share_a_key(self):
+        key = lambda allergens: service_c.answer_cache_key("tofu", [], 800, allergens)
+        self.assertEqual(key([" Milk ", "peanuts"]), key(["peanuts", "milk"]))
+        for a, b in [(["tree nuts"], ["tree-nuts"]), (["tree nuts"], ["tree  nuts"]), (["nuts"], ["nuts!"]),
+                     (["soy"], ["soy_sauce"])]:
+            self.assertNotEqual(key(a), key(b), (a, b))
+        self.assertIsNone(key([None]))
+
+    def test_requests_with_history_are_not_cached(self):
+        history = [{"role": "user", "parts": [{"text": "hi"}]}]
+        self.generate(history=history)
+        self.generate(history=history)
+        self.assertEqual(self.model.calls, 2)
+
+    def test_failed_answers_are_not_cached(self):
+        with mock.patch.object(self.model, 'send_message', side_effect=Exception("boom")):
+            self.generate()
+        self.generate()
+        self.assertEqual(self.model.calls, 1)
+
+    def test_disabled_by_default_key(self):
+        with mock.patch.object(service_c, 'ANSWER_CACHE_ENABLED', False):
+            self.assertIsNone(service_c.answer_cache_key("tofu", [], 800, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import asyncio
+import json
+import os
+import sys
+
+# asgi.py imports Service C's app module by its top-level name, as uvicorn does
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm')))
+
+import asgi
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    def __init__(self, texts):
+        self.texts = texts
+
+    async def __aiter__(self):
+        for text in self.texts:
+            await asyncio.sleep(0)
+            yield FakeChunk(text)
+
+
+class FakeChat:
+    async def send_message_async(self, prompt, stream=True):
+        return FakeStream(["## Pasta", " (400 cal)"])
+
+
+class FakeModel:
+    def start_chat(self, history=None):
+        return FakeChat()
+
+
+class TestAsgiGenerate(unittest.TestCase):
+
+    def setUp(self):
+        core = asgi.core
+        self._saved = (core.fast_model, core.smart_model, core.models_ready, asgi.search_service_b)
+        core.fast_model = core.smart_model = FakeModel()
+        core.models_ready = True
+
+        async def fake_search(max_cal, allergens, query, fallback_queries=()):
+            return [{"name": "Pasta", "calories": 400, "ingredients": "pasta", "instructions": "boil"}]
+        asgi.search_service_b = fake_search
+
+    def tearDown(self):
+        core = asgi.core
+        core.fast_model, core.smart_model, core.models_ready, asgi.search_service_b = self._saved
+
+    def call(self, method, path, payload=None):
+        """Drive the ASGI app directly and return (status, headers, body)."""
+        sent = []
+
+        async def run():
+            messages = [{'type': 'http.request', 'body': json.dumps(payload or {}).encode(), 'more_body': False}]
+            done = asyncio.Event()
+
+            async def receive():
+                if messages:
+                    return messages.pop(0)
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            await asgi.app({'type': 'http', 'method': method, 'path': path}, receive, send)
+            done.set()
+
+        asyncio.run(run())
+        body = b"".join(m.get('body', b"") for m in sent[1:])
+        return sent[0]['status'], dict(sent[0]['headers']), body
+
+    def test_generate_streams_same_ndjson_format(self):
+        status, headers, body = self.call('POST', '/generate', {"message": "italian", "profile": {}})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"], b"application/x-ndjson")
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(lines, [{"text": ""}, {"text": "## Pasta"}, {"text": " (400 cal)"}])
+
+    def test_preflight_and_unknown_routes(self):
+        self.assertEqual(self.call('OPTIONS', '/generate')[0], 204)
+        self.assertEqual(self.call('GET', '/nope')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
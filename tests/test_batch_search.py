@@ -0,0 +1,44 @@
+import unittest
+
+from recipe_fixture import FixtureDBTestCase
+
+from service_b_data import app as service_b
+
+
+class TestBatchSearch(FixtureDBTestCase):
+
+    def test_fallback_query_runs_server_side(self):
+        payload = {"max_calories": 2000, "allergens": ["peanuts"], "query": '"peanut"', "fallback_queries": [""]}
+        data = self.post('/filter_recipes', payload).get_json()
+
+        self.assertEqual(data['query_used'], "")
+        self.assertTrue(data['safe_recipes'])
+        for recipe in data['safe_recipes']:
+            self.assertNotIn("peanut", recipe['ingredients'].lower())
+
+    def test_bad_fts_syntax_falls_through_to_fallback(self):
+        payload = {"max_calories": 2000, "allergens": [], "query": '"unbalanced', "fallback_queries": ['"salmon"']}
+        data = self.post('/filter_recipes', payload).get_json()
+        self.assertEqual([r['name'] for r in data['safe_recipes']], ["Salmon Bowl"])
+
+    def test_batch_returns_results_in_order(self):
+        searches = [
+            {"max_calories": 2000, "allergens": [], "query": '"tofu"'},
+            {"max_calories": 2000, "allergens": ["soy"], "query": '"tofu"'},
+            {"max_calories": 2000, "allergens": [], "query": '"unbalanced'},
+        ]
+        response = self.post('/filter_recipes/batch', {"searches": searches})
+        self.assertEqual(response.status_code, 200)
+        results = response.get_json()['results']
+
+        self.assertEqual([r['name'] for r in results[0]['safe_recipes']], ["Tofu Stir Fry"])
+        self.assertEqual(results[1]['safe_recipes'], [])
+        self.assertIn("error", results[2])
+
+    def test_batch_rejects_oversized_requests(self):
+        searches = [{"query": ""}] * (service_b.MAX_BATCH_SIZE + 1)
+        self.assertEqual(self.post('/filter_recipes/batch', {"searches": searches}).status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+import run_benchmarks
+from synthetic_corpus import make_recipes
+
+
+class TestStatistics(unittest.TestCase):
+
+    def test_nearest_rank_percentiles(self):
+        values = [i / 1000 for i in range(1, 101)]
+        summary = run_benchmarks.summarise(values, errors=2, elapsed=2.0, concurrency=4)
+        self.assertEqual((summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]), (50.0, 95.0, 99.0))
+        self.assertEqual(summary["requests"], 102)
+        self.assertEqual(summary["throughput_rps"], 50.0)
+
+    def test_compare_reports_relative_change(self):
+        before = {"results": {"profile": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 40.0, "throughput_rps": 100.0}}}
+        after = {"results": {"profile": {"p50_ms": 5.0, "p95_ms": 20.0, "p99_ms": 50.0, "throughput_rps": 150.0}}}
+        line = run_benchmarks.compare(before, after)[0]
+        self.assertIn("p50_ms 10.0 -> 5.0 (-50.0%)", line)
+        self.assertIn("throughput_rps 100.0 -> 150.0 (+50.0%)", line)
+
+
+class TestBenchmarkRun(unittest.TestCase):
+
+    def test_corpus_is_deterministic(self):
+        self.assertEqual(make_recipes(5, seed=1), make_recipes(5, seed=1))
+        self.assertNotEqual(make_recipes(5, seed=1), make_recipes(5, seed=2))
+
+    def test_small_run_covers_every_endpoint_without_errors(self):
+        args = run_benchmarks.parse_args(["--recipes", "40", "--users", "5", "--requests", "6", "--warmup", "1",
+                                          "--concurrency", "2", "--bcrypt-rounds", "4", "--tokens-per-second", "0",
+                                          "--first-token-latency", "0"])
+        report = run_benchmarks.run(args)
+        self.assertEqual(set(report["results"]), set(run_benchmarks.ENDPOINTS))
+        for endpoint, result in report["results"].items():
+            self.assertEqual(result["errors"], 0, endpoint)
+            self.assertEqual(result["requests"], 6)
+            self.assertIsNotNone(result["p99_ms"])
+        self.assertIn("first_token_p50_ms", report["results"]["generate"])
+        self.assertIn("llm_scheduler", report["metrics"]["service_c"])
+
+
+if __name__ == '__main__':
+    unittest.main()
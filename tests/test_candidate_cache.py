@@ -0,0 +1,64 @@
+import unittest
+import sqlite3
+
+from recipe_fixture import FixtureDBTestCase
+
+from service_b_data import app as service_b
+from candidate_cache import CandidateCache
+
+
+class TestCandidateCache(unittest.TestCase):
+
+    def test_eviction_is_bounded_by_total_ids(self):
+        cache = CandidateCache(max_ids=5)
+        cache.put("a", [1, 2, 3], [100, 200, 300])
+        cache.put("b", [4, 5], [100, 200])
+        cache.get("a")                      # 'a' is now most recent
+        cache.put("c", [6, 7], [100, 200])  # evicts 'b'
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(list(cache.get("a")[0]), [1, 2, 3])
+        self.assertEqual(cache.stats()["ids"], 5)
+
+        cache.put("huge", list(range(10)), [0] * 10)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_empty_results_are_charged_and_evicted(self):
+        cache = CandidateCache(max_ids=3)
+        for i in range(10):
+            cache.put(f"nothing matches {i}", [], [])
+        self.assertEqual(cache.stats()["entries"], 3)
+        self.assertIsNone(cache.get("nothing matches 0"))
+        self.assertIsNotNone(cache.get("nothing matches 9"))
+
+    def test_entry_count_is_capped(self):
+        cache = CandidateCache(max_ids=100, max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.put(key, [1], [100])
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+
+class TestCachedSearch(FixtureDBTestCase):
+
+    def test_repeat_search_hits_cache_and_keeps_exact_calorie_limit(self):
+        con = sqlite3.connect(service_b.DB_FILE)
+        calories = sorted(c for (c,) in con.execute("SELECT calories FROM recipes"))
+        con.close()
+        limit = calories[len(calories) // 2]
+
+        hits_before = service_b.candidate_cache.stats()["hits"]
+        for max_cal in (limit, limit, limit - 1):
+            for recipe in self.search(max_calories=max_cal, allergens=["shellfish"], query="")['safe_recipes']:
+                self.assertLessEqual(recipe['calories'], max_cal)
+
+        self.assertGreaterEqual(service_b.candidate_cache.stats()["hits"] - hits_before, 1)
+
+    def test_metrics_endpoint_reports_cache(self):
+        self.search(max_calories=900, allergens=[], query='"rice"')
+        stats = self.app.get('/metrics').get_json()["candidate_cache"]
+        self.assertGreaterEqual(stats["entries"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
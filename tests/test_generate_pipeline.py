@@ -0,0 +1,73 @@
+import unittest
+import os
+import sys
+import threading
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm')))
+
+from service_c_llm import app as service_c
+
+
+class TestFindSafeRecipes(unittest.TestCase):
+
+    def test_local_keywords_use_one_call_with_server_side_fallback(self):
+        with mock.patch.object(service_c, 'search_service_b', return_value=[{"name": "x"}]) as search, \
+             mock.patch.object(service_c, 'extract_keywords_with_llm') as llm:
+            service_c.find_safe_recipes("italian", 800, ["milk"])
+
+        llm.assert_not_called()
+        search.assert_called_once_with(800, ["milk"], '"pasta" OR "tomato" OR "basil" OR "cheese"',
+                                       fallback_queries=[""])
+
+    def test_profile_search_runs_while_keywords_are_extracted(self):
+        speculative_started = threading.Event()
+
+        def fake_search(max_cal, allergens, query, fallback_queries=()):
+            if query == "":
+                speculative_started.set()
+                return [{"name": "fallback"}]
+            return []  # keyword search misses
+
+        def fake_llm(user_msg):
+            # The profile-only search must already be in flight before keywords arrive
+            self.assertTrue(speculative_started.wait(2))
+            return "unicorn"
+
+        with mock.patch.object(service_c, 'search_service_b', side_effect=fake_search), \
+             mock.patch.object(service_c, 'extract_keywords_with_llm', side_effect=fake_llm):
+            result = service_c.find_safe_recipes("a cozy autumn dish", 800, [])
+
+        self.assertEqual(result, [{"name": "fallback"}])
+
+
+class TestCompactPrompt(unittest.TestCase):
+
+    SUMMARIES = [
+        {"id": 1, "name": "Tofu Stir Fry", "calories": 300, "ingredients": "tofu, soy sauce…"},
+        {"id": 2, "name": "Salmon Bowl", "calories": 450, "ingredients": "salmon, rice…"},
+    ]
+
+    def test_pick_recipe_prefers_matching_words(self):
+        self.assertEqual(service_c.pick_recipe("something with salmon", self.SUMMARIES)["id"], 2)
+        self.assertEqual(service_c.pick_recipe("dinner", self.SUMMARIES)["id"], 1)
+        self.assertIsNone(service_c.pick_recipe("dinner", []))
+
+    def test_search_requests_compact_summaries(self):
+        payload = service_c.build_search_payload(800, [], '"tofu"')
+        self.assertEqual(payload["fields"], service_c.SUMMARY_FIELDS)
+        self.assertEqual(payload["max_chars"], service_c.SUMMARY_MAX_CHARS)
+
+    def test_only_the_picked_recipe_is_inlined_in_full(self):
+        full = {"id": 2, "name": "Salmon Bowl", "calories": 450,
+                "ingredients": "['1 salmon fillet', 'rice', 'cucumber']", "instructions": "Assemble the bowl."}
+        prompt = service_c.build_prompt("salmon", 800, [], self.SUMMARIES, full)
+
+        self.assertIn("Instr: Assemble the bowl.", prompt)
+        self.assertEqual(prompt.count("Salmon Bowl"), 1)
+        self.assertIn("- Tofu Stir Fry (300 cal) | Ing: tofu, soy sauce…\n", prompt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import os
+import sys
+
+SERVICE_C_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm'))
+sys.path.append(SERVICE_C_DIR)
+
+from keyword_expander import KeywordExpander
+
+
+class TestKeywordExpander(unittest.TestCase):
+
+    def setUp(self):
+        self.expander = KeywordExpander(os.path.join(SERVICE_C_DIR, 'concepts.json'))
+
+    def test_known_concepts_expand_locally(self):
+        self.assertEqual(self.expander.expand("High Protein"), "chicken beef pork fish tofu beans eggs")
+        self.assertEqual(self.expander.expand("Italian"), "pasta tomato basil cheese")
+
+    def test_filler_and_ingredients_are_resolved(self):
+        keywords = self.expander.expand("Give me a quick high-protein dinner with mushrooms!")
+        self.assertEqual(keywords, "chicken beef pork fish tofu beans eggs mushroom")
+
+    def test_unknown_words_defer_to_llm(self):
+        self.assertIsNone(self.expander.expand("something my grandmother would make on a rainy day"))
+        self.assertIsNone(self.expander.expand("something for dinner"))
+
+    def test_fast_path_rate_is_tracked(self):
+        self.expander.expand("vegan")
+        self.expander.expand("a cozy autumn dish")
+        stats = self.expander.stats()
+        self.assertEqual((stats["fast_path_hits"], stats["fast_path_misses"]), (1, 1))
+        self.assertEqual(stats["fast_path_rate"], 0.5)
+
+    def test_missing_file_disables_fast_path(self):
+        self.assertIsNone(KeywordExpander("/nonexistent/concepts.json").expand("italian"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm')))
+
+from recipe_fixture import FixtureDBTestCase
+from llm_backends import (BackendUnavailable, Cassette, CassetteMiss, MockModel, RecordingModel, ScriptedModel,
+                          TextChunk, load_models)
+from llm_scheduler import LLMScheduler
+from ttl_cache import TTLCache
+from service_b_data import app as service_b
+from service_c_llm import app as service_c
+
+PROMPT = service_c.build_prompt("tofu", 800, [], [
+    {"id": 4, "name": "Tofu Stir Fry", "calories": 300, "ingredients": "['200g tofu', 'broccoli']",
+     "instructions": "Stir fry everything."}])
+
+
+class FakeGemini:
+    """Streams fixed chunks, the way a genai model does."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return TextChunk("tofu broccoli")
+
+    def start_chat(self, history=None):
+        return self
+
+    def send_message(self, prompt, stream=False):
+        self.calls += 1
+        return iter([TextChunk("## Tofu"), TextChunk(" Stir Fry")])
+
+    async def send_message_async(self, prompt, stream=False):
+        self.calls += 1
+
+        async def chunks():
+            for text in ("## Tofu", " Stir Fry"):
+                yield TextChunk(text)
+        return chunks()
+
+
+class TestMockModel(unittest.TestCase):
+
+    def test_same_prompt_streams_the_same_answer(self):
+        model = MockModel("flash", tokens_per_second=0, first_token_latency=0)
+        first = [c.text for c in model.start_chat().send_message(PROMPT, stream=True)]
+        second = [c.text for c in model.start_chat().send_message(PROMPT, stream=True)]
+        self.assertEqual(first, second)
+        self.assertGreater(len(first), 5)
+        self.assertTrue("".join(first).startswith("## Tofu Stir Fry (300 cal)"))
+        self.assertIn("* 200g tofu\n", "".join(first))
+
+    def test_keywords_come_from_the_request(self):
+        model = MockModel("flash", tokens_per_second=0, first_token_latency=0)
+        self.assertEqual(model.generate_content(service_c.build_keyword_prompt("Spicy tofu noodles")).text,
+                         "spicy tofu noodles")
+
+    def test_async_stream_matches_sync(self):
+        model = MockModel("flash", tokens_per_second=1000, first_token_latency=0)
+
+        async def collect():
+            chunks = await model.start_chat().send_message_async(PROMPT, stream=True)
+            return [c.text async for c in chunks]
+
+        sync = [c.text for c in model.start_chat().send_message(PROMPT, stream=True)]
+        self.assertEqual(asyncio.run(collect()), sync)
+
+    def test_non_streamed_chat_is_the_whole_stream(self):
+        model = MockModel("flash", tokens_per_second=0, first_token_latency=0)
+        streamed = "".join(c.text for c in model.start_chat().send_message(PROMPT, stream=True))
+        self.assertEqual(model.start_chat().send_message(PROMPT).text, streamed)
+        self.assertEqual(asyncio.run(model.start_chat().send_message_async(PROMPT)).text, streamed)
+
+    def test_scripted_model_needs_pieces(self):
+        with self.assertRaises(TypeError):
+            ScriptedModel("flash")
+
+
+class TestRecordReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.cassette_file = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl')
+
+    def record(self):
+        inner = FakeGemini()
+        model = RecordingModel(inner, "gemini-2.5-flash", Cassette(self.cassette_file))
+        history = [{"role": "user", "parts": [{"text": "hi"}]}]
+        streamed = [c.text for c in model.start_chat(history=history).send_message("make tofu", stream=True)]
+        keywords = model.generate_content("keywords please").text
+        return inner, history, streamed, keywords
+
+    def test_replays_what_was_recorded_without_the_api(self):
+        inner, history, streamed, keywords = self.record()
+        self.assertEqual(inner.calls, 2)
+
+        fast, _ = load_models("replay", cassette_file=self.cassette_file, replay_speed=0)
+        self.assertEqual([c.text for c in fast.start_chat(history=history).send_message("make tofu", stream=True)],
+                         streamed)
+        self.assertEqual(fast.generate_content("keywords please").text, keywords)
+
+    def test_unrecorded_request_is_a_miss(self):
+        _, history, _, _ = self.record()
+        fast, _ = load_models("replay", cassette_file=self.cassette_file, replay_speed=0)
+        with self.assertRaises(CassetteMiss):
+            fast.start_chat(history=[]).send_message("make tofu", stream=True)
+
+    def test_only_completed_streams_are_recorded(self):
+        model = RecordingModel(FakeGemini(), "gemini-2.5-flash", Cassette(self.cassette_file))
+        next(iter(model.start_chat().send_message("abandoned", stream=True)))
+        self.assertEqual(len(Cassette(self.cassette_file)), 0)
+
+    def test_async_streams_are_recorded(self):
+        model = RecordingModel(FakeGemini(), "gemini-2.5-flash", Cassette(self.cassette_file))
+
+        async def consume():
+            chunks = await model.start_chat().send_message_async("make tofu", stream=True)
+            return [c.text async for c in chunks]
+
+        self.assertEqual(asyncio.run(consume()), ["## Tofu", " Stir Fry"])
+        self.assertEqual(len(Cassette(self.cassette_file)), 1)
+
+
+class TestLoadModels(unittest.TestCase):
+
+    def test_gemini_needs_an_api_key(self):
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": ""}):
+            with self.assertRaises(BackendUnavailable):
+                load_models("gemini")
+
+    def test_replay_needs_a_cassette(self):
+        with self.assertRaises(BackendUnavailable):
+            load_models("replay", cassette_file=os.path.join(tempfile.mkdtemp(), 'missing.jsonl'))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(BackendUnavailable):
+            load_models("gpt")
+
+
+class ServiceBSession:
+    """Routes Service C's Service B calls to Service B's test client."""
+
+    class Response:
+        def __init__(self, response):
+            self.ok = response.status_code < 400
+            self._data = response.get_json()
+
+        def json(self):
+            return self._data
+
+    def __init__(self):
+        self.client = service_b.app.test_client()
+
+    def post(self, url, json=None, timeout=None):
+        return self.Response(self.client.post('/filter_recipes', json=json))
+
+    def get(self, url, timeout=None):
+        return self.Response(self.client.get('/recipes/' + url.rsplit('/', 1)[1]))
+
+
+class TestOfflineGenerate(FixtureDBTestCase):
+    """The whole /generate pipeline against a real Service B, with no API key."""
+
+    def setUp(self):
+        fast, smart = load_models("mock", tokens_per_second=0, first_token_latency=0)
+        patches = [
+            mock.patch.object(service_c, 'fast_model', fast),
+            mock.patch.object(service_c, 'smart_model', smart),
+            mock.patch.object(service_c, 'models_ready', True),
+            mock.patch.object(service_c, 'service_b_session', ServiceBSession()),
+            mock.patch.object(service_c, 'llm_scheduler', LLMScheduler(rate_per_minute=0)),
+            mock.patch.object(service_c, 'keyword_cache', TTLCache("keywords")),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.app = service_c.app.test_client()
+
+    def generate(self, message, allergens):
+        response = self.app.post('/generate', json={"message": message, "history": [],
+                                                    "profile": {"allergens": allergens, "calorie_limit": 2000}})
+        return "".join(json.loads(line)["text"] for line in response.get_data(as_text=True).splitlines())
+
+    def test_allergen_request_is_answered_with_a_safe_recipe(self):
+        answer = self.generate("peanut butter cookies", ["peanuts"])
+        self.assertTrue(answer.startswith("## "), answer)
+        self.assertNotIn("peanut", answer.lower())
+
+    def test_matching_request_gets_the_matching_recipe(self):
+        self.assertTrue(self.generate("garlic shrimp", []).startswith("## Garlic Shrimp"))
+
+
+if __name__ == '__main__':
+    unittest.main()
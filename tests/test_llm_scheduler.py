@@ -0,0 +1,153 @@
+import unittest
+import asyncio
+import os
+import sys
+import threading
+import time
+
+SERVICE_C_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm'))
+sys.path.append(SERVICE_C_DIR)
+
+from llm_scheduler import LLMScheduler, QueueTimeout, STREAM, KEYWORDS
+
+
+class TestLLMScheduler(unittest.TestCase):
+
+    def test_token_bucket_queues_bursts(self):
+        scheduler = LLMScheduler(rate_per_minute=600, burst=2)  # 10 per second
+        started = time.monotonic()
+        for _ in range(4):
+            scheduler.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+        with self.assertRaises(QueueTimeout):
+            scheduler.acquire(timeout=0)
+        self.assertEqual(scheduler.stats()["queue_timeouts"], 1)
+
+    def test_stream_priority_goes_first(self):
+        scheduler = LLMScheduler(rate_per_minute=600, burst=1)
+        scheduler.acquire()  # bucket now empty
+        order = []
+
+        def worker(priority, name, delay):
+            time.sleep(delay)
+            scheduler.acquire(priority)
+            order.append(name)
+
+        threads = [threading.Thread(target=worker, args=(KEYWORDS, "keywords", 0)),
+                   threading.Thread(target=worker, args=(STREAM, "stream", 0.02))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(order, ["stream", "keywords"])
+
+    def test_transient_errors_are_retried(self):
+        scheduler = LLMScheduler(rate_per_minute=0, max_retries=3, backoff_base=0.001)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Exception("429 Resource has been exhausted (e.g. check quota).")
+            return "ok"
+
+        self.assertEqual(scheduler.call(flaky), "ok")
+        self.assertEqual(scheduler.stats()["retries"], 2)
+
+        with self.assertRaises(ValueError):
+            scheduler.call(lambda: (_ for _ in ()).throw(ValueError("bad prompt")))
+        self.assertEqual(scheduler.stats()["retries"], 2)
+
+    def test_stream_retries_only_before_first_chunk(self):
+        scheduler = LLMScheduler(rate_per_minute=0, backoff_base=0.001)
+        calls = []
+
+        def send():
+            calls.append(1)
+            if len(calls) == 1:
+                raise Exception("503 Service Unavailable")
+            return iter(["a", "b"])
+
+        self.assertEqual(list(scheduler.stream(send)), ["a", "b"])
+        self.assertEqual(len(calls), 2)
+
+        def breaks_midway():
+            yield "a"
+            raise Exception("503 Service Unavailable")
+
+        chunks = scheduler.stream(breaks_midway)
+        self.assertEqual(next(chunks), "a")
+        with self.assertRaises(Exception):
+            next(chunks)
+
+    def test_identical_requests_are_coalesced(self):
+        scheduler = LLMScheduler(rate_per_minute=0)
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            return "pasta tomato"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(scheduler.coalesce("italian", slow)))
+                   for _ in range(3)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ["pasta tomato"] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(scheduler.stats()["coalesced"], 2)
+
+    def test_async_coalescing_and_stream(self):
+        scheduler = LLMScheduler(rate_per_minute=0)
+        calls = []
+
+        async def ask():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "tofu"
+
+        async def stream():
+            async def chunks():
+                yield "x"
+                yield "y"
+            return chunks()
+
+        async def run():
+            results = await asyncio.gather(*(scheduler.coalesce_async("k", ask) for _ in range(3)))
+            streamed = [c async for c in scheduler.stream_async(stream)]
+            return results, streamed
+
+        results, streamed = asyncio.run(run())
+        self.assertEqual(results, ["tofu"] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(streamed, ["x", "y"])
+
+
+class TestQuotaFallback(unittest.TestCase):
+
+    def test_fallback_is_the_safe_database_recipe(self):
+        sys.path.append(os.path.dirname(SERVICE_C_DIR))
+        from service_c_llm import app as service_c
+
+        recipe = {"id": 4, "name": "Tofu Stir Fry", "calories": 300,
+                  "ingredients": "['200g tofu', 'broccoli']", "instructions": "Stir fry everything."}
+        chunks = service_c.llm_error_chunks(Exception("429 quota exceeded"), recipe)
+        text = "".join(chunks)
+        self.assertIn("## Tofu Stir Fry (300 cal)", text)
+        self.assertIn("* 200g tofu", text)
+        self.assertNotIn("Omelette", text)
+
+        no_recipe = "".join(service_c.llm_error_chunks(QueueTimeout("busy")))
+        self.assertIn("no safe recipe", no_recipe)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import unittest
+import json
+import os
+import smtplib
+import socket
+import sys
+import tempfile
+import time
+from unittest import mock
+
+SERVICE_A_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_a_auth'))
+sys.path.append(os.path.dirname(SERVICE_A_DIR))
+sys.path.append(SERVICE_A_DIR)
+
+import setup_secure_db
+from mail_outbox import MailSender, backlog, enqueue, smtp_connector
+from password_hasher import PasswordHasher
+from profile_cache import GenerationTable, ProfileCache
+from sqlite_pool import get_pool
+from service_a_auth import app as service_a
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+class FakeSMTP:
+    """Records what would have been sent; refuses recipients in `refuse`."""
+
+    def __init__(self, log, refuse=()):
+        self.log = log
+        self.refuse = refuse
+
+    def send_message(self, msg):
+        if msg['To'] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({msg['To']: (550, b"No such user")})
+        self.log.append(msg)
+
+    def quit(self):
+        pass
+
+
+class OutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db_file = os.path.join(tempfile.mkdtemp(), 'SecureUserProfile.db')
+        self._saved_db = setup_secure_db.DB_FILE
+        setup_secure_db.DB_FILE = self.db_file
+        setup_secure_db.create_secure_db()
+        self.con = get_pool(self.db_file).connection()
+
+    def tearDown(self):
+        setup_secure_db.DB_FILE = self._saved_db
+
+    def queue(self, *recipients):
+        for recipient in recipients:
+            enqueue(self.con, recipient, "Hello", "Body")
+        self.con.commit()
+
+
+class TestMailSender(OutboxTestCase):
+
+    def sender(self, refuse=(), **kwargs):
+        self.sent = []
+        self.connects = mock.Mock(side_effect=lambda: FakeSMTP(self.sent, refuse))
+        return MailSender(self.db_file, self.connects, "noreply@x.io", **kwargs)
+
+    def test_batches_share_one_connection(self):
+        self.queue(*[f"u{i}@x.io" for i in range(5)])
+        sender = self.sender(batch_size=2)
+        self.assertEqual(sender.drain(), 5)
+        self.assertEqual(self.connects.call_count, 1)
+        self.assertEqual([m['To'] for m in self.sent], [f"u{i}@x.io" for i in range(5)])
+        self.assertEqual(sender.stats()["batches"], 3)
+        self.assertEqual(backlog(self.con, sender.max_attempts), {"pending": 0, "dead": 0})
+        self.assertEqual(sender.drain(), 0)
+
+    def test_failed_message_backs_off_then_gives_up(self):
+        self.queue("ok@x.io", "gone@x.io")
+        sender = self.sender(refuse={"gone@x.io"}, max_attempts=2, backoff_base=0)
+        self.assertEqual(sender.drain(), 1)
+        attempts, error = self.con.execute(
+            "SELECT attempts, last_error FROM outbox WHERE recipient='gone@x.io'").fetchone()
+        self.assertEqual(attempts, 2)
+        self.assertIn("No such user", error)
+        self.assertEqual(backlog(self.con, 2), {"pending": 0, "dead": 1})
+        self.assertEqual(sender.stats()["dead"], 1)
+
+    def test_unreachable_server_keeps_mail_without_using_attempts(self):
+        self.queue("a@x.io")
+        sender = MailSender(self.db_file, mock.Mock(side_effect=ConnectionRefusedError()), "noreply@x.io")
+        self.assertEqual(sender.drain(), 0)
+        self.assertEqual(self.con.execute("SELECT attempts, claim FROM outbox").fetchone(), (0, None))
+        self.assertEqual(sender.stats()["connect_errors"], 1)
+        self.assertEqual(self.sender().drain(), 1)
+
+    def test_started_sender_delivers_what_is_already_queued(self):
+        self.queue("a@x.io", "b@x.io")
+        sender = self.sender(poll_interval=0.05)
+        sender.start()
+        self.addCleanup(sender.stop)
+        self.assertTrue(wait_for(lambda: len(self.sent) == 2))
+        sender.stop(timeout=5)
+        self.assertIsNone(sender._thread)
+
+    def test_queued_mail_survives_rerunning_the_setup(self):
+        # The container runs setup_secure_db.py before every start
+        self.queue("a@x.io")
+        setup_secure_db.create_secure_db()
+        self.assertEqual(backlog(self.con, 6), {"pending": 1, "dead": 0})
+        self.assertEqual(self.sender().drain(), 1)
+
+    def test_claimed_rows_are_not_sent_twice(self):
+        self.queue("a@x.io", "b@x.io")
+        first, second = self.sender(batch_size=1), self.sender()
+        self.assertEqual(len(first._claim()), 1)
+        self.assertEqual(second.drain(), 1)
+
+
+class TestForgotPassword(OutboxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._saved = (service_a.DB_FILE, service_a.hasher, service_a.mail_sender, service_a.MAIL_SENDER_AUTOSTART)
+        service_a.DB_FILE = self.db_file
+        service_a.MAIL_SENDER_AUTOSTART = False
+        service_a.hasher = PasswordHasher(rounds=4, workers=1)
+        generations = GenerationTable(self.db_file + '.generations')
+        self.addCleanup(generations.close)
+        patcher = mock.patch.object(service_a, 'profile_cache', ProfileCache(generations))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = service_a.app.test_client()
+        self.post('/register', {"username": "ana", "email": "ana@x.io", "password": "pw"})
+
+    def tearDown(self):
+        service_a.DB_FILE, service_a.hasher, service_a.mail_sender, service_a.MAIL_SENDER_AUTOSTART = self._saved
+        super().tearDown()
+
+    def post(self, url, payload):
+        return self.app.post(url, data=json.dumps(payload), content_type='application/json')
+
+    def reset_token(self):
+        return self.con.execute("SELECT reset_token FROM users WHERE email='ana@x.io'").fetchone()[0]
+
+    def test_returns_once_the_code_is_queued(self):
+        service_a.mail_sender = mock.Mock(max_attempts=6)
+        response = self.post('/forgot-password', {"email": "ana@x.io"})
+        self.assertEqual(response.status_code, 202)
+        service_a.mail_sender.wake.assert_called_once()
+        recipient, body = self.con.execute("SELECT recipient, body FROM outbox").fetchone()
+        self.assertEqual(recipient, "ana@x.io")
+        self.assertIn(self.reset_token(), body)
+
+    def test_first_request_starts_the_sender_for_earlier_mail(self):
+        # Queued by a previous run; nobody asks for a reset after the restart
+        self.queue("ben@x.io")
+        sent = []
+        service_a.mail_sender = MailSender(self.db_file, lambda: FakeSMTP(sent), "noreply@x.io",
+                                           poll_interval=0.05)
+        self.addCleanup(service_a.mail_sender.stop)
+        service_a.MAIL_SENDER_AUTOSTART = True
+
+        self.app.get('/profile/ana')
+        self.assertTrue(wait_for(lambda: len(sent) == 1))
+        self.assertEqual(sent[0]['To'], "ben@x.io")
+
+    def test_login_still_works_after_the_sender_drained_first(self):
+        # The sender's plain-tuple connections must not become the app's
+        self.queue("ben@x.io")
+        MailSender(self.db_file, lambda: FakeSMTP([]), "noreply@x.io").drain()
+        self.assertEqual(self.post('/login', {"username": "ana", "password": "pw"}).status_code, 200)
+
+    def test_unknown_email_queues_nothing(self):
+        service_a.mail_sender = mock.Mock(max_attempts=6)
+        self.assertEqual(self.post('/forgot-password', {"email": "who@x.io"}).status_code, 404)
+        self.assertEqual(self.con.execute("SELECT COUNT(*) FROM outbox").fetchone()[0], 0)
+
+    @unittest.skipIf(Controller is None, "aiosmtpd not installed")
+    def test_delivers_through_local_smtp_server(self):
+        class Inbox:
+            messages = []
+
+            async def handle_DATA(self, server, session, envelope):
+                self.messages.append(envelope)
+                return '250 OK'
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        controller = Controller(Inbox(), hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        service_a.mail_sender = MailSender(self.db_file, smtp_connector('127.0.0.1', port), "noreply@x.io",
+                                           poll_interval=0.1)
+        self.addCleanup(service_a.mail_sender.stop)
+
+        self.assertEqual(self.post('/forgot-password', {"email": "ana@x.io"}).status_code, 202)
+
+        self.assertTrue(wait_for(lambda: Inbox.messages))
+        self.assertEqual(len(Inbox.messages), 1)
+        self.assertEqual(Inbox.messages[0].rcpt_tos, ["ana@x.io"])
+        self.assertIn(self.reset_token(), Inbox.messages[0].content.decode())
+        self.assertEqual(service_a.mail_sender.stats()["sent"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
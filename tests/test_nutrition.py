@@ -0,0 +1,64 @@
+import unittest
+import os
+
+from recipe_fixture import FixtureDBTestCase, ROOT_DIR
+
+import nutrition
+
+NUTRIENTS_FILE = os.path.join(ROOT_DIR, 'service_b_data', 'nutrients.csv')
+
+
+class TestIngredientParsing(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.table = nutrition.NutrientTable(NUTRIENTS_FILE)
+
+    def grams(self, line):
+        entry, grams = nutrition.ingredient_grams(line, self.table)
+        return (entry['name'] if entry else None), round(grams, 1)
+
+    def test_quantities_and_units(self):
+        self.assertEqual(self.grams("1 1/2 cups all-purpose flour"), ("flour", 187.5))
+        self.assertEqual(self.grams("½ cup sugar"), ("sugar", 100.0))
+        self.assertEqual(self.grams("2 to 3 lb. pork shoulder"), ("pork", 907.2))
+        self.assertEqual(self.grams("3 large eggs"), ("egg", 150.0))
+
+    def test_parenthetical_weight_per_piece(self):
+        self.assertEqual(self.grams("2 (15-oz.) cans chickpeas, rinsed"), ("chickpeas", 850.5))
+
+    def test_longest_alias_wins(self):
+        self.assertEqual(self.grams("1 cup peanut butter")[0], "peanut butter")
+        self.assertEqual(self.grams("1/2 cup coconut milk")[0], "coconut milk")
+
+    def test_unmeasurable_lines_are_skipped(self):
+        self.assertEqual(self.grams("Kosher salt"), (None, 0))
+        self.assertIsNone(nutrition.estimate_nutrition("['salt', 'pepper']", self.table))
+
+    def test_partly_measured_recipe_is_not_trusted(self):
+        # Counting the chicken alone would undercount a very rich recipe
+        self.assertIsNone(nutrition.estimate_nutrition("['4 chicken breasts', '2 cups macadamia nuts']", self.table))
+        self.assertEqual(nutrition.estimate_nutrition("['4 chicken breasts', '2 cups macadamia nuts']", self.table,
+                                                      min_matched=0)[0], 286)
+
+    def test_seasoning_lines_do_not_count_against_coverage(self):
+        text = "['4 chicken breasts', 'Kosher salt and freshly ground black pepper', '1 cup water']"
+        self.assertEqual(nutrition.estimate_nutrition(text, self.table)[0], 286)
+
+    def test_estimate_is_per_serving(self):
+        kcal, protein, fat, carbs = nutrition.estimate_nutrition("['4 chicken breasts']", self.table, servings=4)
+        self.assertEqual((kcal, protein), (286, 36.0))
+
+
+class TestMacroFilters(FixtureDBTestCase):
+
+    def test_min_protein_filter(self):
+        recipes = self.search(max_calories=2000, allergens=[], query="", min_protein=15)['safe_recipes']
+
+        self.assertIn("Grilled Chicken", [r['name'] for r in recipes])
+        for recipe in recipes:
+            self.assertGreaterEqual(recipe['protein_g'], 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+SERVICE_A_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_a_auth'))
+sys.path.append(os.path.dirname(SERVICE_A_DIR))
+sys.path.append(SERVICE_A_DIR)
+
+import bcrypt
+
+import setup_secure_db
+from password_hasher import PasswordHasher, HasherBusy, hash_rounds
+from profile_cache import GenerationTable, ProfileCache
+from service_a_auth import app as service_a
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def test_hash_and_verify_in_pool(self):
+        hasher = PasswordHasher(rounds=4, workers=1)
+        hashed = hasher.hash("s3cret")
+        self.assertEqual(hash_rounds(hashed), 4)
+        self.assertTrue(hasher.verify("s3cret", hashed))
+        self.assertFalse(hasher.verify("wrong", hashed))
+        self.assertEqual(hasher.stats()["pending"], 0)
+
+    def test_full_queue_is_shed(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=0)
+        with self.assertRaises(HasherBusy):
+            hasher.hash("s3cret")
+        self.assertEqual(hasher.stats()["rejected"], 1)
+
+    def test_rehash_only_when_cost_changes(self):
+        hasher = PasswordHasher(rounds=5, workers=1)
+        old = bcrypt.hashpw(b"s3cret", bcrypt.gensalt(4))
+        new = hasher.rehash_if_needed("s3cret", old)
+        self.assertEqual(hash_rounds(new), 5)
+        self.assertIsNone(hasher.rehash_if_needed("s3cret", new))
+
+    def test_broken_pool_on_submit_is_replaced(self):
+        hasher = PasswordHasher(rounds=4, workers=1)
+        hasher._executor, hasher._pid = mock.Mock(submit=mock.Mock(side_effect=BrokenProcessPool())), os.getpid()
+        self.assertTrue(hasher.verify("s3cret", hasher.hash("s3cret")))
+        self.assertEqual(hasher.stats()["pool_restarts"], 1)
+        self.assertEqual(hasher.stats()["pending"], 0)
+
+    def test_pool_that_stays_broken_releases_its_slot(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=1)
+        broken = mock.Mock(submit=mock.Mock(side_effect=BrokenProcessPool()))
+        with mock.patch.object(hasher, '_pool', return_value=broken):
+            for _ in range(3):
+                with self.assertRaises(HasherBusy):
+                    hasher.hash("s3cret")
+        self.assertEqual(hasher.stats()["pending"], 0)
+        self.assertEqual(hasher.stats()["rejected"], 0)
+        self.assertEqual(hash_rounds(hasher.hash("s3cret")), 4)
+
+    def test_worker_dying_mid_job_gets_a_new_pool(self):
+        hasher = PasswordHasher(rounds=4, workers=1)
+        with self.assertRaises(HasherBusy):
+            hasher._run(os._exit, 1)
+        self.assertEqual(hasher.stats()["pool_restarts"], 1)
+        self.assertEqual(hash_rounds(hasher.hash("s3cret")), 4)
+        self.assertEqual(hasher.stats()["pending"], 0)
+
+
+class TestAuthEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.db_file = os.path.join(tempfile.mkdtemp(), 'SecureUserProfile.db')
+        self._saved = (setup_secure_db.DB_FILE, service_a.DB_FILE, service_a.hasher, service_a.MAIL_SENDER_AUTOSTART)
+        setup_secure_db.DB_FILE = service_a.DB_FILE = self.db_file
+        service_a.MAIL_SENDER_AUTOSTART = False
+        setup_secure_db.create_secure_db()
+        service_a.hasher = PasswordHasher(rounds=4, workers=1)
+        generations = GenerationTable(self.db_file + '.generations')
+        self.addCleanup(generations.close)
+        patcher = mock.patch.object(service_a, 'profile_cache', ProfileCache(generations))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = service_a.app.test_client()
+
+    def tearDown(self):
+        setup_secure_db.DB_FILE, service_a.DB_FILE, service_a.hasher, service_a.MAIL_SENDER_AUTOSTART = self._saved
+
+    def post(self, url, payload):
+        return self.app.post(url, data=json.dumps(payload), content_type='application/json')
+
+    def stored_hash(self, username):
+        return service_a.get_db().execute("SELECT password_hash FROM users WHERE username=?",
+                                          (username,)).fetchone()[0]
+
+    def test_login_upgrades_cost_transparently(self):
+        self.assertEqual(self.post('/register', {"username": "ana", "email": "a@x.io", "password": "pw"}).status_code, 201)
+        self.assertEqual(hash_rounds(self.stored_hash("ana")), 4)
+
+        service_a.hasher = PasswordHasher(rounds=5, workers=1)
+        self.assertEqual(self.post('/login', {"username": "ana", "password": "pw"}).status_code, 200)
+        self.assertEqual(hash_rounds(self.stored_hash("ana")), 5)
+        self.assertEqual(self.post('/login', {"username": "ana", "password": "pw"}).status_code, 200)
+        self.assertEqual(self.post('/login', {"username": "ana", "password": "nope"}).status_code, 401)
+
+    def test_busy_pool_returns_503_but_profile_still_answers(self):
+        self.post('/register', {"username": "ben", "email": "b@x.io", "password": "pw"})
+        service_a.hasher = PasswordHasher(rounds=4, workers=1, max_pending=0)
+
+        response = self.post('/login', {"username": "ben", "password": "pw"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.app.get('/profile/ben').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+SERVICE_A_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_a_auth'))
+sys.path.append(os.path.dirname(SERVICE_A_DIR))
+sys.path.append(SERVICE_A_DIR)
+
+import setup_secure_db
+from password_hasher import PasswordHasher
+from profile_cache import GenerationTable, ProfileCache
+from service_a_auth import app as service_a
+
+
+class TestGenerationTable(unittest.TestCase):
+
+    def test_bumps_are_seen_through_another_mapping(self):
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.generations')
+        writer, reader = GenerationTable(path, buckets=64), GenerationTable(path, buckets=64)
+        self.addCleanup(writer.close)
+        self.addCleanup(reader.close)
+        before = reader.get("ana")
+        writer.bump("ana")
+        self.assertEqual(reader.get("ana"), before + 1)
+
+    def test_file_is_opened_on_first_use_and_closed(self):
+        path = os.path.join(tempfile.mkdtemp(), 'profiles.generations')
+        table = GenerationTable(path, buckets=64)
+        self.assertFalse(os.path.exists(path))
+        table.bump("ana")
+        table.close()
+        self.assertEqual(table.get("ana"), 1)
+        table.close()
+
+
+class TestProfileEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(tmp_dir, 'SecureUserProfile.db')
+        self.generations_file = os.path.join(tmp_dir, 'SecureUserProfile.db.generations')
+        self._saved = (setup_secure_db.DB_FILE, service_a.DB_FILE, service_a.hasher, service_a.profile_cache,
+                       service_a.MAIL_SENDER_AUTOSTART)
+        setup_secure_db.DB_FILE = service_a.DB_FILE = self.db_file
+        service_a.MAIL_SENDER_AUTOSTART = False
+        setup_secure_db.create_secure_db()
+        service_a.hasher = PasswordHasher(rounds=4, workers=1)
+        service_a.profile_cache = ProfileCache(GenerationTable(self.generations_file))
+        self.app = service_a.app.test_client()
+
+        for name in ("ana", "ben"):
+            self.post('/register', {"username": name, "email": f"{name}@x.io", "password": "pw"})
+
+    def tearDown(self):
+        service_a.profile_cache.generations.close()
+        (setup_secure_db.DB_FILE, service_a.DB_FILE, service_a.hasher, service_a.profile_cache,
+         service_a.MAIL_SENDER_AUTOSTART) = self._saved
+
+    def post(self, url, payload):
+        return self.app.post(url, data=json.dumps(payload), content_type='application/json')
+
+    def update(self, username, allergens):
+        return self.post(f'/profile/{username}', {"allergens": allergens, "calorie_limit": 1500,
+                                                  "cuisine_pref": "Any", "cooking_time": 30})
+
+    def test_repeat_reads_are_served_from_memory(self):
+        self.assertEqual(self.app.get('/profile/ana').get_json()["calorie_limit"], 2000)
+        with mock.patch.object(service_a, 'get_db', side_effect=AssertionError("hit the DB")):
+            self.assertEqual(self.app.get('/profile/ana').get_json()["calorie_limit"], 2000)
+        self.assertEqual(service_a.profile_cache.stats()["hits"], 1)
+
+    def test_write_through_and_cross_worker_invalidation(self):
+        self.app.get('/profile/ana')
+        self.update("ana", "peanuts")
+        self.assertEqual(self.app.get('/profile/ana').get_json()["allergens"], "peanuts")
+
+        # Another worker writes: our copy must not be served afterwards
+        other_worker = GenerationTable(self.generations_file)
+        self.addCleanup(other_worker.close)
+        service_a.get_db().execute("UPDATE preferences SET allergens='milk' WHERE username='ana'")
+        service_a.get_db().commit()
+        other_worker.bump("ana")
+        self.assertEqual(self.app.get('/profile/ana').get_json()["allergens"], "milk")
+
+    def test_etag_revalidation(self):
+        first = self.app.get('/profile/ana')
+        etag = first.headers['ETag']
+        self.assertEqual(self.app.get('/profile/ana', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.update("ana", "sesame")
+        changed = self.app.get('/profile/ana', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+
+    def test_bulk_lookup(self):
+        data = self.post('/profiles', {"usernames": ["ana", "ghost", "ben", "ana"]}).get_json()
+        self.assertEqual(set(data["profiles"]), {"ana", "ben"})
+        self.assertEqual(data["missing"], ["ghost"])
+        self.assertEqual(self.post('/profiles', {"usernames": "ana"}).status_code, 400)
+        self.assertEqual(self.post('/profiles', {"usernames": ["u"] * 501}).status_code, 413)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from recipe_fixture import FixtureDBTestCase
+
+from service_b_data import app as service_b
+
+
+class TestFieldProjection(FixtureDBTestCase):
+    SEARCH_DEFAULTS = {"max_calories": 2000, "allergens": [], "query": ""}
+
+    def test_fields_and_max_chars(self):
+        recipes = self.search(fields=["id", "name", "ingredients"], max_chars=12)['safe_recipes']
+        self.assertTrue(recipes)
+        for r in recipes:
+            self.assertEqual(set(r), {"id", "name", "ingredients"})
+            self.assertLessEqual(len(r['ingredients']), 13)
+        self.assertTrue(any(r['ingredients'].endswith("…") for r in recipes))
+
+    def test_id_only_mode_and_full_fetch(self):
+        recipes = self.search(query='"salmon"', fields=["id"])['safe_recipes']
+        self.assertEqual(len(recipes), 1)
+        self.assertEqual(list(recipes[0]), ["id"])
+
+        full = self.app.get(f"/recipes/{recipes[0]['id']}").get_json()
+        self.assertEqual(full['name'], "Salmon Bowl")
+        self.assertEqual(full['instructions'], "Assemble the bowl.")
+
+        compact = self.app.get(f"/recipes/{recipes[0]['id']}?fields=name,calories").get_json()
+        self.assertEqual(set(compact), {"name", "calories"})
+
+    def test_default_response_is_unchanged_plus_id(self):
+        recipe = self.search(query='"salmon"')['safe_recipes'][0]
+        self.assertEqual(set(recipe), set(service_b.RECIPE_FIELDS))
+
+    def test_invalid_projection_is_rejected(self):
+        self.assertEqual(self.search_response(fields=["secret"]).status_code, 400)
+        self.assertEqual(self.search_response(max_chars=0).status_code, 400)
+        self.assertEqual(self.app.get("/recipes/1?fields=secret").status_code, 400)
+        self.assertEqual(self.app.get("/recipes/999999").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
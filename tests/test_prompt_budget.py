@@ -0,0 +1,75 @@
+import unittest
+import os
+import sys
+
+SERVICE_C_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm'))
+sys.path.append(SERVICE_C_DIR)
+
+from prompt_budget import PromptBudget, estimate_tokens
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+class TestPromptBudget(unittest.TestCase):
+
+    def test_recent_turns_kept_and_old_turns_summarised(self):
+        budget = PromptBudget(total_tokens=1000, history_tokens=500, recent_turns=2, summary_tokens=10)
+        history = [turn("user", "old question " * 20), turn("model", "old answer " * 20),
+                   turn("user", "new question"), turn("model", "new answer")]
+
+        kept, used = budget.trim_history(history)
+        self.assertEqual([t["role"] for t in kept], ["user", "model", "user", "model"])
+        self.assertEqual(kept[-1]["parts"][0]["text"], "new answer")
+        self.assertTrue(kept[0]["parts"][0]["text"].endswith("…"))
+        self.assertLessEqual(estimate_tokens(kept[0]["parts"][0]["text"]), 10)
+        self.assertEqual(used, sum(estimate_tokens(t["parts"][0]["text"]) for t in kept))
+        self.assertEqual(budget.stats()["history_turns_summarised"], 2)
+
+    def test_long_history_is_cut_to_budget_starting_with_user(self):
+        budget = PromptBudget(total_tokens=1000, history_tokens=50, recent_turns=100)
+        history = [turn("user" if i % 2 == 0 else "model", "x" * 40) for i in range(40)]
+
+        kept, used = budget.trim_history(history)
+        self.assertLessEqual(used, 50)
+        self.assertEqual(kept[0]["role"], "user")
+        self.assertEqual(budget.stats()["history_turns_dropped"], 40 - len(kept))
+
+    def test_fit_lines_truncates_the_first_line_that_overflows(self):
+        budget = PromptBudget(summary_tokens=5)
+        lines = ["a" * 40 + "\n", "b" * 400 + "\n", "c" * 40 + "\n"]
+
+        fitted = budget.fit_lines(lines, 30)
+        self.assertEqual(fitted[0], lines[0])
+        self.assertTrue(fitted[1].endswith("…\n"))
+        self.assertEqual(len(fitted), 2)
+        self.assertLessEqual(sum(estimate_tokens(l) for l in fitted), 31)
+
+        # The best match always survives, even with no room at all
+        self.assertEqual(len(budget.fit_lines(lines, 0)), 1)
+
+
+class TestAssemblePrompt(unittest.TestCase):
+
+    def setUp(self):
+        sys.path.append(os.path.dirname(SERVICE_C_DIR))
+        from service_c_llm import app as service_c
+        self.service_c = service_c
+
+    def test_prompt_stays_within_budget(self):
+        recipes = [{"id": i, "name": f"Recipe {i}", "calories": 400, "ingredients": "word " * 200}
+                   for i in range(10)]
+        history = [turn("user" if i % 2 == 0 else "model", "chat " * 300) for i in range(30)]
+
+        prompt, kept = self.service_c.assemble_prompt("pasta", history, 800, [], recipes)
+        budget = self.service_c.prompt_budget
+        total = estimate_tokens(prompt) + sum(estimate_tokens(t["parts"][0]["text"]) for t in kept)
+        self.assertLessEqual(total, budget.total_tokens + 1)
+        self.assertLess(len(kept), len(history))
+        self.assertIn("Recipe 0", prompt)
+        self.assertIn("prompt_budget", self.service_c.collect_metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import random
+
+from recipe_fixture import FixtureDBTestCase, SAMPLE_RECIPES
+
+from service_b_data import app as service_b
+
+# Extra recipes that mention chicken only in passing, plus near-duplicate titles
+CHICKEN_RECIPES = SAMPLE_RECIPES + [
+    ("Chicken Soup", "['1 chicken', '2 carrots', 'celery']", "Simmer."),
+    ("Chicken Soup Deluxe", "['1 chicken', '2 carrots', 'noodles']", "Simmer longer."),
+    ("Vegetable Broth", "['carrots', 'celery', 'chicken stock cube']", "Boil."),
+    ("Fried Rice", "['rice', 'egg', 'leftover chicken']", "Fry."),
+]
+
+
+class TestRankedSearch(FixtureDBTestCase):
+    RECIPES = CHICKEN_RECIPES
+    SEARCH_DEFAULTS = {"max_calories": 2000, "allergens": [], "mode": "ranked", "fields": ["name"]}
+
+    def test_title_matches_rank_above_ingredient_mentions(self):
+        names = self.names(query='"chicken"')
+        self.assertEqual(len(names), 5)
+        self.assertEqual(set(names[:3]), {"Grilled Chicken", "Chicken Soup", "Chicken Soup Deluxe"})
+        self.assertEqual(set(names[3:]), {"Vegetable Broth", "Fried Rice"})
+
+    def test_zero_temperature_is_deterministic(self):
+        self.assertEqual(self.names(query='"chicken"'), self.names(query='"chicken"'))
+
+    def test_ranked_mode_keeps_allergen_filters(self):
+        names = self.names(query='"chicken"', allergens=["eggs", "celery"])
+        self.assertNotIn("Fried Rice", names)
+        self.assertNotIn("Chicken Soup", names)
+
+    def test_invalid_options_are_rejected(self):
+        self.assertEqual(self.search_response(query="x", diversity=2).status_code, 400)
+
+
+class TestRerank(unittest.TestCase):
+
+    CANDIDATES = [
+        (1, 1.0, {"chicken", "soup"}),
+        (2, 0.95, {"chicken", "soup", "deluxe"}),
+        (3, 0.6, {"grilled", "chicken"}),
+        (4, 0.5, {"fried", "rice"}),
+    ]
+
+    def test_diversity_pushes_near_duplicates_down(self):
+        rng = random.Random(0)
+        self.assertEqual(service_b.rerank(self.CANDIDATES, 2, rng), [1, 2])
+        self.assertEqual(service_b.rerank(self.CANDIDATES, 2, rng, diversity=0.5), [1, 4])
+
+    def test_temperature_varies_the_pick(self):
+        rng = random.Random(0)
+        firsts = {service_b.rerank(self.CANDIDATES, 1, rng, temperature=1.0)[0] for _ in range(50)}
+        self.assertGreater(len(firsts), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
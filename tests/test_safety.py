@@ -6,6 +6,7 @@ import os
 # --- 1. SETUP PATHS ---
 # Add the project root directory to Python's path so we can find Service B
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_b_data')))
 
 # Now we can import the app directly
 from service_b_data.app import app
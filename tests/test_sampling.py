@@ -0,0 +1,38 @@
+import unittest
+import random
+from collections import Counter
+
+from recipe_fixture import FixtureDBTestCase
+
+from service_b_data import app as service_b
+
+
+class TestRandomSampling(FixtureDBTestCase):
+    RECIPES = [(f"Veg Dish {i}", f"['{i} carrots', 'olive oil']", "Roast.") for i in range(40)]
+
+    def test_seed_makes_sample_reproducible(self):
+        first = self.names(max_calories=2000, allergens=[], query="", seed=42)
+        second = self.names(max_calories=2000, allergens=[], query="", seed=42)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), service_b.SAMPLE_SIZE)
+        self.assertEqual(len(set(first)), len(first))
+
+    def test_short_stream_returns_everything(self):
+        sample = service_b.reservoir_sample(range(3), 10, random.Random(1))
+        self.assertEqual(sorted(sample), [0, 1, 2])
+
+    def test_sample_is_roughly_uniform(self):
+        """Every item should be picked about k/n of the time."""
+        rng = random.Random(7)
+        counts = Counter()
+        for _ in range(2000):
+            counts.update(service_b.reservoir_sample(range(100), 10, rng))
+
+        # Expected 200 picks each; allow generous slack to keep this stable
+        self.assertEqual(len(counts), 100)
+        self.assertTrue(all(120 < c < 280 for c in counts.values()), counts.most_common(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from recipe_fixture import build_fixture_db, SAMPLE_RECIPES
+
+import allergen_index
+import setup_db
+from service_b_data import app as service_b
+
+
+def write_csv(recipes):
+    csv_file = os.path.join(tempfile.mkdtemp(), 'recipes.csv')
+    pd.DataFrame(recipes, columns=['Title', 'Ingredients', 'Instructions']).to_csv(csv_file, index=False)
+    return csv_file
+
+
+class TestDatabaseArtifact(unittest.TestCase):
+
+    def test_matching_source_is_reused(self):
+        csv_file = write_csv(SAMPLE_RECIPES)
+        db_file = os.path.join(tempfile.mkdtemp(), 'RecipeCorpus.db')
+
+        self.assertTrue(setup_db.ensure_database(db_file, csv_file))
+        built_at = os.stat(db_file).st_mtime_ns
+        self.assertTrue(setup_db.ensure_database(db_file, csv_file))
+        self.assertEqual(os.stat(db_file).st_mtime_ns, built_at)
+
+        meta = setup_db.read_meta(db_file)
+        self.assertEqual(meta['source_version'], setup_db.compute_source_version(csv_file))
+
+    def test_changed_source_triggers_rebuild(self):
+        db_file = os.path.join(tempfile.mkdtemp(), 'RecipeCorpus.db')
+        setup_db.ensure_database(db_file, write_csv(SAMPLE_RECIPES))
+        old_version = setup_db.read_meta(db_file)['source_version']
+
+        setup_db.ensure_database(db_file, write_csv(SAMPLE_RECIPES[:3]))
+        self.assertNotEqual(setup_db.read_meta(db_file)['source_version'], old_version)
+
+    def test_failed_build_keeps_previous_db(self):
+        db_file = os.path.join(tempfile.mkdtemp(), 'RecipeCorpus.db')
+        setup_db.ensure_database(db_file, write_csv(SAMPLE_RECIPES))
+        old_meta = setup_db.read_meta(db_file)
+
+        empty_csv = write_csv([])
+        self.assertFalse(setup_db.create_database(db_file, empty_csv))
+        self.assertEqual(setup_db.read_meta(db_file), old_meta)
+        self.assertFalse(os.path.exists(db_file + '.building'))
+
+    def test_append_is_searchable_by_running_service(self):
+        orig_db_file = service_b.DB_FILE
+        service_b.DB_FILE = db_file = build_fixture_db()
+        try:
+            client = service_b.app.test_client()
+            payload = {"max_calories": 2000, "allergens": [], "query": '"quinoa"'}
+
+            def search():
+                response = client.post('/filter_recipes', data=json.dumps(payload), content_type='application/json')
+                return [r['name'] for r in response.get_json()['safe_recipes']]
+
+            self.assertEqual(search(), [])
+            old_meta = setup_db.read_meta(db_file)
+
+            new_csv = write_csv([("Quinoa Salad", "['1 cup quinoa', 'cucumber']", "Toss.")])
+            self.assertTrue(setup_db.append_recipes(new_csv, db_file))
+
+            meta = setup_db.read_meta(db_file)
+            self.assertEqual(meta['source_version'], old_meta['source_version'])
+            self.assertNotEqual(meta['build_version'], old_meta['build_version'])
+            self.assertEqual(search(), ["Quinoa Salad"])
+        finally:
+            service_b.DB_FILE = orig_db_file
+
+
+
+class TestVectorisedChunk(unittest.TestCase):
+
+    def test_masks_and_tokens_match_the_per_row_functions(self):
+        texts = pd.Series([name + " " + ingredients for name, ingredients, _ in SAMPLE_RECIPES] + [
+            "Crème Brûlée ['2 cups heavy cream', '4 egg yolks']", "Pâte à choux with PEANUT-butter",
+            "nutmeg & coconut water", "Shrimp_Scampi 1/2 lb", "",
+        ])
+        matchers = allergen_index.build_matchers(service_b.ALLERGEN_SYNONYMS)
+        padded = setup_db.padded_tokens(texts)
+
+        self.assertEqual(setup_db.allergen_masks(padded, matchers).tolist(),
+                         [allergen_index.compute_mask(t, matchers) for t in texts])
+        self.assertEqual(padded.str.split().tolist(), [allergen_index.tokenize(t) for t in texts])
+
+
+if __name__ == '__main__':
+    unittest.main()
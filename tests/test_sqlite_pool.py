@@ -0,0 +1,56 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+
+from recipe_fixture import build_fixture_db
+
+import sqlite_pool
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_connection_is_reused_per_thread(self):
+        pool = sqlite_pool.ConnectionPool(os.path.join(tempfile.mkdtemp(), 'pool.db'))
+        self.assertIs(pool.connection(), pool.connection())
+
+        other = []
+        t = threading.Thread(target=lambda: other.append(pool.connection()))
+        t.start()
+        t.join()
+        self.assertIsNot(other[0], pool.connection())
+
+    def test_writable_pool_uses_wal(self):
+        pool = sqlite_pool.ConnectionPool(os.path.join(tempfile.mkdtemp(), 'pool.db'))
+        mode = pool.connection().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_reset_rolls_back_uncommitted_work(self):
+        pool = sqlite_pool.ConnectionPool(os.path.join(tempfile.mkdtemp(), 'pool.db'))
+        con = pool.connection()
+        con.execute("CREATE TABLE t (x INTEGER)")
+        con.execute("INSERT INTO t VALUES (1)")
+        pool.reset()
+        self.assertEqual(con.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+    def test_read_only_pool_rejects_writes(self):
+        pool = sqlite_pool.get_pool(build_fixture_db(), read_only=True)
+        con = pool.connection()
+        self.assertGreater(con.execute("SELECT COUNT(*) FROM recipes").fetchone()[0], 0)
+        with self.assertRaises(sqlite3.OperationalError):
+            con.execute("DELETE FROM recipes")
+
+
+    def test_row_factory_gets_its_own_pool(self):
+        db_file = os.path.join(tempfile.mkdtemp(), 'pool.db')
+        plain = sqlite_pool.get_pool(db_file)
+        rows = sqlite_pool.get_pool(db_file, row_factory=sqlite3.Row)
+        self.assertIsNot(plain, rows)
+        self.assertIs(rows, sqlite_pool.get_pool(db_file, row_factory=sqlite3.Row))
+        self.assertIsInstance(rows.connection().execute("SELECT 1 AS x").fetchone(), sqlite3.Row)
+        self.assertIsInstance(plain.connection().execute("SELECT 1 AS x").fetchone(), tuple)
+
+
+if __name__ == '__main__':
+    unittest.main()
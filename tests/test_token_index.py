@@ -0,0 +1,79 @@
+import unittest
+import sqlite3
+
+from recipe_fixture import build_fixture_db, SAMPLE_RECIPES
+
+import setup_db
+from service_b_data import app as service_b
+
+
+class TestTokenIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db_file = build_fixture_db()
+
+    def setUp(self):
+        self.con = sqlite3.connect(self.db_file)
+        self.cur = self.con.cursor()
+
+    def tearDown(self):
+        self.con.close()
+
+    def recipe_id(self, name):
+        return self.cur.execute("SELECT id FROM recipes WHERE name = ?", (name,)).fetchone()[0]
+
+    def test_postings_cover_title_and_ingredients(self):
+        rows = self.cur.execute("""
+        SELECT r.name FROM recipe_tokens rt
+        JOIN tokens t ON t.id = rt.token_id
+        JOIN recipes r ON r.id = rt.recipe_id
+        WHERE t.name = 'sesame'
+        """).fetchall()
+        self.assertEqual(rows, [("Sesame Noodles",)])
+
+        # One posting per distinct token: "olive oil" twice is still one 'oil'
+        count = self.cur.execute("""
+        SELECT COUNT(*) FROM recipe_tokens
+        WHERE recipe_id = ? AND token_id = (SELECT id FROM tokens WHERE name = 'oil')
+        """, (self.recipe_id("Garlic Shrimp"),)).fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_bare_numbers_are_not_indexed(self):
+        numbers = self.cur.execute("SELECT COUNT(*) FROM tokens WHERE name GLOB '[0-9]*' AND name NOT GLOB '*[^0-9]*'")
+        self.assertEqual(numbers.fetchone()[0], 0)
+        # ...and are ignored in terms, so a quantity can't stop an exclusion
+        self.assertEqual(service_b.excluded_recipe_ids(self.cur, ["2 sesame"]),
+                         service_b.excluded_recipe_ids(self.cur, ["sesame"]))
+
+    def test_excluded_ids_need_every_token_of_a_term(self):
+        excluded = service_b.excluded_recipe_ids(self.cur, ["sesame oil", "cucumber"])
+        self.assertEqual(excluded, {self.recipe_id("Sesame Noodles"), self.recipe_id("Salmon Bowl")})
+
+        self.assertEqual(service_b.excluded_recipe_ids(self.cur, ["sesame butter"]), set())
+        self.assertEqual(service_b.excluded_recipe_ids(self.cur, ["durian"]), set())
+
+    def test_candidates_skip_excluded_recipes(self):
+        ids, _ = service_b.load_candidates(self.cur, "", 10000, 0, ["thyme"])
+        self.assertEqual(len(ids), len(SAMPLE_RECIPES) - 1)
+        self.assertNotIn(self.recipe_id("Roast Vegetables"), ids)
+
+    def test_append_extends_vocabulary(self):
+        db_file = build_fixture_db(SAMPLE_RECIPES[:2])
+        csv_file = db_file.replace('RecipeCorpus.db', 'more.csv')
+        setup_db.pd.DataFrame([("Quinoa Salad", "['1 cup quinoa', 'olive oil']", "Toss.")],
+                              columns=['Title', 'Ingredients', 'Instructions']).to_csv(csv_file, index=False)
+        self.assertTrue(setup_db.append_recipes(csv_file, db_file))
+
+        con = sqlite3.connect(db_file)
+        try:
+            excluded = service_b.excluded_recipe_ids(con.cursor(), ["olive oil", "quinoa"])
+            names = {r[0] for r in con.execute(
+                f"SELECT name FROM recipes WHERE id IN ({','.join('?' * len(excluded))})", list(excluded))}
+            self.assertEqual(names, {"Grilled Chicken", "Quinoa Salad"})
+        finally:
+            con.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
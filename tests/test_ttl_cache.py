@@ -0,0 +1,52 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'service_c_llm')))
+
+from ttl_cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hits_misses_and_lru_eviction(self):
+        cache = TTLCache("test", max_size=2, ttl=60)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        self.assertEqual(cache.get("a"), "1")  # 'a' is now most recent
+        cache.set("c", "3")                    # evicts 'b'
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "3")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 1, 2))
+
+    def test_entries_expire(self):
+        cache = TTLCache("test", max_size=10, ttl=0.01)
+        cache.set("a", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_backing_is_shared_between_instances(self):
+        db_file = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        TTLCache("test", max_size=10, ttl=60, db_file=db_file).set("a", ["x", "y"])
+
+        # A fresh instance (e.g. another gunicorn worker) sees the entry
+        other = TTLCache("test", max_size=10, ttl=60, db_file=db_file)
+        self.assertEqual(other.get("a"), ["x", "y"])
+        self.assertIsNone(TTLCache("other", db_file=db_file).get("a"))
+
+    def test_sqlite_backing_is_bounded(self):
+        db_file = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        cache = TTLCache("test", max_size=3, ttl=60, db_file=db_file)
+        for i in range(10):
+            cache.set(str(i), i)
+
+        rows = cache._db().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        self.assertEqual(rows, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
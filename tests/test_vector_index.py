@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+
+from recipe_fixture import SAMPLE_RECIPES, FixtureDBTestCase
+
+import setup_db
+import vector_index
+
+
+class TestVectorIndex(FixtureDBTestCase):
+    # Duplicate the corpus so every feature passes MIN_DF
+    RECIPES = SAMPLE_RECIPES + [(f"{t} II", i, s) for t, i, s in SAMPLE_RECIPES]
+    VECTORS = True
+    SEARCH_DEFAULTS = {"max_calories": 2000, "allergens": [], "fields": ["name"]}
+
+    def test_matrix_is_written_for_this_build(self):
+        version = setup_db.read_meta(self.db_file)['build_version']
+        matrix_file, ids_file = vector_index.vector_paths(self.db_file, version)
+        matrix = np.load(matrix_file, mmap_mode='r')
+        self.assertEqual(matrix.shape, (2 * len(SAMPLE_RECIPES), vector_index.VECTOR_DIM))
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-5)
+        self.assertEqual(len(np.load(ids_file)), matrix.shape[0])
+
+    def test_semantic_search_ranks_by_similarity(self):
+        result = self.search(query="a bowl of salmon please", mode="semantic")
+        self.assertEqual(result["mode_used"], "semantic")
+        names = [r["name"] for r in result["safe_recipes"]]
+        self.assertEqual(set(names[:2]), {"Salmon Bowl", "Salmon Bowl II"})
+
+    def test_semantic_search_keeps_allergen_filters(self):
+        result = self.search(query="shrimp with garlic", mode="semantic", allergens=["shellfish"])
+        names = {r["name"] for r in result["safe_recipes"]}
+        self.assertNotIn("Garlic Shrimp", names)
+
+    def test_hybrid_puts_fts_matches_first(self):
+        result = self.search(query='"tofu"', mode="hybrid")
+        names = [r["name"] for r in result["safe_recipes"]]
+        self.assertEqual(set(names[:2]), {"Tofu Stir Fry", "Tofu Stir Fry II"})
+
+    def test_unknown_words_fall_back_to_profile_search(self):
+        result = self.search(query="zzzz qqqq", mode="semantic", fallback_queries=[""])
+        self.assertEqual(result["query_used"], "")
+        self.assertTrue(result["safe_recipes"])
+
+    def test_batch_scores_semantic_specs_together(self):
+        searches = [{"max_calories": 2000, "allergens": [], "query": q, "mode": "semantic", "fields": ["name"]}
+                    for q in ("salmon", "almond cake")]
+        response = self.post('/filter_recipes/batch', {"searches": searches})
+        first, second = response.get_json()["results"]
+        self.assertIn(first["safe_recipes"][0]["name"], {"Salmon Bowl", "Salmon Bowl II"})
+        self.assertIn(second["safe_recipes"][0]["name"], {"Almond Cake", "Almond Cake II"})
+
+    def test_invalid_mode_is_rejected(self):
+        self.assertEqual(self.search_response(query="x", mode="psychic").status_code, 400)
+
+
+class TestOutOfVocabularyQuery(FixtureDBTestCase):
+    # "durian" is in one recipe only, so MIN_DF keeps it out of the vectors
+    RECIPES = SAMPLE_RECIPES * 2 + [("Durian Shake", "['1 durian', 'ice']", "Blend.")]
+    VECTORS = True
+    SEARCH_DEFAULTS = {"max_calories": 2000, "allergens": [], "query": '"durian"', "fields": ["name"]}
+
+    def test_hybrid_keeps_fts_matches(self):
+        self.assertEqual(self.names(), ["Durian Shake"])
+        self.assertEqual(self.search(mode="hybrid")["mode_used"], "hybrid")
+        self.assertEqual(self.names(mode="hybrid"), ["Durian Shake"])
+        self.assertEqual(self.names(mode="semantic"), [])
+
+        batch = self.post('/filter_recipes/batch', {"searches": [{**self.SEARCH_DEFAULTS, "mode": "hybrid"}]})
+        self.assertEqual([r["name"] for r in batch.get_json()["results"][0]["safe_recipes"]], ["Durian Shake"])
+
+
+class TestLexicalFallback(FixtureDBTestCase):
+
+    def test_db_without_vectors_runs_lexically(self):
+        data = self.search(query='"salmon"', mode="semantic", allergens=[])
+        self.assertEqual(data["mode_used"], "lexical")
+        self.assertEqual([r["name"] for r in data["safe_recipes"]], ["Salmon Bowl"])
+
+
+if __name__ == '__main__':
+    unittest.main()